@@ -0,0 +1,112 @@
+"""
+Measure how many log records per second the JSON formatter of the runs logs
+can format, compared to the previous implementation.
+
+Usage:
+
+    python benchmarks/log_formatter.py [--records 200000]
+"""
+
+import argparse
+import json
+import logging
+from time import gmtime, perf_counter
+
+from plombery.logger.formatter import DEFAULT_LOG_ATTRIBUTES, JsonFormatter, orjson
+
+
+class LegacyJsonFormatter(logging.Formatter):
+    """The formatter before the fast path, kept as baseline"""
+
+    def __init__(self, pipeline: str, task: str):
+        self.pipeline = pipeline
+        self.task = task
+        self.fmt_dict = DEFAULT_LOG_ATTRIBUTES
+        self.default_time_format = "%Y-%m-%dT%H:%M:%S"
+        self.default_msec_format = "%s.%03dZ"
+        self.datefmt = None
+        self.converter = gmtime
+
+    def usesTime(self) -> bool:
+        return "asctime" in self.fmt_dict.values()
+
+    def formatMessage(self, record) -> dict:
+        msg = {
+            fmt_key: record.__dict__[fmt_val]
+            for fmt_key, fmt_val in self.fmt_dict.items()
+        }
+        msg["pipeline"] = self.pipeline
+        msg["task"] = self.task
+        return msg
+
+    def format(self, record) -> str:
+        record.message = record.getMessage()
+
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+
+        return json.dumps(self.formatMessage(record), default=str)
+
+
+def _make_records(count: int):
+    logger = logging.getLogger("plombery.1-task")
+    records = []
+
+    for i in range(count):
+        record = logger.makeRecord(
+            logger.name,
+            logging.INFO,
+            __file__,
+            0,
+            "Processed batch %d of %s",
+            (i, "sales"),
+            None,
+        )
+        record.pipeline = "pipeline"
+        record.task = "task"
+        records.append(record)
+
+    return records
+
+
+def _benchmark(formatter: logging.Formatter, count: int, handlers: int) -> float:
+    # Fresh records, so nothing is cached by a previous round
+    records = _make_records(count)
+
+    start = perf_counter()
+    for record in records:
+        # Each record is formatted by the logs file and the websocket handlers
+        for _ in range(handlers):
+            formatter.format(record)
+
+    return count / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument(
+        "--handlers",
+        type=int,
+        default=2,
+        help="Handlers formatting each record, by default the file and the websocket",
+    )
+    args = parser.parse_args()
+
+    formatters = {
+        "legacy": LegacyJsonFormatter("pipeline", "task"),
+        "fast (json)": JsonFormatter(json_backend="json"),
+    }
+    if orjson:
+        formatters["fast (orjson)"] = JsonFormatter(json_backend="orjson")
+
+    baseline = None
+    for name, formatter in formatters.items():
+        rate = _benchmark(formatter, args.records, args.handlers)
+        baseline = baseline or rate
+
+        print(f"{name:<15} {rate:>12,.0f} records/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
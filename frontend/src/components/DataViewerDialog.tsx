@@ -1,11 +1,19 @@
-import React, { Suspense } from 'react'
+import React, { Suspense, useState } from 'react'
 import { Button, Text } from '@tremor/react'
-import { useQuery } from '@tanstack/react-query'
+import { keepPreviousData, useQuery } from '@tanstack/react-query'
 import { ArrowDownTrayIcon } from '@heroicons/react/24/outline'
 
-import { getApiUrl, getRunData, getRunDataUrl } from '@/repository'
+import {
+  getApiUrl,
+  getRunData,
+  getRunDataPreview,
+  getRunDataUrl,
+} from '@/repository'
+import { TaskOutputPreview } from '@/types'
 import Dialog from './Dialog'
 
+const PAGE_SIZE = 100
+
 interface Props {
   runId: number
   taskId: string
@@ -66,15 +74,64 @@ const DataViewer: React.FC<{ data: any }> = ({ data }) => {
   }
 }
 
+const TablePreview: React.FC<{
+  preview: TaskOutputPreview
+  onPageChange: (offset: number) => any
+}> = ({ preview, onPageChange }) => {
+  const lastRow = preview.offset + preview.rows.length
+
+  return (
+    <>
+      <DataViewer data={preview.rows} />
+
+      <div className="flex items-center justify-between mt-4">
+        <Text>
+          Rows {preview.offset + 1}-{lastRow} of {preview.num_rows}
+        </Text>
+
+        <div className="flex gap-2">
+          <Button
+            variant="secondary"
+            size="xs"
+            disabled={preview.offset === 0}
+            onClick={() => onPageChange(preview.offset - PAGE_SIZE)}
+          >
+            Previous
+          </Button>
+          <Button
+            variant="secondary"
+            size="xs"
+            disabled={lastRow >= preview.num_rows}
+            onClick={() => onPageChange(preview.offset + PAGE_SIZE)}
+          >
+            Next
+          </Button>
+        </div>
+      </div>
+    </>
+  )
+}
+
 const DataViewerDialog: React.FC<Props> = ({
   runId,
   taskId,
   open,
   onClose,
 }) => {
+  const [offset, setOffset] = useState(0)
+
+  // Tables are previewed a page at a time, without downloading them
+  const previewQuery = useQuery({
+    ...getRunDataPreview(runId, taskId, offset, PAGE_SIZE),
+    enabled: open,
+    placeholderData: keepPreviousData,
+    retry: false,
+  })
+
+  // The other outputs are downloaded entirely
   const query = useQuery({
     ...getRunData(runId, taskId),
-    enabled: open,
+    enabled: open && previewQuery.isError,
   })
 
   return (
@@ -106,18 +163,26 @@ const DataViewerDialog: React.FC<Props> = ({
         }
         onClose={onClose}
       >
-        {query.isPending && <div>Loading...</div>}
-
-        {query.isError &&
-          (query.error.response.status === 404 ? (
-            <Text>The task has no data</Text>
-          ) : (
-            <Text color="rose">
-              Error fetching task data: {query.error.message}
-            </Text>
-          ))}
-
-        {!query.isPending && !query.isError && <DataViewer data={query.data} />}
+        {previewQuery.data ? (
+          <TablePreview preview={previewQuery.data} onPageChange={setOffset} />
+        ) : (
+          <>
+            {query.isPending && <div>Loading...</div>}
+
+            {query.isError &&
+              (query.error.response.status === 404 ? (
+                <Text>The task has no data</Text>
+              ) : (
+                <Text color="rose">
+                  Error fetching task data: {query.error.message}
+                </Text>
+              ))}
+
+            {!query.isPending && !query.isError && (
+              <DataViewer data={query.data} />
+            )}
+          </>
+        )}
       </Dialog>
     </>
   )
@@ -1,6 +1,11 @@
-import { useQuery, useQueryClient } from '@tanstack/react-query'
+import {
+  InfiniteData,
+  useInfiniteQuery,
+  useQueryClient,
+} from '@tanstack/react-query'
 import {
   Badge,
+  Button,
   Color,
   Flex,
   Grid,
@@ -19,9 +24,9 @@ import { BarsArrowDownIcon } from '@heroicons/react/24/outline'
 import { createRef, useCallback, useEffect, useState } from 'react'
 import { twMerge } from 'tailwind-merge'
 
-import { getLogs } from '@/repository'
-import { socket } from '@/socket'
-import { LogEntry, LogLevel, Pipeline, PipelineRun } from '@/types'
+import { LogsPage, getLogs, parseLogs } from '@/repository'
+import { socket, subscribe, unsubscribe } from '@/socket'
+import { LogLevel, Pipeline, PipelineRun } from '@/types'
 import { formatNumber, formatTime, getTasksColors } from '@/utils'
 import TracebackInfoDialog from './TracebackInfoDialog'
 
@@ -56,16 +61,30 @@ const LogViewer: React.FC<Props> = ({ pipeline, run }) => {
 
   const tableRef = createRef<HTMLTableElement>()
 
-  const query = useQuery(getLogs(run.id))
+  const query = useInfiniteQuery(getLogs(run.id))
 
   const onWsMessage = useCallback(
     (message: string) => {
-      queryClient.setQueryData<LogEntry[]>(['logs', run.id], (oldLogs = []) => {
-        const log: LogEntry = JSON.parse(message)
-        log.id = oldLogs.length
-        log.timestamp = new Date(log.timestamp)
-        return [...oldLogs, log]
-      })
+      queryClient.setQueryData<InfiniteData<LogsPage>>(
+        ['logs', run.id],
+        (data) => {
+          if (!data) {
+            return data
+          }
+
+          // Logs are sent in batches, in JSONL format, and they're
+          // appended to the last page
+          const pages = [...data.pages]
+          const lastPage = pages[pages.length - 1]
+          pages[pages.length - 1] = {
+            logs: [...lastPage.logs, ...parseLogs(message, lastPage.end)],
+            start: lastPage.start,
+            end: lastPage.end + new TextEncoder().encode(message + '\n').length,
+          }
+
+          return { ...data, pages }
+        }
+      )
     },
     [run.id]
   )
@@ -115,9 +134,11 @@ const LogViewer: React.FC<Props> = ({ pipeline, run }) => {
 
   useEffect(() => {
     socket.on(`logs.${run.id}`, onWsMessage)
+    subscribe(`run:${run.id}`)
 
     return () => {
       socket.off(`logs.${run.id}`, onWsMessage)
+      unsubscribe(`run:${run.id}`)
     }
   }, [])
 
@@ -133,12 +154,13 @@ const LogViewer: React.FC<Props> = ({ pipeline, run }) => {
     return <div>Error loading logs</div>
   }
 
-  const logs = query.data.filter((log) => {
-    return (
-      (filter.levels.length === 0 || filter.levels.includes(log.level)) &&
-      (filter.tasks.length === 0 || filter.tasks.includes(log.task))
+  const logs = query.data.pages
+    .flatMap((page) => page.logs)
+    .filter(
+      (log) =>
+        (filter.levels.length === 0 || filter.levels.includes(log.level)) &&
+        (filter.tasks.length === 0 || filter.tasks.includes(log.task))
     )
-  })
 
   const tasksColors = getTasksColors(pipeline.tasks)
 
@@ -205,6 +227,19 @@ const LogViewer: React.FC<Props> = ({ pipeline, run }) => {
         )}
       </Grid>
 
+      {query.hasPreviousPage && (
+        <Flex justifyContent="center">
+          <Button
+            size="xs"
+            variant="light"
+            loading={query.isFetchingPreviousPage}
+            onClick={() => query.fetchPreviousPage()}
+          >
+            Load previous logs
+          </Button>
+        </Flex>
+      )}
+
       <Table className="mt-6 flex-grow" ref={tableRef}>
         <TableHead className="sticky top-0 bg-tremor-background dark:bg-dark-tremor-background shadow dark:shadow-tremor-dropdown z-10">
           <TableRow>
@@ -15,7 +15,7 @@ import { useCallback, useEffect, useState } from 'react'
 import { Link, useNavigate } from 'react-router'
 import { HTTPError } from 'ky'
 
-import { socket } from '@/socket'
+import { socket, subscribe, unsubscribe } from '@/socket'
 import { PipelineRun } from '@/types'
 import { formatDateTime } from '@/utils'
 import StatusBadge from './StatusBadge'
@@ -69,6 +69,15 @@ const RunsList: React.FC<Props> = ({ pipelineId, query, triggerId }) => {
     }
   }, [pipelineId])
 
+  useEffect(() => {
+    const room = pipelineId ? `pipeline:${pipelineId}` : 'runs'
+    subscribe(room)
+
+    return () => {
+      unsubscribe(room)
+    }
+  }, [pipelineId])
+
   useEffect(() => {
     if (query.data?.length) {
       setRuns(query.data)
@@ -26,6 +26,13 @@ const RunsTasksList: React.FC<Props> = ({ pipeline, run }) => {
   const [viewDataDialog, setViewDataDialog] = useState<string | undefined>()
 
   const tasksColors = getTasksColors(pipeline.tasks)
+  const tasksNames = Object.fromEntries(
+    pipeline.tasks.map((task) => [task.id, task.name])
+  )
+  // Tasks may complete in any order, so look them up by ID
+  const tasksRun = Object.fromEntries(
+    (run.tasks_run || []).map((taskRun) => [taskRun.task_id, taskRun])
+  )
 
   return (
     <Card>
@@ -39,13 +46,13 @@ const RunsTasksList: React.FC<Props> = ({ pipeline, run }) => {
       <Title>Tasks</Title>
 
       <List>
-        {pipeline.tasks.map((task, i) => (
+        {pipeline.tasks.map((task) => (
           <ListItem key={task.id} className="space-x-4">
-            {run.tasks_run && run.tasks_run[i] ? (
+            {tasksRun[task.id] ? (
               <Icon
                 variant="light"
-                icon={STATUS_ICONS[run.tasks_run[i].status]}
-                color={STATUS_COLORS[run.tasks_run[i].status]}
+                icon={STATUS_ICONS[tasksRun[task.id].status]}
+                color={STATUS_COLORS[tasksRun[task.id].status]}
               />
             ) : (
               <Icon
@@ -68,9 +75,20 @@ const RunsTasksList: React.FC<Props> = ({ pipeline, run }) => {
               {task.description && (
                 <Text className="truncate">{task.description}</Text>
               )}
+              {task.upstream?.length > 0 && (
+                <Text className="truncate">
+                  Depends on{' '}
+                  {task.upstream.map((id) => tasksNames[id] || id).join(', ')}
+                </Text>
+              )}
+              {tasksRun[task.id]?.cached && (
+                <Text className="truncate">
+                  Output reused from a previous run
+                </Text>
+              )}
             </div>
 
-            {run.tasks_run && run.tasks_run[i]?.has_output && (
+            {tasksRun[task.id]?.has_output && (
               <Button
                 variant="light"
                 color="indigo"
@@ -1,6 +1,7 @@
-import { useQuery, useQueryClient } from '@tanstack/react-query'
+import { useMutation, useQuery, useQueryClient } from '@tanstack/react-query'
 import {
   Bold,
+  Button,
   Card,
   CategoryBar,
   Flex,
@@ -20,8 +21,8 @@ import StatusBadge from '@/components/StatusBadge'
 import RunsTasksList from '@/components/Tasks'
 import Timer from '@/components/Timer'
 import { MANUAL_TRIGGER } from '@/constants'
-import { getPipeline, getRun } from '@/repository'
-import { socket } from '@/socket'
+import { cancelRun, getPipeline, getRun } from '@/repository'
+import { socket, subscribe, unsubscribe } from '@/socket'
 import { Trigger } from '@/types'
 import { TASKS_COLORS, formatDate, formatDateTime, formatTime } from '@/utils'
 
@@ -39,14 +40,17 @@ const RunViewPage = () => {
       })
     }
     socket.on('run-update', onRunUpdate)
+    subscribe(`run:${runId}`)
 
     return () => {
       socket.off('run-update', onRunUpdate)
+      unsubscribe(`run:${runId}`)
     }
-  }, [pipelineId])
+  }, [pipelineId, runId])
 
   const pipelineQuery = useQuery(getPipeline(pipelineId))
   const runQuery = useQuery(getRun(pipelineId, triggerId, runId))
+  const cancelRunMutation = useMutation(cancelRun(runId))
 
   if (pipelineQuery.isPending) {
     return <div>Loading...</div>
@@ -101,6 +105,19 @@ const RunViewPage = () => {
             <StatusBadge status={run.status} />
           </Flex>
 
+          {(run.status === 'running' || run.status === 'pending') && (
+            <Button
+              variant="secondary"
+              color="rose"
+              size="xs"
+              className="mt-2"
+              loading={cancelRunMutation.isPending}
+              onClick={() => cancelRunMutation.mutate()}
+            >
+              Cancel run
+            </Button>
+          )}
+
           <Flex className="justify-start items-baseline space-x-3 truncate">
             <Metric>
               {run.status !== 'running' ? (
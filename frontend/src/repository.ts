@@ -1,7 +1,19 @@
-import { UseMutationOptions, UseQueryOptions } from '@tanstack/react-query'
+import {
+  UseMutationOptions,
+  UseQueryOptions,
+  infiniteQueryOptions,
+} from '@tanstack/react-query'
 import ky, { HTTPError, Options } from 'ky'
 
-import { LogEntry, Pipeline, PipelineRun, WhoamiResponse } from './types'
+import {
+  LogEntry,
+  Pipeline,
+  PipelineRun,
+  RunStatsReport,
+  TaskOutputPreview,
+  TaskRunRecord,
+  WhoamiResponse,
+} from './types'
 import { JSONSchema7 } from 'json-schema'
 
 interface BaseError {
@@ -174,15 +186,25 @@ export const getPipelineInputSchema = (
 
 export const listRuns = (
   pipelineId?: string,
-  triggerId?: string
+  triggerId?: string,
+  beforeId?: number,
+  pageSize?: number
 ): UseQueryOptions<PipelineRun[], HTTPError> => ({
-  queryKey: ['runs', pipelineId, triggerId],
+  queryKey: ['runs', pipelineId, triggerId, beforeId, pageSize],
   queryFn: async () => {
-    const params = {
+    const params: Record<string, string | number> = {
       pipeline_id: pipelineId ?? '',
       trigger_id: triggerId ?? '',
     }
 
+    if (beforeId) {
+      params.before_id = beforeId
+    }
+
+    if (pageSize) {
+      params.page_size = pageSize
+    }
+
     const runs = await get<any[]>('runs/', {
       searchParams: params,
     })
@@ -211,29 +233,109 @@ export const getRun = (
   enabled: !!(pipelineId && triggerId && runId),
 })
 
-export const getLogs = (
-  runId: number
-): UseQueryOptions<LogEntry[], HTTPError> => ({
-  queryKey: ['logs', runId],
+export const listTaskRuns = (
+  pipelineId: string,
+  taskId: string,
+  beforeId?: number
+): UseQueryOptions<TaskRunRecord[], HTTPError> => ({
+  queryKey: ['task-runs', pipelineId, taskId, beforeId],
   queryFn: async () => {
-    const rawLogs = await client.get(`runs/${runId}/logs`).text()
+    const taskRuns = await get<any[]>(
+      `pipelines/${pipelineId}/tasks/${taskId}/runs`,
+      { searchParams: beforeId ? { before_id: beforeId } : {} }
+    )
 
-    if (!rawLogs) {
-      return []
-    }
+    taskRuns.forEach((taskRun) => {
+      if (taskRun.start_time) {
+        taskRun.start_time = new Date(taskRun.start_time)
+      }
+    })
+
+    return taskRuns as TaskRunRecord[]
+  },
+  initialData: [],
+})
 
-    // Logs data is in JSONL format (1 JSON object per line)
-    return rawLogs.split('\n').map((line, i) => {
+export const getStats = (
+  pipelineId: string,
+  granularity: 'hour' | 'day' = 'day',
+  taskId?: string
+): UseQueryOptions<RunStatsReport, HTTPError> => ({
+  queryKey: ['stats', pipelineId, granularity, taskId],
+  queryFn: async () => {
+    const report = await get<RunStatsReport>('stats/', {
+      searchParams: {
+        pipeline_id: pipelineId,
+        granularity,
+        ...(taskId ? { task_id: taskId } : {}),
+      },
+    })
+
+    report.buckets.forEach((bucket) => {
+      if (bucket.bucket_start) {
+        bucket.bucket_start = new Date(bucket.bucket_start)
+      }
+    })
+
+    return report
+  },
+})
+
+/**
+ * Number of log lines loaded at a time, from the latest ones
+ */
+const LOGS_PAGE_SIZE = 500
+
+export interface LogsPage {
+  logs: LogEntry[]
+  /**
+   * Byte range of the page in the logs file
+   */
+  start: number
+  end: number
+}
+
+/**
+ * Parse logs in JSONL format (1 JSON object per line)
+ */
+export const parseLogs = (rawLogs: string, firstId: number): LogEntry[] =>
+  rawLogs
+    .split('\n')
+    .filter((line) => !!line)
+    .map((line, i) => {
       const parsed = JSON.parse(line)
-      // Add a unique id to be used as key for React
-      parsed.id = i
+      // Add a unique id to be used as key for React, the lines
+      // of a page start at different bytes so their ids don't overlap
+      parsed.id = firstId + i
       parsed.timestamp = new Date(parsed.timestamp)
       return parsed
     })
-  },
-  enabled: !!runId,
-  initialData: [],
-})
+
+export const getLogs = (runId: number) =>
+  infiniteQueryOptions<LogsPage, HTTPError>({
+    queryKey: ['logs', runId],
+    queryFn: async ({ pageParam }) => {
+      // The last lines of the logs, or the ones before the page
+      // that was loaded previously
+      const response = await client.get(`runs/${runId}/logs`, {
+        searchParams: {
+          tail: LOGS_PAGE_SIZE,
+          ...(pageParam !== null ? { before: pageParam as number } : {}),
+        },
+      })
+
+      const start = Number(response.headers.get('X-Logs-Start') || 0)
+      const end = Number(response.headers.get('X-Logs-End') || 0)
+
+      return { logs: parseLogs(await response.text(), start), start, end }
+    },
+    initialPageParam: null,
+    // The new logs are received via websocket
+    getNextPageParam: () => undefined,
+    getPreviousPageParam: (firstPage) =>
+      firstPage.start > 0 ? firstPage.start : undefined,
+    enabled: !!runId,
+  })
 
 export const getRunDataUrl = (runId: number, taskId: string) =>
   `runs/${runId}/data/${taskId}`
@@ -244,7 +346,25 @@ export const getRunData = (
 ): UseQueryOptions<any, HTTPError> => ({
   queryKey: ['getRunData', { runId, taskId }],
   queryFn: async () => {
-    return await get(getRunDataUrl(runId, taskId))
+    // Outputs may be stored in binary formats, i.e. parquet
+    return await get(getRunDataUrl(runId, taskId), {
+      searchParams: { format: 'json' },
+    })
+  },
+})
+
+export const getRunDataPreview = (
+  runId: number,
+  taskId: string,
+  offset: number,
+  limit: number
+): UseQueryOptions<TaskOutputPreview, HTTPError> => ({
+  queryKey: ['getRunDataPreview', { runId, taskId, offset, limit }],
+  queryFn: async () => {
+    return await get<TaskOutputPreview>(
+      `${getRunDataUrl(runId, taskId)}/preview`,
+      { searchParams: { offset, limit } }
+    )
   },
 })
 
@@ -267,6 +387,14 @@ export const runPipeline = (
   },
 })
 
+export const cancelRun = (
+  runId: number
+): UseMutationOptions<PipelineRun, PlomberyHttpError, void> => ({
+  async mutationFn() {
+    return await post<PipelineRun>(`runs/${runId}/cancel`)
+  },
+})
+
 export const getLatestRelease = (): UseQueryOptions<{
   tag_name: string
   prerelease: boolean
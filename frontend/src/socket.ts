@@ -6,3 +6,41 @@ export const socket = io(getWebsocketUrl().toString(), {
   transports: ['websocket'],
   path: '/ws/socket.io',
 })
+
+// Number of components subscribed to each room, the room is left
+// only when the last one unsubscribes
+const subscriptions = new Map<string, number>()
+
+// The server forgets the rooms of a client when it disconnects
+socket.on('connect', () => {
+  subscriptions.forEach((_, room) => socket.emit('subscribe', room))
+})
+
+/**
+ * Receive the messages of a room: `runs` for all the runs,
+ * `pipeline:<id>` for the runs of a pipeline or `run:<id>` for
+ * the updates and the logs of a run.
+ */
+export const subscribe = (room: string) => {
+  const count = subscriptions.get(room) ?? 0
+  subscriptions.set(room, count + 1)
+
+  if (count === 0 && socket.connected) {
+    socket.emit('subscribe', room)
+  }
+}
+
+export const unsubscribe = (room: string) => {
+  const count = subscriptions.get(room) ?? 0
+
+  if (count > 1) {
+    subscriptions.set(room, count - 1)
+    return
+  }
+
+  subscriptions.delete(room)
+
+  if (count === 1 && socket.connected) {
+    socket.emit('unsubscribe', room)
+  }
+}
@@ -4,6 +4,7 @@ export type PipelineRunStatus =
   | 'completed'
   | 'failed'
   | 'cancelled'
+  | 'skipped'
 export type LogLevel = 'DEBUG' | 'INFO' | 'WARNING' | 'ERROR'
 
 export interface LogEntry {
@@ -24,12 +25,16 @@ export interface Trigger {
   paused?: boolean
   params?: any
   next_fire_time?: Date
+  overlap_policy?: 'allow' | 'skip' | 'queue' | 'replace'
+  misfire_policy?: 'run_once' | 'run_all' | 'skip'
+  max_misfired_runs?: number
 }
 
 export interface Task {
   id: string
   name: string
   description: string
+  upstream: string[]
 }
 
 export class Pipeline {
@@ -58,11 +63,71 @@ export class Pipeline {
   }
 }
 
+export interface TaskAttempt {
+  attempt: number
+  start_time: Date
+  duration: number
+  error?: string
+}
+
 export interface TaskRun {
   duration: number
   has_output: boolean
+  output_size?: number
+  output_format?: string
+  cached?: boolean
   status: PipelineRunStatus
   task_id: string
+  start_time?: Date
+  upstream: string[]
+  attempts?: TaskAttempt[]
+}
+
+export interface TaskRunRecord {
+  id: number
+  pipeline_run_id: number
+  pipeline_id: string
+  task_id: string
+  status: PipelineRunStatus
+  start_time?: Date
+  duration: number
+  has_output: boolean
+  output_size?: number
+  output_format?: string
+  cached?: boolean
+}
+
+export interface OutputColumn {
+  name: string
+  type: string
+}
+
+export interface TaskOutputPreview {
+  columns?: OutputColumn[]
+  num_rows: number
+  offset: number
+  rows: any[]
+}
+
+export interface RunStats {
+  bucket_start?: Date
+  count: number
+  completed: number
+  failed: number
+  cancelled: number
+  skipped: number
+  success_rate?: number
+  avg_duration?: number
+  min_duration?: number
+  max_duration?: number
+  p50_duration?: number
+  p95_duration?: number
+  p99_duration?: number
+}
+
+export interface RunStatsReport {
+  summary: RunStats
+  buckets: RunStats[]
 }
 
 export interface PipelineRun {
@@ -73,6 +138,9 @@ export interface PipelineRun {
   start_time: Date
   duration: number
   tasks_run: TaskRun[]
+  wait_duration?: number
+  queue_position?: number
+  worker_id?: string
 }
 
 export interface WhoamiResponse {
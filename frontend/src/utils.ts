@@ -1,6 +1,7 @@
 import {
   CheckCircleIcon,
   ExclamationTriangleIcon,
+  ForwardIcon,
   NoSymbolIcon,
   StopCircleIcon,
   XCircleIcon,
@@ -18,6 +19,7 @@ export const STATUS_COLORS: Record<ExtendedStatus, Color> = {
   completed: 'emerald',
   failed: 'rose',
   cancelled: 'slate',
+  skipped: 'gray',
   running: 'blue',
   warning: 'amber',
 }
@@ -27,6 +29,7 @@ export const STATUS_ICONS: Record<ExtendedStatus, React.ElementType<any>> = {
   completed: CheckCircleIcon,
   failed: XCircleIcon,
   cancelled: StopCircleIcon,
+  skipped: ForwardIcon,
   running: RunningIcon,
   warning: ExclamationTriangleIcon,
 }
@@ -9,11 +9,18 @@ from .api import app
 from .config import settings
 from .database.operations import setup_database
 from .logger import get_logger  # noqa F401
+from .logger.web_socket_handler import websocket_handler
 from .notifications import NotificationRule, notification_manager
 from .orchestrator import orchestrator
 from .pipeline import task, Task  # noqa F401
+from .pipeline.cancellation import (  # noqa F401
+    CancellationToken,
+    get_cancellation_token,
+)
+from .pipeline.executors import executors
 from .pipeline.pipeline import Pipeline, Trigger  # noqa F401
-from .schemas import PipelineRunStatus  # noqa F401
+from .pipeline.trigger import MisfirePolicy, OverlapPolicy  # noqa F401
+from .schemas import PipelineRunStatus, RetentionPolicy  # noqa F401
 from ._version import __version__  # noqa F401
 
 
@@ -43,6 +50,7 @@ class _Plombery:
 
     def start(self):
         setup_database()
+        websocket_handler.start()
 
         try:
             orchestrator.start()
@@ -51,6 +59,8 @@ class _Plombery:
 
     def stop(self):
         orchestrator.stop()
+        executors.shutdown()
+        websocket_handler.stop()
 
 
 _plombery = _Plombery()
@@ -72,6 +82,9 @@ def register_pipeline(
     description: Optional[str] = None,
     params: Optional[Type[BaseModel]] = None,
     triggers: Optional[List[Trigger]] = None,
+    max_concurrent_runs: Optional[int] = None,
+    max_concurrent_tasks: Optional[int] = None,
+    retention: Optional[RetentionPolicy] = None,
 ):
     pipeline = Pipeline(
         id=id,
@@ -80,6 +93,9 @@ def register_pipeline(
         description=description,
         params=params,
         triggers=triggers or [],
+        max_concurrent_runs=max_concurrent_runs,
+        max_concurrent_tasks=max_concurrent_tasks,
+        retention=retention,
     )
 
     _plombery.register_pipeline(pipeline)
@@ -0,0 +1,3 @@
+from plombery.cli import main
+
+main()
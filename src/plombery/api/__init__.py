@@ -4,8 +4,7 @@ from plombery.api.authentication import build_auth_router
 from plombery._version import __version__
 from plombery.websocket import asgi
 from plombery.api.middlewares import SPAStaticFiles, setup_cors
-from plombery.api.routers import pipelines, runs
-
+from plombery.api.routers import executors, pipelines, runs, stats
 
 API_PREFIX = "/api"
 
@@ -19,6 +18,8 @@ setup_cors(app)
 
 app.include_router(pipelines.router, prefix=API_PREFIX)
 app.include_router(runs.router, prefix=API_PREFIX)
+app.include_router(executors.router, prefix=API_PREFIX)
+app.include_router(stats.router, prefix=API_PREFIX)
 app.include_router(build_auth_router(app), prefix=API_PREFIX)
 
 app.mount("/", SPAStaticFiles(api_prefix=API_PREFIX))
@@ -46,4 +46,6 @@ def setup_cors(app: FastAPI):
         allow_credentials=True,
         allow_methods=["HEAD", "GET", "POST", "PATCH", "PUT", "DELETE", "OPTIONS"],
         allow_headers=[],
+        # Read by the UI to page the logs
+        expose_headers=["X-Logs-Start", "X-Logs-End"],
     )
@@ -0,0 +1,17 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from plombery.api.authentication import NeedsAuth
+from plombery.pipeline.executors import executors
+from plombery.schemas import ExecutorStats
+
+router = APIRouter(prefix="/executors", tags=["Executors"], dependencies=[NeedsAuth])
+
+
+@router.get(
+    "/",
+    description="List the executor pools with the number of running and queued functions",
+)
+def list_executors() -> List[ExecutorStats]:
+    return executors.get_stats()
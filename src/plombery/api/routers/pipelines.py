@@ -1,14 +1,17 @@
-from typing import Any, Dict, Optional
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Annotated, Any, Dict, List, Optional, Sequence
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, ValidationError
 
 from plombery.api.authentication import NeedsAuth
-from plombery.database.schemas import PipelineRun
+from plombery.database.async_repository import list_task_runs
+from plombery.database.repository import DEFAULT_PAGE_SIZE
+from plombery.database.schemas import PipelineRun, TaskRunRecord
 from plombery.orchestrator import orchestrator, run_pipeline_now
 from plombery.pipeline.pipeline import Pipeline
 from plombery.pipeline.trigger import Trigger
-
+from plombery.schemas import PipelineRunStatus
 
 router = APIRouter(prefix="/pipelines", tags=["Pipelines"], dependencies=[NeedsAuth])
 
@@ -95,3 +98,31 @@ async def run_pipeline(pipeline_id: str, body: PipelineRunInput) -> PipelineRun:
             params=body.params,
             reason=body.reason,
         )
+
+
+@router.get(
+    "/{pipeline_id}/tasks/{task_id}/runs",
+    description="List the runs of a task, newest first, a page at a time",
+)
+async def list_pipeline_task_runs(
+    pipeline_id: str,
+    task_id: str,
+    status: Annotated[Optional[List[PipelineRunStatus]], Query()] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: Annotated[int, Query(ge=1, le=1000)] = DEFAULT_PAGE_SIZE,
+) -> Sequence[TaskRunRecord]:
+    task_runs = await list_task_runs(
+        pipeline_id,
+        task_id,
+        status=status,
+        started_after=started_after,
+        started_before=started_before,
+        before_id=before_id,
+        after_id=after_id,
+        page_size=page_size,
+    )
+
+    return [TaskRunRecord.model_validate(task_run) for task_run in task_runs]
@@ -1,19 +1,80 @@
-from typing import Optional, Sequence
+from datetime import datetime
+from pathlib import Path
+from typing import Annotated, Dict, List, Literal, Optional, Sequence
 
-from fastapi import APIRouter, HTTPException, Response
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 from plombery.api.authentication import NeedsAuth
 from plombery.database.schemas import PipelineRun
+from plombery.database import models
 from plombery.exceptions import InvalidDataPath
-from plombery.orchestrator.data_storage import get_task_run_data_file, read_logs_file
-from plombery.database.repository import list_pipeline_runs, get_pipeline_run
+from plombery.logger.reader import LogsFilter, find_logs_range, iter_logs
+from plombery.orchestrator import cancel_run
+from plombery.orchestrator.compression import accepts_encoding, get_compression
+from plombery.orchestrator.dispatcher import dispatcher
+from plombery.orchestrator.data_storage import (
+    convert_task_output,
+    find_compressed_logs_file,
+    get_logs_filename,
+    get_task_output,
+    get_task_output_file,
+    get_task_output_preview,
+)
+from plombery.orchestrator.output_serializers import (
+    UnsupportedOutput,
+    get_output_serializer,
+)
+from plombery.database.async_repository import list_pipeline_runs, get_pipeline_run
+from plombery.database.repository import DEFAULT_PAGE_SIZE
+from plombery.schemas import PipelineRunStatus, TaskOutputPreview
 
 
 class JSONLResponse(Response):
     media_type = "application/jsonl"
 
 
+def _send_compressed_file(
+    path: Path,
+    encoding: str,
+    accept_encoding: Optional[str],
+    media_type: str,
+    filename: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Send a compressed file as it is, if the client supports its encoding,
+    otherwise decompress it while sending it"""
+
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+
+    if accepts_encoding(accept_encoding, encoding):
+        return FileResponse(
+            path,
+            media_type=media_type,
+            filename=filename,
+            headers={**headers, "Content-Encoding": encoding},
+        )
+
+    if not (compression := get_compression(encoding)):
+        raise HTTPException(
+            status_code=406, detail=f"The data is only available as {encoding}"
+        )
+
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    return StreamingResponse(
+        compression.iter_decompressed(path), media_type=media_type, headers=headers
+    )
+
+
+def _to_schema(pipeline_run: models.PipelineRun) -> PipelineRun:
+    return PipelineRun.model_validate(pipeline_run).model_copy(
+        update=dict(queue_position=dispatcher.get_queue_position(pipeline_run.id))
+    )
+
+
 router = APIRouter(
     prefix="/runs",
     tags=["Runs"],
@@ -22,39 +83,237 @@ router = APIRouter(
 
 
 @router.get("/")
-def list_runs(
+async def list_runs(
     pipeline_id: Optional[str] = None,
     trigger_id: Optional[str] = None,
+    status: Annotated[Optional[List[PipelineRunStatus]], Query()] = None,
+    reason: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: Annotated[int, Query(ge=1, le=1000)] = DEFAULT_PAGE_SIZE,
 ) -> Sequence[PipelineRun]:
-    return list_pipeline_runs(pipeline_id=pipeline_id, trigger_id=trigger_id)
+    """
+    List the runs, newest first, a page at a time: to get the next page
+    pass the ID of the last run as `before_id`, for the previous page
+    pass the ID of the first run as `after_id`.
+    """
+
+    return [
+        _to_schema(pipeline_run)
+        for pipeline_run in await list_pipeline_runs(
+            pipeline_id=pipeline_id,
+            trigger_id=trigger_id,
+            status=status,
+            reason=reason,
+            started_after=started_after,
+            started_before=started_before,
+            before_id=before_id,
+            after_id=after_id,
+            page_size=page_size,
+        )
+    ]
 
 
 @router.get("/{run_id}")
-def get_run(run_id: int) -> PipelineRun:
-    if not (pipeline_run := get_pipeline_run(run_id)):
+async def get_run(run_id: int) -> PipelineRun:
+    if not (pipeline_run := await get_pipeline_run(run_id)):
+        raise HTTPException(404, f"The pipeline run {run_id} doesn't exist")
+
+    return _to_schema(pipeline_run)
+
+
+@router.post("/{run_id}/cancel")
+async def cancel_pipeline_run(run_id: int) -> PipelineRun:
+    """
+    Cancel a pending or running run: its async tasks are cancelled, its sync
+    tasks get their cancellation token cancelled, or they're interrupted if
+    they run in a process, and its concurrency slot is freed immediately.
+    """
+
+    if not (pipeline_run := await get_pipeline_run(run_id)):
         raise HTTPException(404, f"The pipeline run {run_id} doesn't exist")
 
-    return pipeline_run
+    if not await cancel_run(pipeline_run):
+        raise HTTPException(409, f"The pipeline run {run_id} isn't pending nor running")
+
+    return _to_schema(pipeline_run)
 
 
 @router.get("/{run_id}/logs", response_class=JSONLResponse)
-def get_run_logs(run_id: int):
+def get_run_logs(
+    run_id: int,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    before: Annotated[Optional[int], Query(ge=0)] = None,
+    tail: Annotated[Optional[int], Query(ge=1)] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+    level: Optional[Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]] = None,
+    since: Optional[datetime] = None,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+):
+    """
+    Stream the logs of a run in JSONL format, optionally only the ones between
+    the byte offsets `offset` and `before`, and then only the last `tail` lines
+    or the first `limit` lines.
+
+    The `X-Logs-Start` and `X-Logs-End` headers contain the byte range that was read:
+    pass `X-Logs-End` as `offset` to get the next page or the logs written after
+    the request, pass `X-Logs-Start` as `before`, together with `tail`, to get
+    the previous page.
+
+    The logs of the ended runs may be compressed: when all the logs are requested,
+    they're sent compressed to the clients supporting the compression, otherwise
+    only the compressed blocks containing the requested range are read.
+    """
+
     try:
-        logs = read_logs_file(run_id)
+        logs_file = get_logs_filename(run_id)
     except InvalidDataPath:
         raise HTTPException(status_code=400, detail="Invalid run ID")
 
-    return Response(content=logs, media_type="application/jsonl")
+    logs_filter = LogsFilter(level=level, since=since)
+    background = None
+
+    try:
+        # Kept open, so it can still be read if the run ends meanwhile
+        # and the file is replaced by the compressed one
+        logs = logs_file.open(mode="rb")
+    except FileNotFoundError:
+        if not (compressed := find_compressed_logs_file(run_id)):
+            return JSONLResponse(headers={"X-Logs-Start": "0", "X-Logs-End": "0"})
+
+        compressed_file, compression = compressed
+
+        if (
+            not offset
+            and before is None
+            and tail is None
+            and limit is None
+            and logs_filter.is_empty
+        ):
+            headers = {"X-Logs-Start": "0"}
+
+            if (size := compression.get_uncompressed_size(compressed_file)) is not None:
+                headers["X-Logs-End"] = str(size)
+
+            return _send_compressed_file(
+                compressed_file,
+                compression.encoding,
+                accept_encoding,
+                JSONLResponse.media_type,
+                headers=headers,
+            )
+
+        if not (logs := compression.open_seekable(compressed_file)):
+            # Reading a range of the logs needs random access
+            logs_file = compression.decompress_to_temp_file(compressed_file)
+            logs = logs_file.open(mode="rb")
+            background = BackgroundTask(logs_file.unlink)
+
+    try:
+        start, end = find_logs_range(logs, offset, before, tail, limit, logs_filter)
+    except Exception:
+        logs.close()
+        raise
+
+    return StreamingResponse(
+        iter_logs(logs, start, end, logs_filter),
+        media_type=JSONLResponse.media_type,
+        headers={"X-Logs-Start": str(start), "X-Logs-End": str(end)},
+        background=background,
+    )
 
 
 @router.get("/{run_id}/data/{task}")
-def get_run_data(run_id: int, task: str):
+def get_run_data(
+    run_id: int,
+    task: str,
+    format: Optional[str] = None,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+):
+    """
+    Download the output of a task in the format it was stored,
+    or converted to another one, i.e. `?format=json`.
+
+    Compressed outputs are sent compressed to the clients supporting the compression.
+    """
+
+    try:
+        output = get_task_output(run_id, task)
+    except InvalidDataPath:
+        raise HTTPException(status_code=400, detail="Invalid run or task ID")
+
+    if not output:
+        raise HTTPException(status_code=404, detail="Task has no data")
+
+    filename = f"run-{run_id}-{task}-data"
+
+    if not format or format == output.format:
+        output_file = get_task_output_file(run_id, output)
+
+        if not output.encoding:
+            return FileResponse(
+                path=output_file,
+                media_type=output.media_type,
+                filename=filename + output_file.suffix,
+            )
+
+        # i.e. extract.json.gz
+        return _send_compressed_file(
+            output_file,
+            output.encoding,
+            accept_encoding,
+            output.media_type,
+            filename=filename + output_file.with_suffix("").suffix,
+        )
+
+    if not (serializer := get_output_serializer(format)):
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}")
+
     try:
-        data_file = get_task_run_data_file(run_id, task)
+        content = convert_task_output(run_id, output, format)
+    except UnsupportedOutput as error:
+        raise HTTPException(
+            status_code=400, detail=f"Can't convert the data to {format}: {error}"
+        )
+
+    return StreamingResponse(
+        content,
+        media_type=serializer.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{serializer.extension}"'
+        },
+    )
+
+
+@router.get("/{run_id}/data/{task}/preview", response_model=TaskOutputPreview)
+def get_run_data_preview(
+    run_id: int,
+    task: str,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    columns: Annotated[Optional[List[str]], Query()] = None,
+):
+    """
+    Get a page of rows of a task output, if it's a table or a list,
+    reading only the requested rows and columns
+    """
+
+    try:
+        output = get_task_output(run_id, task)
     except InvalidDataPath:
         raise HTTPException(status_code=400, detail="Invalid run or task ID")
 
-    if not data_file.exists():
+    if not output:
         raise HTTPException(status_code=404, detail="Task has no data")
 
-    return FileResponse(path=data_file, filename=f"run-{run_id}-{task}-data.json")
+    try:
+        preview = get_task_output_preview(run_id, output, offset, limit, columns)
+    except (UnsupportedOutput, ValueError) as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    if not preview:
+        raise HTTPException(status_code=400, detail="The task data isn't a table")
+
+    return preview
@@ -0,0 +1,70 @@
+from datetime import datetime
+from itertools import groupby
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from plombery.api.authentication import NeedsAuth
+from plombery.database.async_repository import list_run_rollups
+from plombery.database.rollups import merge_rollups
+from plombery.logger.web_socket_handler import websocket_handler
+from plombery.orchestrator import orchestrator
+from plombery.schemas import RetentionReport, RunStats, WebSocketStats
+
+router = APIRouter(prefix="/stats", tags=["Stats"], dependencies=[NeedsAuth])
+
+
+class RunStatsReport(BaseModel):
+    summary: RunStats
+    """Stats of the whole period"""
+    buckets: List[RunStats]
+    """Stats of each hour or day, only the ones with runs"""
+
+
+@router.get(
+    "/",
+    description="Get the stats of the runs or, if `task_id` is set, of a task",
+)
+async def get_stats(
+    pipeline_id: Optional[str] = None,
+    trigger_id: Optional[str] = None,
+    task_id: Optional[str] = None,
+    granularity: Literal["hour", "day"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> RunStatsReport:
+    rollups = await list_run_rollups(
+        granularity,
+        pipeline_id=pipeline_id,
+        trigger_id=trigger_id,
+        task_id=task_id,
+        since=since,
+        until=until,
+    )
+
+    return RunStatsReport(
+        summary=merge_rollups(rollups),
+        buckets=[
+            merge_rollups(bucket_rollups, bucket_start=bucket_start)
+            for bucket_start, bucket_rollups in groupby(
+                rollups, key=lambda rollup: rollup.bucket_start
+            )
+        ],
+    )
+
+
+@router.get(
+    "/retention",
+    description="Get the report of the last garbage collection of the old runs",
+)
+async def get_retention_report() -> Optional[RetentionReport]:
+    return orchestrator.garbage_collector.last_report
+
+
+@router.get(
+    "/websocket",
+    description="Get the number of log records sent to the clients watching the runs",
+)
+async def get_websocket_stats() -> WebSocketStats:
+    return websocket_handler.get_stats()
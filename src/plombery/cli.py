@@ -0,0 +1,58 @@
+from argparse import ArgumentParser
+from typing import List, Optional
+import asyncio
+import importlib
+import os
+import sys
+
+
+def _import_app(app_module: str):
+    """Import the module where the pipelines are registered,
+    it accepts the same `module:attribute` format as uvicorn"""
+
+    # Like uvicorn, look for the module in the current directory
+    sys.path.insert(0, os.getcwd())
+    importlib.import_module(app_module.split(":")[0])
+
+
+def _run_worker(args):
+    from plombery.database.operations import setup_database
+    from plombery.orchestrator.worker import Worker
+    from plombery.pipeline.executors import executors
+
+    _import_app(args.app)
+    setup_database()
+
+    worker = Worker(concurrency=args.concurrency, poll_interval=args.poll_interval)
+
+    try:
+        asyncio.run(worker.run())
+    finally:
+        executors.shutdown()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = ArgumentParser(prog="plombery")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = commands.add_parser(
+        "worker", help="Execute the runs queued by the web server"
+    )
+    worker_parser.add_argument(
+        "app", help="Module where the pipelines are registered, i.e. src.app"
+    )
+    worker_parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Max number of runs executed at the same time by this worker",
+    )
+    worker_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1,
+        help="Seconds between checks for new runs",
+    )
+    worker_parser.set_defaults(handler=_run_worker)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
@@ -1,13 +1,23 @@
+from datetime import timedelta
 from pathlib import Path
-from typing import Any, List, Literal, Optional, Tuple, Type, Union
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type, Union
 
-from pydantic import AnyHttpUrl, BaseModel, Field, HttpUrl, SecretStr
+from pydantic import (
+    AnyHttpUrl,
+    BaseModel,
+    Field,
+    HttpUrl,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
+    SecretStr,
+)
 from pydantic_core import Url
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic_settings.sources import PydanticBaseSettingsSource
 
 from plombery.config.parser import SettingsFileSource
-from plombery.schemas import NotificationRule
+from plombery.schemas import NotificationRule, RetentionPolicy
 
 BASE_SETTINGS_FOLDER = Path()
 
@@ -25,12 +35,79 @@ class AuthSettings(BaseModel):
     microsoft_tenant_id: Optional[str] = None
 
 
+class ExecutorSettings(BaseModel):
+    type: Literal["thread", "process"] = "thread"
+    max_workers: Optional[PositiveInt] = None
+    """Size of the pool, by default min(32, CPUs + 4) threads or 1 process per CPU"""
+
+
+DEFAULT_EXECUTORS: Dict[str, ExecutorSettings] = {
+    "thread": ExecutorSettings(type="thread"),
+    "process": ExecutorSettings(type="process"),
+    # Runs the DB queries when no async DB driver is installed
+    "db": ExecutorSettings(type="thread"),
+    # Writes the tasks outputs to disk
+    "outputs": ExecutorSettings(type="thread", max_workers=2),
+}
+
+
+class RetentionSettings(RetentionPolicy):
+    """The default retention policy of the pipelines"""
+
+    interval: PositiveFloat = 3600
+    """Seconds between 2 garbage collections"""
+    batch_size: PositiveInt = 100
+    """Max number of runs deleted at once"""
+
+
+class TaskCacheSettings(BaseModel):
+    ttl: Optional[timedelta] = timedelta(days=7)
+    """Time after which a cached output is recomputed, None to keep it forever"""
+    max_bytes: Optional[PositiveInt] = None
+    """Max size of the cached outputs, the least recently used are evicted first"""
+
+
 class Settings(BaseSettings):
     auth: Optional[AuthSettings] = None
     allowed_origins: Union[List[AnyHttpUrl], Literal["*"]] = "*"
     data_path: Path = Field(default_factory=Path.cwd)
     database_url: str = "sqlite:///./plombery.db"
     database_auth_token: Optional[str] = None
+    max_concurrent_runs: Optional[PositiveInt] = None
+    """Max number of runs executed at the same time, None means no limit"""
+    execution_mode: Literal["local", "workers"] = "local"
+    """Where runs are executed, in the app process (local) or
+    by `plombery worker` processes (workers)"""
+    worker_lease_duration: PositiveInt = 30
+    """Seconds after which the runs of a worker that stopped
+    sending heartbeats are considered lost"""
+    websocket_message_queue: Optional[str] = None
+    """Redis URL used to send websocket messages from the workers"""
+    scheduler_lease_duration: PositiveInt = 15
+    """Seconds after which another replica of the app takes over the
+    scheduling of the triggers if the current one stopped"""
+    logs_buffer_size: PositiveInt = 64 * 1024
+    """Bytes of logs buffered in memory before writing them to the run logs file"""
+    logs_flush_interval: PositiveFloat = 1
+    """Max seconds the logs are buffered before writing them"""
+    output_formats: List[str] = Field(
+        default_factory=lambda: ["parquet", "msgpack", "json"]
+    )
+    """Formats of the tasks outputs by preference, the first one supporting
+    the output type and whose packages are installed is used"""
+    output_preview_rows: NonNegativeInt = 50
+    """Number of rows of the tasks outputs stored in their metadata for previews"""
+    max_pending_outputs: PositiveInt = 4
+    """Max number of outputs of a run waiting to be written to disk"""
+    data_compression: Optional[Literal["gzip", "zstd"]] = None
+    """Compression of the runs logs and outputs, None to disable it"""
+    retention: RetentionSettings = Field(default_factory=RetentionSettings)
+    """By default the runs are kept forever"""
+    task_cache: TaskCacheSettings = Field(default_factory=TaskCacheSettings)
+    """Limits of the outputs of the tasks with `cache=True`"""
+    executors: Dict[str, ExecutorSettings] = Field(default_factory=dict)
+    """Pools running the sync tasks, in addition to the default `thread`
+    and `process` ones"""
     frontend_url: AnyHttpUrl = Url("http://localhost:8000")
     notifications: Optional[List[NotificationRule]] = None
 
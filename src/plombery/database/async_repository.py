@@ -0,0 +1,199 @@
+"""
+Async version of the repository functions used in the event loop.
+
+The queries run on the async engine if an async driver is installed
+(aiosqlite or asyncpg), otherwise the sync functions of the repository
+run in the `db` executor pool, so they don't block the event loop.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+from datetime import datetime
+
+from plombery.config import settings
+from plombery.schemas import PipelineRunStatus
+
+from . import base, models, repository
+from .schemas import PipelineRunCreate
+
+T = TypeVar("T")
+
+
+async def _run_sync(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    if base.is_memory_database(settings.database_url):
+        # An in-memory DB lives in a single connection, so the
+        # queries can't run in other threads
+        return func(*args, **kwargs)
+
+    from plombery.pipeline.executors import executors
+
+    return await executors.get("db").run(func, *args, **kwargs)
+
+
+async def create_pipeline_run(data: PipelineRunCreate) -> models.PipelineRun:
+    if not base.AsyncSessionLocal:
+        return await _run_sync(repository.create_pipeline_run, data)
+
+    async with base.AsyncSessionLocal() as db:
+        created_model = await db.run_sync(repository._create_pipeline_run, data)
+        await db.commit()
+        await db.refresh(created_model)
+
+    return created_model
+
+
+async def update_pipeline_run(
+    pipeline_run: models.PipelineRun, end_time: datetime, status: PipelineRunStatus
+):
+    if not base.AsyncSessionLocal:
+        return await _run_sync(
+            repository.update_pipeline_run, pipeline_run, end_time, status
+        )
+
+    async with base.AsyncSessionLocal() as db:
+        await db.run_sync(
+            repository._update_pipeline_run, pipeline_run, end_time, status
+        )
+        await db.commit()
+
+
+async def list_pipeline_runs(**filters: Any) -> List[models.PipelineRun]:
+    """See `repository.list_pipeline_runs` for the filters"""
+
+    if not base.AsyncSessionLocal:
+        return await _run_sync(repository.list_pipeline_runs, **filters)
+
+    async with base.AsyncSessionLocal() as db:
+        result = await db.scalars(repository._list_pipeline_runs_query(**filters))
+
+        return sorted(result.all(), key=lambda run: run.id, reverse=True)
+
+
+async def get_pipeline_run(pipeline_run_id: int) -> Optional[models.PipelineRun]:
+    if not base.AsyncSessionLocal:
+        return await _run_sync(repository.get_pipeline_run, pipeline_run_id)
+
+    async with base.AsyncSessionLocal() as db:
+        return await db.get(models.PipelineRun, pipeline_run_id)
+
+
+async def list_task_runs(
+    pipeline_id: str, task_id: str, **filters: Any
+) -> List[models.TaskRunRecord]:
+    """See `repository.list_task_runs` for the filters"""
+
+    if not base.AsyncSessionLocal:
+        return await _run_sync(
+            repository.list_task_runs, pipeline_id, task_id, **filters
+        )
+
+    async with base.AsyncSessionLocal() as db:
+        result = await db.scalars(
+            repository._list_task_runs_query(pipeline_id, task_id, **filters)
+        )
+
+        return sorted(result.all(), key=lambda task_run: task_run.id, reverse=True)
+
+
+async def list_run_rollups(granularity: str, **filters: Any) -> List[models.RunRollup]:
+    """See `repository.list_run_rollups` for the filters"""
+
+    if not base.AsyncSessionLocal:
+        return await _run_sync(repository.list_run_rollups, granularity, **filters)
+
+    async with base.AsyncSessionLocal() as db:
+        result = await db.scalars(
+            repository._list_run_rollups_query(granularity, **filters)
+        )
+
+        return list(result.all())
+
+
+# The garbage collection queries run rarely, so they always run in the `db` pool
+
+
+async def list_runs_pipeline_ids() -> List[str]:
+    return await _run_sync(repository.list_runs_pipeline_ids)
+
+
+async def list_ended_pipeline_run_ids(pipeline_id: str, **filters: Any) -> List[int]:
+    """See `repository.list_ended_pipeline_run_ids` for the filters"""
+
+    return await _run_sync(
+        repository.list_ended_pipeline_run_ids, pipeline_id, **filters
+    )
+
+
+async def delete_pipeline_runs(pipeline_run_ids: List[int]) -> int:
+    return await _run_sync(repository.delete_pipeline_runs, pipeline_run_ids)
+
+
+# The queries coordinating the replicas and the workers are
+# short and frequent, so they always run in the `db` pool too
+
+
+async def acquire_lock(
+    name: str, holder: str, expires_at: datetime, now: datetime
+) -> bool:
+    return await _run_sync(repository.acquire_lock, name, holder, expires_at, now)
+
+
+async def get_trigger_state(
+    pipeline_id: str, trigger_id: str
+) -> Optional[models.TriggerState]:
+    return await _run_sync(repository.get_trigger_state, pipeline_id, trigger_id)
+
+
+async def save_trigger_state(
+    pipeline_id: str,
+    trigger_id: str,
+    next_fire_time: Optional[datetime],
+    last_fire_time: Optional[datetime] = None,
+):
+    await _run_sync(
+        repository.save_trigger_state,
+        pipeline_id,
+        trigger_id,
+        next_fire_time,
+        last_fire_time=last_fire_time,
+    )
+
+
+async def list_active_pipeline_runs(
+    pipeline_id: str, trigger_id: str
+) -> List[models.PipelineRun]:
+    return await _run_sync(
+        repository.list_active_pipeline_runs, pipeline_id, trigger_id
+    )
+
+
+async def cancel_pipeline_run(pipeline_run_id: int) -> bool:
+    return await _run_sync(repository.cancel_pipeline_run, pipeline_run_id)
+
+
+async def claim_pipeline_run(
+    worker_id: str, lease_expires_at: datetime, **filters: Any
+) -> Optional[models.PipelineRun]:
+    """See `repository.claim_pipeline_run` for the filters"""
+
+    return await _run_sync(
+        repository.claim_pipeline_run, worker_id, lease_expires_at, **filters
+    )
+
+
+async def count_claimed_pipeline_runs() -> Dict[Tuple[str, str], int]:
+    return await _run_sync(repository.count_claimed_pipeline_runs)
+
+
+async def renew_pipeline_run_leases(
+    worker_id: str, pipeline_run_ids: Iterable[int], lease_expires_at: datetime
+) -> Set[int]:
+    return await _run_sync(
+        repository.renew_pipeline_run_leases,
+        worker_id,
+        pipeline_run_ids,
+        lease_expires_at,
+    )
+
+
+async def release_expired_pipeline_runs(now: datetime):
+    await _run_sync(repository.release_expired_pipeline_runs, now)
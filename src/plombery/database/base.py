@@ -1,7 +1,9 @@
+from importlib.util import find_spec
+from typing import Optional
 import json
 
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from plombery.config import settings
@@ -36,8 +38,56 @@ if settings.database_url.startswith("sqlite+libsql"):
     connect_args["auth_token"] = settings.database_auth_token
 
 
+def get_async_database_url(database_url: str) -> Optional[str]:
+    """
+    The URL of the DB with an async driver, if the driver is installed,
+    i.e. `sqlite+aiosqlite://` for `sqlite://` and `postgresql+asyncpg://`
+    for `postgresql://`.
+    """
+
+    url = make_url(database_url)
+
+    if url.drivername in ("sqlite", "sqlite+pysqlite"):
+        if is_memory_database(database_url):
+            # Each connection of the async engine would have its own DB
+            return None
+
+        driver = "aiosqlite"
+    elif url.drivername in ("postgresql", "postgresql+psycopg2"):
+        driver = "asyncpg"
+    else:
+        return None
+
+    # greenlet is needed by SQLAlchemy to run the async drivers
+    if not find_spec(driver) or not find_spec("greenlet"):
+        return None
+
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+def is_memory_database(database_url: str) -> bool:
+    url = make_url(database_url)
+
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
 engine = get_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+AsyncSessionLocal = None
+
+if async_database_url := get_async_database_url(settings.database_url):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        async_database_url, json_serializer=json_serializer
+    )
+
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
 Base = declarative_base()
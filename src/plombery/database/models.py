@@ -1,6 +1,15 @@
 from typing import List, Optional
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
 
 from plombery.database.base import Base
 from plombery.database.type_helpers import AwareDateTime, PydanticType
@@ -9,6 +18,17 @@ from plombery.schemas import TaskRun
 
 class PipelineRun(Base):
     __tablename__ = "pipeline_runs"
+    __table_args__ = (
+        # Used to list the runs of a pipeline/trigger page by page
+        Index(
+            "ix_pipeline_runs_pipeline_id_trigger_id_id",
+            "pipeline_id",
+            "trigger_id",
+            "id",
+        ),
+        Index("ix_pipeline_runs_pipeline_id_start_time", "pipeline_id", "start_time"),
+        Index("ix_pipeline_runs_status_id", "status", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     pipeline_id = Column(String, index=True)
@@ -19,3 +39,102 @@ class PipelineRun(Base):
     tasks_run = Column(PydanticType(List[TaskRun]), default=list)
     input_params = Column(PydanticType(Optional[dict]), default=None)
     reason = Column(String, default=None)
+    wait_duration = Column(Integer, default=0)
+    worker_id = Column(String, default=None)
+    """ID of the worker that claimed the run, when running with workers"""
+    lease_expires_at = Column(AwareDateTime, default=None)
+    """The worker must renew its claim on the run before this time"""
+
+
+class TaskRunRecord(Base):
+    """A task of a finished run, the same data is in `PipelineRun.tasks_run`
+    but here it can be queried to get the history of a task"""
+
+    __tablename__ = "task_runs"
+    __table_args__ = (
+        Index("ix_task_runs_pipeline_id_task_id_id", "pipeline_id", "task_id", "id"),
+        Index(
+            "ix_task_runs_pipeline_id_task_id_start_time",
+            "pipeline_id",
+            "task_id",
+            "start_time",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    pipeline_run_id = Column(
+        Integer, ForeignKey("pipeline_runs.id", ondelete="CASCADE"), index=True
+    )
+    pipeline_id = Column(String)
+    task_id = Column(String)
+    status = Column(String)
+    start_time = Column(AwareDateTime)
+    duration = Column(Float, default=0)
+    has_output = Column(Boolean, default=False)
+    output_size = Column(Integer, default=None)
+    output_format = Column(String, default=None)
+    cached = Column(Boolean, default=False)
+
+
+class RunRollup(Base):
+    """Aggregated stats of the runs of a pipeline trigger, or of
+    one of its tasks, that started in the same hour or day"""
+
+    __tablename__ = "run_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "pipeline_id",
+            "trigger_id",
+            "task_id",
+            "granularity",
+            "bucket_start",
+            name="uq_run_rollups_key",
+        ),
+        Index(
+            "ix_run_rollups_pipeline_id_granularity_bucket_start",
+            "pipeline_id",
+            "granularity",
+            "bucket_start",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    pipeline_id = Column(String, nullable=False)
+    trigger_id = Column(String, nullable=False)
+    task_id = Column(String, nullable=False, default="")
+    """Empty for the stats of the whole run"""
+    granularity = Column(String, nullable=False)
+    """Either `hour` or `day`"""
+    bucket_start = Column(AwareDateTime, nullable=False)
+    count = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    cancelled = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    total_duration = Column(Float, default=0)
+    min_duration = Column(Float, default=None)
+    max_duration = Column(Float, default=None)
+    histogram = Column(PydanticType(List[int]), default=list)
+    """Number of runs by duration, see `rollups.DURATION_BINS`"""
+
+
+class TriggerState(Base):
+    """Firing times of a trigger, used to catch up the firings
+    missed while the app was down"""
+
+    __tablename__ = "trigger_states"
+
+    pipeline_id = Column(String, primary_key=True)
+    trigger_id = Column(String, primary_key=True)
+    last_fire_time = Column(AwareDateTime, default=None)
+    next_fire_time = Column(AwareDateTime, default=None)
+
+
+class Lock(Base):
+    """A lock shared among the replicas of the app, held until it expires"""
+
+    __tablename__ = "locks"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, default=None)
+    expires_at = Column(AwareDateTime, default=None)
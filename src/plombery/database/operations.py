@@ -2,12 +2,10 @@ import os
 from pathlib import Path
 from alembic import command
 from alembic.config import Config
-from sqlalchemy import inspect, and_, or_
+from sqlalchemy import inspect
 
-from plombery.constants import MANUAL_TRIGGER_ID
 from plombery.database.base import Base, SessionLocal, engine
-from plombery.database.models import PipelineRun
-from plombery.schemas import PipelineRunStatus
+from plombery.database.repository import cancel_interrupted_pipeline_runs
 
 
 INITIAL_REVISION_ID = "cd90ef97cbc9"
@@ -67,26 +65,13 @@ def _mark_cancelled_runs():
     """
     Mark stuck runs as cancelled at the service startup, this is needed when the service restarts
     while some runs are still running.
-    In the future this should be handled better, think if there are multiple nodes, this would
-    mark running jobs as cancelled while they're run by another node.
+    Pending runs are instead kept as they're queued again by the orchestrator.
+    Runs owned by a worker or by a replica of the app are skipped as they may still be
+    running on another node, they're cancelled only when their lease expires, so only
+    the runs stored before their owner was recorded are cancelled here.
     """
 
-    stuck_runs_filter = or_(
-        PipelineRun.status == PipelineRunStatus.RUNNING,
-        and_(
-            PipelineRun.status == PipelineRunStatus.PENDING,
-            PipelineRun.trigger_id == MANUAL_TRIGGER_ID,
-        ),
-    )
-
-    with SessionLocal() as db:
-        db.query(PipelineRun).filter(stuck_runs_filter).update(
-            dict(
-                status=PipelineRunStatus.CANCELLED,
-            )
-        )
-
-        db.commit()
+    cancel_interrupted_pipeline_runs()
 
 
 def setup_database():
@@ -1,66 +1,319 @@
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime, timezone
+
+from sqlalchemy import Select, and_, func, not_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
 from plombery.schemas import PipelineRunStatus
 
 from .base import SessionLocal
 from .schemas import PipelineRunCreate
-from . import models
+from . import models, rollups
+
+_ACTIVE_STATUSES = (PipelineRunStatus.PENDING, PipelineRunStatus.RUNNING)
 
 
 def create_pipeline_run(data: PipelineRunCreate):
     with SessionLocal() as db:
         db.expire_on_commit = False
 
-        created_model = models.PipelineRun(**data.model_dump())
-        db.add(created_model)
+        created_model = _create_pipeline_run(db, data)
+
         db.commit()
         db.refresh(created_model)
     return created_model
 
 
+def _create_pipeline_run(db: Session, data: PipelineRunCreate) -> models.PipelineRun:
+    """Shared by the sync and async repositories,
+    the caller is responsible for committing the session"""
+
+    created_model = models.PipelineRun(**data.model_dump())
+    db.add(created_model)
+
+    if data.status not in _ACTIVE_STATUSES:
+        # i.e. a skipped firing, it never runs so it's counted right away
+        db.flush()
+        db.add_all(_make_task_run_records(created_model))
+        rollups.update_rollups(db, created_model)
+
+    return created_model
+
+
 def update_pipeline_run(
     pipeline_run: models.PipelineRun, end_time: datetime, status: PipelineRunStatus
 ):
+    with SessionLocal() as db:
+        _update_pipeline_run(db, pipeline_run, end_time, status)
+        db.commit()
+
+
+def _update_pipeline_run(
+    db: Session,
+    pipeline_run: models.PipelineRun,
+    end_time: datetime,
+    status: PipelineRunStatus,
+):
+    """Shared by the sync and async repositories,
+    the caller is responsible for committing the session.
+
+    A run that already ended keeps its status, i.e. when it was cancelled
+    by another replica while it was still running here.
+    """
+
+    previous_status = db.scalar(
+        select(models.PipelineRun.status)
+        .where(models.PipelineRun.id == pipeline_run.id)
+        .with_for_update()
+    )
+
+    if previous_status is not None and previous_status not in _ACTIVE_STATUSES:
+        status = PipelineRunStatus(previous_status)
+
     pipeline_run.duration = (end_time - pipeline_run.start_time).total_seconds() * 1000
     pipeline_run.status = status.value
-    with SessionLocal() as db:
 
-        db.query(models.PipelineRun).filter(
-            models.PipelineRun.id == pipeline_run.id
-        ).update(
-            dict(
-                duration=pipeline_run.duration,
-                status=pipeline_run.status,
-                tasks_run=pipeline_run.tasks_run,
-            )
+    values = dict(
+        start_time=pipeline_run.start_time,
+        duration=pipeline_run.duration,
+        wait_duration=pipeline_run.wait_duration,
+        status=pipeline_run.status,
+        tasks_run=pipeline_run.tasks_run,
+    )
+
+    if status == PipelineRunStatus.RUNNING and pipeline_run.worker_id:
+        # The process starting the run owns it, see `renew_pipeline_run_leases`
+        values.update(
+            worker_id=pipeline_run.worker_id,
+            lease_expires_at=pipeline_run.lease_expires_at,
         )
-        db.commit()
 
+    db.query(models.PipelineRun).filter(
+        models.PipelineRun.id == pipeline_run.id
+    ).update(values)
 
-def list_pipeline_runs(
-    pipeline_id: Optional[str] = None, trigger_id: Optional[str] = None
+    if status not in _ACTIVE_STATUSES:
+        _store_finished_run(db, pipeline_run, previous_status)
+
+
+def _store_finished_run(
+    db: Session, pipeline_run: models.PipelineRun, previous_status: Optional[str]
 ):
+    """Store the tasks of a finished run and update the stats rollups"""
+
+    db.query(models.TaskRunRecord).filter(
+        models.TaskRunRecord.pipeline_run_id == pipeline_run.id
+    ).delete(synchronize_session=False)
+    db.add_all(_make_task_run_records(pipeline_run))
+
+    # Count the run only once, even if its status is updated again,
+    # i.e. when a worker finalizes a run that was cancelled meanwhile
+    if previous_status in _ACTIVE_STATUSES:
+        rollups.update_rollups(db, pipeline_run)
+
+
+def _end_pipeline_runs(db: Session, status: PipelineRunStatus, *filters) -> int:
+    """
+    Move the active runs matching the filters to an ended status and add them
+    to the rollups, the caller is responsible for committing the session.
+
+    The rows are locked, so a run ended concurrently by another
+    process isn't counted twice.
+
+    Returns:
+        int: the number of ended runs
+    """
+
+    pipeline_runs: List[models.PipelineRun] = (
+        db.query(models.PipelineRun)
+        .filter(*filters, models.PipelineRun.status.in_(_ACTIVE_STATUSES))
+        .with_for_update()
+        .all()
+    )
+    now = datetime.now(tz=timezone.utc)
+
+    for pipeline_run in pipeline_runs:
+        if pipeline_run.status == PipelineRunStatus.RUNNING:
+            pipeline_run.duration = (
+                now - pipeline_run.start_time
+            ).total_seconds() * 1000
+
+        pipeline_run.status = status.value
+        rollups.update_rollups(db, pipeline_run)
+
+    return len(pipeline_runs)
+
+
+def _make_task_run_records(
+    pipeline_run: models.PipelineRun,
+) -> List[models.TaskRunRecord]:
+    return [
+        models.TaskRunRecord(
+            pipeline_run_id=pipeline_run.id,
+            pipeline_id=pipeline_run.pipeline_id,
+            task_id=task_run.task_id,
+            status=task_run.status,
+            start_time=task_run.start_time,
+            duration=task_run.duration,
+            has_output=task_run.has_output,
+            output_size=task_run.output_size,
+            output_format=task_run.output_format,
+            cached=task_run.cached,
+        )
+        for task_run in pipeline_run.tasks_run or []
+    ]
+
+
+DEFAULT_PAGE_SIZE = 30
+
+
+def _list_pipeline_runs_query(
+    pipeline_id: Optional[str] = None,
+    trigger_id: Optional[str] = None,
+    status: Optional[Iterable[PipelineRunStatus]] = None,
+    reason: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Select:
+    """
+    Query a page of runs, the page starts right before `before_id` or,
+    if `after_id` is set, right after it, in this case the runs are
+    sorted by ascending ID so the page is adjacent to the cursor.
+    """
+
     filters = []
     if pipeline_id:
         filters.append(models.PipelineRun.pipeline_id == pipeline_id)
     if trigger_id:
         filters.append(models.PipelineRun.trigger_id == trigger_id)
+    if status:
+        filters.append(models.PipelineRun.status.in_(list(status)))
+    if reason:
+        filters.append(models.PipelineRun.reason == reason)
+    if started_after:
+        filters.append(models.PipelineRun.start_time >= started_after)
+    if started_before:
+        filters.append(models.PipelineRun.start_time < started_before)
+    if before_id:
+        filters.append(models.PipelineRun.id < before_id)
+
+    order_by = models.PipelineRun.id.desc()
+
+    if after_id:
+        filters.append(models.PipelineRun.id > after_id)
+        order_by = models.PipelineRun.id.asc()
+
+    return (
+        select(models.PipelineRun).filter(*filters).order_by(order_by).limit(page_size)
+    )
+
+
+def list_pipeline_runs(
+    pipeline_id: Optional[str] = None,
+    trigger_id: Optional[str] = None,
+    status: Optional[Iterable[PipelineRunStatus]] = None,
+    reason: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> List[models.PipelineRun]:
+    """List a page of runs, newest first, filtered by the given arguments"""
+
+    query = _list_pipeline_runs_query(
+        pipeline_id=pipeline_id,
+        trigger_id=trigger_id,
+        status=status,
+        reason=reason,
+        started_after=started_after,
+        started_before=started_before,
+        before_id=before_id,
+        after_id=after_id,
+        page_size=page_size,
+    )
+
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        pipeline_runs = list(db.scalars(query).all())
+
+    return sorted(pipeline_runs, key=lambda run: run.id, reverse=True)
 
+
+def list_pending_pipeline_runs() -> List[models.PipelineRun]:
     with SessionLocal() as db:
         db.expire_on_commit = False
 
         pipeline_runs: List[models.PipelineRun] = (
             db.query(models.PipelineRun)
-            .filter(*filters)
-            .order_by(models.PipelineRun.id.desc())
-            .limit(30)
+            .filter(models.PipelineRun.status == PipelineRunStatus.PENDING)
+            .order_by(models.PipelineRun.id)
             .all()
         )
 
     return pipeline_runs
 
 
+def _list_task_runs_query(
+    pipeline_id: str,
+    task_id: str,
+    status: Optional[Iterable[PipelineRunStatus]] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Select:
+    """Same as `_list_pipeline_runs_query` but for the runs of a task"""
+
+    filters = [
+        models.TaskRunRecord.pipeline_id == pipeline_id,
+        models.TaskRunRecord.task_id == task_id,
+    ]
+    if status:
+        filters.append(models.TaskRunRecord.status.in_(list(status)))
+    if started_after:
+        filters.append(models.TaskRunRecord.start_time >= started_after)
+    if started_before:
+        filters.append(models.TaskRunRecord.start_time < started_before)
+    if before_id:
+        filters.append(models.TaskRunRecord.id < before_id)
+
+    order_by = models.TaskRunRecord.id.desc()
+
+    if after_id:
+        filters.append(models.TaskRunRecord.id > after_id)
+        order_by = models.TaskRunRecord.id.asc()
+
+    return (
+        select(models.TaskRunRecord)
+        .filter(*filters)
+        .order_by(order_by)
+        .limit(page_size)
+    )
+
+
+def list_task_runs(
+    pipeline_id: str, task_id: str, **filters
+) -> List[models.TaskRunRecord]:
+    """List a page of the runs of a task, newest first, see
+    `_list_task_runs_query` for the filters"""
+
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        task_runs = list(
+            db.scalars(_list_task_runs_query(pipeline_id, task_id, **filters)).all()
+        )
+
+    return sorted(task_runs, key=lambda task_run: task_run.id, reverse=True)
+
+
 def get_pipeline_run(pipeline_run_id: int) -> Optional[models.PipelineRun]:
     with SessionLocal() as db:
 
@@ -85,3 +338,411 @@ def get_latest_pipeline_run(pipeline_id, trigger_id):
         )
 
     return pipeline_run
+
+
+def list_active_pipeline_runs(
+    pipeline_id: str, trigger_id: str
+) -> List[models.PipelineRun]:
+    """List the pending and running runs of a trigger"""
+
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        pipeline_runs: List[models.PipelineRun] = (
+            db.query(models.PipelineRun)
+            .filter(
+                models.PipelineRun.pipeline_id == pipeline_id,
+                models.PipelineRun.trigger_id == trigger_id,
+                models.PipelineRun.status.in_(_ACTIVE_STATUSES),
+            )
+            .all()
+        )
+
+    return pipeline_runs
+
+
+def cancel_pipeline_run(pipeline_run_id: int) -> bool:
+    """Mark a run as cancelled if it's pending or running,
+    when a worker is running it, it will stop at the next heartbeat.
+
+    Returns:
+        bool: False if the run is not pending nor running
+    """
+
+    with SessionLocal() as db:
+        cancelled = _end_pipeline_runs(
+            db, PipelineRunStatus.CANCELLED, models.PipelineRun.id == pipeline_run_id
+        )
+        db.commit()
+
+    return cancelled > 0
+
+
+def claim_pipeline_run(
+    worker_id: str,
+    lease_expires_at: datetime,
+    pipeline_ids: Iterable[str],
+    excluded_pipeline_ids: Iterable[str] = (),
+    excluded_triggers: Iterable[Tuple[str, str]] = (),
+) -> Optional[models.PipelineRun]:
+    """
+    Claim the oldest pending run that isn't claimed by other workers yet.
+
+    On PostgreSQL the row is locked with `SELECT ... FOR UPDATE SKIP LOCKED`,
+    so concurrent workers skip it, on other DBs the run is claimed with an
+    atomic conditional `UPDATE`, if another worker was faster the next run is tried.
+
+    Args:
+        worker_id (str): the ID of the worker claiming the run
+        lease_expires_at (datetime): the worker must renew the claim before this time
+        pipeline_ids (Iterable[str]): the pipelines the worker can run
+        excluded_pipeline_ids (Iterable[str]): pipelines to skip, i.e. because
+            they reached their max concurrent runs
+        excluded_triggers (Iterable[Tuple[str, str]]): (pipeline ID, trigger ID)
+            pairs to skip, i.e. triggers with a queue overlap policy that
+            are already running
+
+    Returns:
+        Optional[models.PipelineRun]: the claimed run, if any
+    """
+
+    filters = [
+        models.PipelineRun.status == PipelineRunStatus.PENDING,
+        models.PipelineRun.worker_id.is_(None),
+        models.PipelineRun.pipeline_id.in_(list(pipeline_ids)),
+        models.PipelineRun.pipeline_id.not_in(list(excluded_pipeline_ids)),
+    ]
+
+    for pipeline_id, trigger_id in excluded_triggers:
+        filters.append(
+            not_(
+                and_(
+                    models.PipelineRun.pipeline_id == pipeline_id,
+                    models.PipelineRun.trigger_id == trigger_id,
+                )
+            )
+        )
+
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        query = (
+            db.query(models.PipelineRun)
+            .filter(*filters)
+            .order_by(models.PipelineRun.id)
+        )
+
+        if db.get_bind().dialect.name == "postgresql":
+            pipeline_run = query.with_for_update(skip_locked=True).first()
+
+            if pipeline_run:
+                pipeline_run.worker_id = worker_id
+                pipeline_run.lease_expires_at = lease_expires_at
+                db.commit()
+
+            return pipeline_run
+
+        candidates = [candidate.id for candidate in query.limit(10)]
+
+        for candidate_id in candidates:
+            claimed = (
+                db.query(models.PipelineRun)
+                .filter(
+                    models.PipelineRun.id == candidate_id,
+                    models.PipelineRun.status == PipelineRunStatus.PENDING,
+                    models.PipelineRun.worker_id.is_(None),
+                )
+                .update(
+                    dict(worker_id=worker_id, lease_expires_at=lease_expires_at),
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+
+            if claimed:
+                return db.get(models.PipelineRun, candidate_id)
+
+    return None
+
+
+def renew_pipeline_run_leases(
+    worker_id: str, pipeline_run_ids: Iterable[int], lease_expires_at: datetime
+) -> Set[int]:
+    """
+    Extend the leases of the runs claimed by a worker, or started
+    by a replica of the app in local mode.
+
+    Returns:
+        Set[int]: the IDs of the runs that were renewed, the missing ones are not
+            owned by the worker anymore or are not active anymore,
+            i.e. they have been cancelled
+    """
+
+    filters = [
+        models.PipelineRun.id.in_(list(pipeline_run_ids)),
+        models.PipelineRun.worker_id == worker_id,
+        models.PipelineRun.status.in_(_ACTIVE_STATUSES),
+    ]
+
+    with SessionLocal() as db:
+        db.query(models.PipelineRun).filter(*filters).update(
+            dict(lease_expires_at=lease_expires_at), synchronize_session=False
+        )
+        db.commit()
+
+        renewed = db.query(models.PipelineRun.id).filter(*filters).all()
+
+    return {pipeline_run_id for (pipeline_run_id,) in renewed}
+
+
+def release_expired_pipeline_runs(now: datetime):
+    """
+    Handle the runs claimed by workers that stopped sending heartbeats:
+    pending runs are released so another worker can claim them,
+    while running runs are marked as cancelled.
+    """
+
+    with SessionLocal() as db:
+        expired = [
+            models.PipelineRun.worker_id.is_not(None),
+            models.PipelineRun.lease_expires_at < now,
+        ]
+
+        db.query(models.PipelineRun).filter(
+            *expired, models.PipelineRun.status == PipelineRunStatus.PENDING
+        ).update(dict(worker_id=None, lease_expires_at=None), synchronize_session=False)
+        _end_pipeline_runs(
+            db,
+            PipelineRunStatus.CANCELLED,
+            *expired,
+            models.PipelineRun.status == PipelineRunStatus.RUNNING,
+        )
+
+        db.commit()
+
+
+def cancel_interrupted_pipeline_runs():
+    """Mark as cancelled the running runs without an owner,
+    see `operations._mark_cancelled_runs`"""
+
+    with SessionLocal() as db:
+        _end_pipeline_runs(
+            db,
+            PipelineRunStatus.CANCELLED,
+            models.PipelineRun.status == PipelineRunStatus.RUNNING,
+            models.PipelineRun.worker_id.is_(None),
+        )
+        db.commit()
+
+
+def count_claimed_pipeline_runs() -> Dict[Tuple[str, str], int]:
+    """Count the active runs claimed by workers, by pipeline and trigger"""
+
+    with SessionLocal() as db:
+        counts = (
+            db.query(
+                models.PipelineRun.pipeline_id,
+                models.PipelineRun.trigger_id,
+                func.count(),
+            )
+            .filter(
+                models.PipelineRun.status.in_(_ACTIVE_STATUSES),
+                models.PipelineRun.worker_id.is_not(None),
+            )
+            .group_by(models.PipelineRun.pipeline_id, models.PipelineRun.trigger_id)
+            .all()
+        )
+
+    return {
+        (pipeline_id, trigger_id): count for pipeline_id, trigger_id, count in counts
+    }
+
+
+def acquire_lock(name: str, holder: str, expires_at: datetime, now: datetime) -> bool:
+    """
+    Acquire or renew a lock, it succeeds if the lock is free,
+    it's expired or it's already held by the same holder.
+
+    Returns:
+        bool: True if the lock is held by `holder` until `expires_at`
+    """
+
+    with SessionLocal() as db:
+        acquired = (
+            db.query(models.Lock)
+            .filter(
+                models.Lock.name == name,
+                or_(
+                    models.Lock.holder == holder,
+                    models.Lock.holder.is_(None),
+                    models.Lock.expires_at < now,
+                ),
+            )
+            .update(
+                dict(holder=holder, expires_at=expires_at), synchronize_session=False
+            )
+        )
+        db.commit()
+
+        if acquired:
+            return True
+
+        if db.get(models.Lock, name):
+            return False
+
+        # First time the lock is used
+        try:
+            db.add(models.Lock(name=name, holder=holder, expires_at=expires_at))
+            db.commit()
+        except IntegrityError:
+            # Another replica created it in the meanwhile
+            db.rollback()
+            return False
+
+    return True
+
+
+def release_lock(name: str, holder: str):
+    with SessionLocal() as db:
+        db.query(models.Lock).filter(
+            models.Lock.name == name, models.Lock.holder == holder
+        ).update(dict(holder=None, expires_at=None), synchronize_session=False)
+        db.commit()
+
+
+def get_trigger_state(
+    pipeline_id: str, trigger_id: str
+) -> Optional[models.TriggerState]:
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        return db.get(models.TriggerState, (pipeline_id, trigger_id))
+
+
+def save_trigger_state(
+    pipeline_id: str,
+    trigger_id: str,
+    next_fire_time: Optional[datetime],
+    last_fire_time: Optional[datetime] = None,
+):
+    """Store the next fire time of a trigger and, if it just fired, its last fire time"""
+
+    with SessionLocal() as db:
+        trigger_state = db.get(models.TriggerState, (pipeline_id, trigger_id))
+
+        if not trigger_state:
+            trigger_state = models.TriggerState(
+                pipeline_id=pipeline_id, trigger_id=trigger_id
+            )
+            db.add(trigger_state)
+
+        trigger_state.next_fire_time = next_fire_time
+
+        if last_fire_time:
+            trigger_state.last_fire_time = last_fire_time
+
+        db.commit()
+
+
+def _list_run_rollups_query(
+    granularity: str,
+    pipeline_id: Optional[str] = None,
+    trigger_id: Optional[str] = None,
+    task_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Select:
+    """
+    Query the rollups in a time range, sorted by time, if `task_id`
+    is None the rollups of the whole runs are returned.
+    """
+
+    filters = [
+        models.RunRollup.granularity == granularity,
+        models.RunRollup.task_id == (task_id or ""),
+    ]
+    if pipeline_id:
+        filters.append(models.RunRollup.pipeline_id == pipeline_id)
+    if trigger_id:
+        filters.append(models.RunRollup.trigger_id == trigger_id)
+    if since:
+        filters.append(
+            models.RunRollup.bucket_start
+            >= rollups.get_bucket_start(since, granularity)
+        )
+    if until:
+        filters.append(models.RunRollup.bucket_start < until)
+
+    return (
+        select(models.RunRollup)
+        .filter(*filters)
+        .order_by(models.RunRollup.bucket_start)
+    )
+
+
+def list_run_rollups(granularity: str, **filters) -> List[models.RunRollup]:
+    """See `_list_run_rollups_query` for the filters"""
+
+    with SessionLocal() as db:
+        db.expire_on_commit = False
+
+        return list(db.scalars(_list_run_rollups_query(granularity, **filters)).all())
+
+
+def list_runs_pipeline_ids() -> List[str]:
+    """IDs of the pipelines having some runs, even if not registered anymore"""
+
+    with SessionLocal() as db:
+        return list(db.scalars(select(models.PipelineRun.pipeline_id).distinct()))
+
+
+def list_ended_pipeline_run_ids(
+    pipeline_id: str,
+    skip: int = 0,
+    started_before: Optional[datetime] = None,
+    limit: Optional[int] = None,
+) -> List[int]:
+    """IDs of the ended runs of a pipeline, from the most recent one"""
+
+    filters = [
+        models.PipelineRun.pipeline_id == pipeline_id,
+        models.PipelineRun.status.notin_(_ACTIVE_STATUSES),
+    ]
+    if started_before:
+        filters.append(models.PipelineRun.start_time < started_before)
+
+    query = (
+        select(models.PipelineRun.id)
+        .filter(*filters)
+        .order_by(models.PipelineRun.start_time.desc(), models.PipelineRun.id.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+
+    with SessionLocal() as db:
+        return list(db.scalars(query))
+
+
+def delete_pipeline_runs(pipeline_run_ids: List[int]) -> int:
+    """Delete some runs and their tasks, the rollups are kept so
+    the stats still count them
+
+    Returns:
+        int: the number of deleted runs
+    """
+
+    with SessionLocal() as db:
+        # SQLite enforces the ON DELETE CASCADE only if the foreign keys
+        # pragma is enabled, so the tasks are deleted explicitly
+        db.query(models.TaskRunRecord).filter(
+            models.TaskRunRecord.pipeline_run_id.in_(pipeline_run_ids)
+        ).delete(synchronize_session=False)
+
+        deleted = (
+            db.query(models.PipelineRun)
+            .filter(models.PipelineRun.id.in_(pipeline_run_ids))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+
+    return deleted
@@ -0,0 +1,195 @@
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from plombery.schemas import PipelineRunStatus, RunStats
+
+from . import models
+
+GRANULARITIES = ("hour", "day")
+
+DURATION_BINS: List[float] = [
+    edge * 1000
+    for edge in (
+        0.01,
+        0.02,
+        0.05,
+        0.1,
+        0.2,
+        0.5,
+        1,
+        2,
+        5,
+        10,
+        20,
+        30,
+        60,
+        120,
+        300,
+        600,
+        1200,
+        1800,
+        3600,
+        7200,
+        21600,
+    )
+]
+"""Upper bounds, in milliseconds, of the durations histogram bins,
+the last bin holds the durations longer than the last bound"""
+
+
+def get_bucket_start(time: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return time.replace(minute=0, second=0, microsecond=0)
+
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def update_rollups(db: Session, pipeline_run: models.PipelineRun):
+    """
+    Add a finished run and its tasks to the hourly and daily rollups,
+    the caller is responsible for committing the session.
+    """
+
+    items: List[Tuple[str, str, Optional[float]]] = [
+        ("", pipeline_run.status, pipeline_run.duration)
+    ] + [
+        (task_run.task_id, task_run.status, task_run.duration)
+        for task_run in pipeline_run.tasks_run or []
+    ]
+
+    for granularity in GRANULARITIES:
+        bucket_start = get_bucket_start(pipeline_run.start_time, granularity)
+
+        for task_id, status, duration in items:
+            rollup = _get_or_create_rollup(
+                db,
+                granularity=granularity,
+                bucket_start=bucket_start,
+                pipeline_id=pipeline_run.pipeline_id,
+                trigger_id=pipeline_run.trigger_id,
+                task_id=task_id,
+            )
+            _add_to_rollup(rollup, status, duration)
+
+
+def _get_or_create_rollup(db: Session, **key) -> models.RunRollup:
+    query = db.query(models.RunRollup).filter_by(**key).with_for_update()
+
+    if rollup := query.one_or_none():
+        return rollup
+
+    try:
+        # The savepoint avoids rolling back the whole transaction
+        # if another process created the same rollup in the meanwhile
+        with db.begin_nested():
+            rollup = models.RunRollup(**key, histogram=[0] * (len(DURATION_BINS) + 1))
+            db.add(rollup)
+    except IntegrityError:
+        rollup = query.one()
+
+    return rollup
+
+
+def _add_to_rollup(rollup: models.RunRollup, status: str, duration: Optional[float]):
+    rollup.count = (rollup.count or 0) + 1
+
+    if status == PipelineRunStatus.COMPLETED:
+        rollup.completed = (rollup.completed or 0) + 1
+    elif status == PipelineRunStatus.FAILED:
+        rollup.failed = (rollup.failed or 0) + 1
+    elif status == PipelineRunStatus.CANCELLED:
+        rollup.cancelled = (rollup.cancelled or 0) + 1
+    elif status == PipelineRunStatus.SKIPPED:
+        rollup.skipped = (rollup.skipped or 0) + 1
+
+    # Skipped and never run items would drag the durations toward zero
+    if duration is None or status == PipelineRunStatus.SKIPPED:
+        return
+
+    rollup.total_duration = (rollup.total_duration or 0) + duration
+    rollup.min_duration = min(
+        duration, rollup.min_duration if rollup.min_duration is not None else duration
+    )
+    rollup.max_duration = max(duration, rollup.max_duration or 0)
+
+    # Assign a new list so SQLAlchemy detects the change
+    histogram = list(rollup.histogram)
+    histogram[bisect_right(DURATION_BINS, duration)] += 1
+    rollup.histogram = histogram
+
+
+def merge_rollups(
+    rollups: Iterable[models.RunRollup], bucket_start: Optional[datetime] = None
+) -> RunStats:
+    """Merge many rollups into a single stats object,
+    the durations percentiles are estimated from the histograms.
+    Skipped runs are left out of the success rate and of the durations."""
+
+    stats = RunStats(bucket_start=bucket_start)
+    histogram = [0] * (len(DURATION_BINS) + 1)
+    total_duration = 0.0
+
+    for rollup in rollups:
+        stats.count += rollup.count
+        stats.completed += rollup.completed
+        stats.failed += rollup.failed
+        stats.cancelled += rollup.cancelled
+        stats.skipped += rollup.skipped
+        total_duration += rollup.total_duration
+
+        if rollup.min_duration is not None:
+            stats.min_duration = min(
+                rollup.min_duration,
+                (
+                    stats.min_duration
+                    if stats.min_duration is not None
+                    else rollup.min_duration
+                ),
+            )
+        if rollup.max_duration is not None:
+            stats.max_duration = max(rollup.max_duration, stats.max_duration or 0)
+
+        for i, bin_count in enumerate(rollup.histogram):
+            histogram[i] += bin_count
+
+    if not stats.count:
+        return stats
+
+    if ran_count := stats.count - stats.skipped:
+        stats.success_rate = stats.completed / ran_count
+
+    # The histogram only counts the items that have a duration
+    if timed_count := sum(histogram):
+        stats.avg_duration = total_duration / timed_count
+
+    stats.p50_duration = _estimate_percentile(histogram, 0.5, stats)
+    stats.p95_duration = _estimate_percentile(histogram, 0.95, stats)
+    stats.p99_duration = _estimate_percentile(histogram, 0.99, stats)
+
+    return stats
+
+
+def _estimate_percentile(histogram: List[int], percentile: float, stats: RunStats):
+    """Interpolate linearly inside the bin containing the percentile,
+    the result is clamped to the observed min and max durations"""
+
+    rank = percentile * sum(histogram)
+    cumulative = 0
+
+    for i, bin_count in enumerate(histogram):
+        if not bin_count or cumulative + bin_count < rank:
+            cumulative += bin_count
+            continue
+
+        lower = DURATION_BINS[i - 1] if i > 0 else 0
+        upper = DURATION_BINS[i] if i < len(DURATION_BINS) else stats.max_duration
+        lower = max(lower, stats.min_duration)
+        upper = min(upper, stats.max_duration)
+
+        return lower + (upper - lower) * (rank - cumulative) / bin_count
+
+    return stats.max_duration
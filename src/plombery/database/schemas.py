@@ -22,7 +22,32 @@ class PipelineRunBase(BaseModel):
 class PipelineRun(PipelineRunBase):
     id: int
     duration: float
+    wait_duration: Optional[float] = 0
+    """Time spent in the queue before starting, in milliseconds"""
+    queue_position: Optional[int] = None
+    """Position in the queue of a pending run, starting from 1"""
+    worker_id: Optional[str] = None
+    """ID of the worker executing the run, when running with workers"""
 
 
 class PipelineRunCreate(PipelineRunBase):
     pass
+
+
+class TaskRunRecord(BaseModel):
+    id: int
+    pipeline_run_id: int
+    pipeline_id: str
+    task_id: str
+    status: PipelineRunStatus
+    start_time: Optional[datetime] = None
+    duration: float = 0
+    """Task duration in milliseconds"""
+    has_output: bool = False
+    output_size: Optional[int] = None
+    """Size of the stored output in bytes"""
+    output_format: Optional[str] = None
+    cached: bool = False
+
+    class Config:
+        from_attributes = True
@@ -57,5 +57,7 @@ class AwareDateTime(sa.types.TypeDecorator):
 
     impl = DateTime
 
+    cache_ok = True
+
     def process_result_value(self, value: datetime.datetime, dialect):
-        return value.replace(tzinfo=datetime.timezone.utc)
+        return value.replace(tzinfo=datetime.timezone.utc) if value else None
@@ -8,3 +8,22 @@ class InvalidDataPath(Exception):
         message = f"The path {path} is invalid"
         super().__init__(message)
         self.path = path
+
+
+class TaskTimeout(Exception):
+    def __init__(self, task_id: str, timeout: float) -> None:
+        super().__init__(f"The task {task_id} timed out after {timeout:g}s")
+        self.task_id = task_id
+        self.timeout = timeout
+
+
+class TaskCancelled(BaseException):
+    """Raised in a task that has been cancelled. Like `asyncio.CancelledError`,
+    it's not an `Exception`, so it's not caught by generic error handlers"""
+
+    def __init__(self) -> None:
+        super().__init__("The task was cancelled")
+
+    def __reduce__(self):
+        # Sent back by the worker processes, that interrupt the cancelled calls
+        return (type(self), ())
@@ -1,10 +1,93 @@
 import logging
+from multiprocessing.queues import Queue
+from typing import Dict, Optional
 
+from plombery.config import settings
 from plombery.logger.formatter import JsonFormatter
-from plombery.logger.web_socket_handler import queue_handler
-from plombery.orchestrator.data_storage import get_logs_filename
+from plombery.logger.process_handler import ProcessQueueHandler
+from plombery.logger.sink import RunLogSink
+from plombery.logger.web_socket_handler import websocket_handler
+from plombery.orchestrator.data_storage import compress_logs_file, get_logs_filename
 from plombery.pipeline.context import task_context, run_context, pipeline_context
 
+# Set only in worker processes, see `forward_logs_to_queue`
+_process_handler: Optional[ProcessQueueHandler] = None
+
+# Shared by all the handlers, so each record is formatted only once,
+# the pipeline and task are read from the records
+_json_formatter = JsonFormatter()
+websocket_handler.setFormatter(_json_formatter)
+
+_run_sinks: Dict[int, RunLogSink] = {}
+
+
+def open_run_logs(pipeline_run_id: int) -> RunLogSink:
+    """Open the logs file of a run, it's called by the executor when the run
+    starts, the file stays open until `close_run_logs` is called.
+
+    Args:
+        pipeline_run_id (int): the run ID
+
+    Returns:
+        RunLogSink: the handler writing the logs of the run
+    """
+
+    if sink := _run_sinks.get(pipeline_run_id):
+        return sink
+
+    sink = RunLogSink(
+        get_logs_filename(pipeline_run_id),
+        buffer_size=settings.logs_buffer_size,
+        flush_interval=settings.logs_flush_interval,
+    )
+    sink.setFormatter(_json_formatter)
+    _run_sinks[pipeline_run_id] = sink
+
+    return sink
+
+
+def close_run_logs(pipeline_run_id: int):
+    """Detach the loggers of a run from its logs file, then flush and close it,
+    the file is compressed if `settings.data_compression` is enabled.
+
+    Args:
+        pipeline_run_id (int): the run ID
+    """
+
+    if not (sink := _run_sinks.pop(pipeline_run_id, None)):
+        return
+
+    for logger in sink.loggers:
+        logger.removeHandler(sink)
+        logger.removeHandler(websocket_handler)
+
+    sink.close()
+    compress_logs_file(pipeline_run_id)
+
+
+def forward_logs_to_queue(queue: Queue):
+    """Send the logs of the current (worker) process to the main
+    process via a queue, instead of writing them directly.
+
+    Args:
+        queue (Queue): multiprocessing queue read by the main process
+    """
+
+    global _process_handler
+    _process_handler = ProcessQueueHandler(queue)
+
+
+def send_process_logs_done(call_id: str):
+    """In a worker process, tell the main process that a task call
+    has sent all its logs.
+
+    Args:
+        call_id (str): ID of the task call
+    """
+
+    if _process_handler:
+        _process_handler.send_call_done(call_id)
+
 
 def get_logger() -> logging.LoggerAdapter:
     """Get a logger for a task or pipeline. This function uses contexts
@@ -19,20 +102,10 @@ def get_logger() -> logging.LoggerAdapter:
     task = task_context.get(None)
     pipeline_run = run_context.get()
 
-    filename = get_logs_filename(pipeline_run.id)
-
-    json_formatter = JsonFormatter(pipeline=pipeline.id, task=task.id if task else None)
-
-    json_handler = logging.FileHandler(filename)
-    json_handler.setFormatter(json_formatter)
-
-    websocket_handler = queue_handler
-    websocket_handler.setFormatter(json_formatter)
-
     # Create a logger that's unique for each pipeline run
     # and not simply for each pipeline, otherwise successive
     # runs will always use the same log file because
-    # `json_handler` wouldn't be added the logger, because,
+    # the run sink wouldn't be added the logger, because,
     # in turn, `logger` is always the same instance.
     #
     # This fixes issue #131:
@@ -51,8 +124,15 @@ def get_logger() -> logging.LoggerAdapter:
     # The `getLogger` returns a previously created logger
     # if any, so be sure not to re-add the same handlers again
     if not logger.handlers:
-        logger.addHandler(json_handler)
-        logger.addHandler(websocket_handler)
+        if _process_handler:
+            # In a worker process, the logs are written by the main process
+            logger.addHandler(_process_handler)
+        else:
+            sink = open_run_logs(pipeline_run.id)
+            sink.loggers.add(logger)
+
+            logger.addHandler(sink)
+            logger.addHandler(websocket_handler)
 
     extra_log_info = {
         "pipeline": pipeline.id,
@@ -65,12 +145,16 @@ def get_logger() -> logging.LoggerAdapter:
 
 def close_logger(logger: logging.LoggerAdapter):
     """
-    Close all the resources and file descriptors opened by the logger.
+    Detach the handlers of a logger, the logs file itself is closed
+    when the run ends, see `close_run_logs`.
     Solves issue 491: https://github.com/lucafaggianelli/plombery/issues/491
 
     Args:
         logger (logging.LoggerAdapter): logger obtained with get_logger
     """
-    for handler in logger.logger.handlers:
+    # Iterate over a copy as handlers are removed from the list
+    for handler in list(logger.logger.handlers):
         logger.logger.removeHandler(handler)
-        handler.close()
+
+        if isinstance(handler, RunLogSink):
+            handler.loggers.discard(logger.logger)
@@ -1,7 +1,12 @@
 import logging
 import json
-from time import gmtime
-from typing import Optional
+from time import gmtime, strftime
+from typing import Callable, Optional, Tuple
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
 
 
 DEFAULT_LOG_ATTRIBUTES = {
@@ -12,22 +17,42 @@ DEFAULT_LOG_ATTRIBUTES = {
 }
 
 
+def _dumps_json(data: dict) -> str:
+    return json.dumps(data, default=str)
+
+
+def _dumps_orjson(data: dict) -> str:
+    try:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    except TypeError:
+        # i.e. integers bigger than 64 bits
+        return _dumps_json(data)
+
+
 class JsonFormatter(logging.Formatter):
     """
     Formatter that outputs JSON strings after parsing the LogRecord.
 
+    Records are formatted for both the logs file and the websocket, so the
+    output is cached in the record, the date is formatted once per second and
+    JSON is serialized with `orjson`, when it's installed.
+
+    @param str pipeline: Pipeline ID, if None it's read from the record extra fields
+    @param str task: Task ID, read from the record as well if the pipeline is None
     @param dict fmt_dict: Key: logging format attribute pairs.
     @param str time_format: time.strftime() format string. Default: "%Y-%m-%dT%H:%M:%S"
     @param str msec_format: Microsecond formatting. Appended at the end. Default: "%s.%03dZ"
+    @param str json_backend: "json" or "orjson", by default orjson if installed
     """
 
     def __init__(
         self,
-        pipeline: str,
+        pipeline: Optional[str] = None,
         task: Optional[str] = None,
         fmt_dict: Optional[dict] = None,
         time_format: str = "%Y-%m-%dT%H:%M:%S",
         msec_format: str = "%s.%03dZ",
+        json_backend: Optional[str] = None,
     ):
         self.pipeline = pipeline
         self.task = task
@@ -39,23 +64,60 @@ class JsonFormatter(logging.Formatter):
         # Store log timestamp in UTC time
         self.converter = gmtime
 
+        if json_backend == "orjson" and not orjson:
+            raise ValueError("The orjson backend requires the orjson package")
+
+        if json_backend is None:
+            json_backend = "orjson" if orjson else "json"
+
+        self.json_backend = json_backend
+        self._dumps: Callable[[dict], str] = (
+            _dumps_orjson if json_backend == "orjson" else _dumps_json
+        )
+
+        # Computed once rather than for each record
+        self._attributes = tuple(self.fmt_dict.items())
+        self._uses_time = "asctime" in self.fmt_dict.values()
+        self._cache_attribute = f"_plombery_json_{id(self)}"
+        self._time_cache: Tuple[int, str] = (-1, "")
+
     def usesTime(self) -> bool:
         """
         Overwritten to look for the attribute in the format dict values instead of the fmt string.
         """
-        return "asctime" in self.fmt_dict.values()
+        return self._uses_time
+
+    def formatTime(self, record, datefmt=None) -> str:
+        """
+        Overwritten to format the date, the slowest part, only once per second.
+        """
+        if datefmt:
+            return super().formatTime(record, datefmt)
+
+        seconds = int(record.created)
+        cached_seconds, formatted = self._time_cache
+
+        if seconds != cached_seconds:
+            formatted = strftime(self.default_time_format, self.converter(seconds))
+            self._time_cache = (seconds, formatted)
+
+        return self.default_msec_format % (formatted, record.msecs)
 
     def formatMessage(self, record) -> dict:
         """
         Overwritten to return a dictionary of the relevant LogRecord attributes instead of a string.
         KeyError is raised if an unknown attribute is provided in the fmt_dict.
         """
-        msg = {
-            fmt_key: record.__dict__[fmt_val]
-            for fmt_key, fmt_val in self.fmt_dict.items()
-        }
-        msg["pipeline"] = self.pipeline
-        msg["task"] = self.task
+        record_dict = record.__dict__
+        msg = {fmt_key: record_dict[fmt_val] for fmt_key, fmt_val in self._attributes}
+
+        if self.pipeline:
+            msg["pipeline"] = self.pipeline
+            msg["task"] = self.task
+        else:
+            # Set by the logger adapter returned by `get_logger`
+            msg["pipeline"] = record_dict.get("pipeline")
+            msg["task"] = record_dict.get("task")
 
         return msg
 
@@ -64,9 +126,13 @@ class JsonFormatter(logging.Formatter):
         Mostly the same as the parent's class method, the difference being that a dict is manipulated and dumped as JSON
         instead of a string.
         """
+        # The same record is handled by the run logs file and the websocket
+        if cached := record.__dict__.get(self._cache_attribute):
+            return cached
+
         record.message = record.getMessage()
 
-        if self.usesTime():
+        if self._uses_time:
             record.asctime = self.formatTime(record, self.datefmt)
 
         message_dict = self.formatMessage(record)
@@ -83,4 +149,7 @@ class JsonFormatter(logging.Formatter):
         if record.stack_info:
             message_dict["stack_info"] = self.formatStack(record.stack_info)
 
-        return json.dumps(message_dict, default=str)
+        formatted = self._dumps(message_dict)
+        record.__dict__[self._cache_attribute] = formatted
+
+        return formatted
@@ -0,0 +1,101 @@
+import asyncio
+import copy
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.queues import Queue
+from typing import Dict, Tuple
+
+# Attribute of the record marking the end of the logs of a task call
+_CALL_DONE_ATTRIBUTE = "plombery_call_done"
+
+_calls_waiting_logs: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+_calls_lock = threading.Lock()
+
+
+class ProcessQueueHandler(QueueHandler):
+    """
+    Handler used by tasks running in a worker process to send their logs
+    to the main process, where they're handled by the run's loggers.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the parent method, don't format the message so the main
+        # process can still format it as JSON and keep the traceback apart
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def send_call_done(self, call_id: str):
+        """Mark the end of the logs of a task call, the records of a process
+        are queued in order so all its logs are handled before the marker"""
+
+        self.enqueue(logging.makeLogRecord({_CALL_DONE_ATTRIBUTE: call_id}))
+
+
+def wait_for_call_logs(call_id: str) -> asyncio.Future:
+    """Get a future resolved once all the logs of a task call, sent by a worker
+    process, have been handled. The logs travel on a different queue than
+    the result of the call, so they may arrive later."""
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    with _calls_lock:
+        _calls_waiting_logs[call_id] = (loop, future)
+
+    return future
+
+
+def forget_call_logs(call_id: str):
+    with _calls_lock:
+        _calls_waiting_logs.pop(call_id, None)
+
+
+def _on_call_done(call_id: str):
+    with _calls_lock:
+        waiting = _calls_waiting_logs.pop(call_id, None)
+
+    if not waiting:
+        return
+
+    loop, future = waiting
+
+    def resolve():
+        if not future.done():
+            future.set_result(None)
+
+    try:
+        loop.call_soon_threadsafe(resolve)
+    except RuntimeError:
+        # The loop has been closed in the meanwhile
+        pass
+
+
+class _DispatchHandler(logging.Handler):
+    def handle(self, record: logging.LogRecord) -> bool:
+        if call_id := getattr(record, _CALL_DONE_ATTRIBUTE, None):
+            _on_call_done(call_id)
+            return True
+
+        # The logger with the same name has been already configured
+        # in the main process by `get_logger`
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+def start_logs_listener(queue: Queue) -> QueueListener:
+    """Start a thread that handles in the main process
+    the logs sent by the worker processes"""
+
+    listener = QueueListener(queue, _DispatchHandler())
+    listener.start()
+
+    return listener
@@ -0,0 +1,239 @@
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class LogsFilter:
+    """Select the log entries having at least a given level
+    or logged after a given time"""
+
+    level: Optional[str] = None
+    since: Optional[datetime] = None
+
+    def __post_init__(self):
+        self._min_level = logging.getLevelName(self.level) if self.level else None
+        self._since = _format_timestamp(self.since) if self.since else None
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._min_level and not self._since
+
+    def match(self, line: bytes) -> bool:
+        if self.is_empty:
+            return True
+
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return False
+
+        if self._min_level:
+            # Unknown levels are returned as strings
+            level = logging.getLevelName(entry.get("level"))
+            if not isinstance(level, int) or level < self._min_level:
+                return False
+
+        # The timestamps have a fixed format so they can be compared as strings
+        if self._since and entry.get("timestamp", "") <= self._since:
+            return False
+
+        return True
+
+
+def _format_timestamp(time: datetime) -> str:
+    """Format a datetime like the `JsonFormatter` does"""
+
+    if time.tzinfo:
+        time = time.astimezone(timezone.utc)
+
+    return time.strftime("%Y-%m-%dT%H:%M:%S.") + f"{time.microsecond // 1000:03d}Z"
+
+
+def _get_end_offset(f: BinaryIO) -> int:
+    """Offset of the end of the last complete line, so a line that's being
+    written is never returned"""
+
+    end = f.seek(0, 2)
+    position = end
+
+    while position > 0:
+        size = min(_CHUNK_SIZE, position)
+        f.seek(position - size)
+        chunk = f.read(size)
+
+        if (index := chunk.rfind(b"\n")) != -1:
+            return position - size + index + 1
+
+        position -= size
+
+    return 0
+
+
+def _get_line_start(f: BinaryIO, offset: int, end: int) -> int:
+    """Move the offset to the start of the next line, unless it's already
+    at the start of a line"""
+
+    if offset <= 0:
+        return 0
+    if offset >= end:
+        return end
+
+    f.seek(offset - 1)
+    if f.read(1) == b"\n":
+        return offset
+
+    f.seek(offset)
+    f.readline()
+    return min(f.tell(), end)
+
+
+def _iter_lines(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int]]:
+    """Iterate the lines between 2 offsets with the offset where they end"""
+
+    f.seek(start)
+    position = start
+
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+
+        position += len(line)
+        yield line, position
+
+
+def _iter_lines_reversed(f: BinaryIO, end: int) -> Iterator[Tuple[bytes, int]]:
+    """Iterate the lines before an offset, from the last one,
+    with the offset where they start"""
+
+    position = end
+    # Start of a line split between 2 chunks, with its newline
+    remainder = b""
+
+    while position > 0:
+        size = min(_CHUNK_SIZE, position)
+        position -= size
+        f.seek(position)
+
+        # Both the range and the remainder end with a newline,
+        # so the last item is always empty
+        lines = (f.read(size) + remainder).split(b"\n")[:-1]
+
+        # The 1st line may continue in the previous chunk
+        remainder = lines.pop(0) + b"\n"
+        line_start = position + len(remainder)
+
+        offsets = []
+        for line in lines:
+            offsets.append((line + b"\n", line_start))
+            line_start += len(line) + 1
+
+        yield from reversed(offsets)
+
+    if remainder:
+        yield remainder, 0
+
+
+def find_logs_range(
+    logs_file: BinaryIO,
+    offset: int = 0,
+    before: Optional[int] = None,
+    tail: Optional[int] = None,
+    limit: Optional[int] = None,
+    logs_filter: Optional[LogsFilter] = None,
+) -> Tuple[int, int]:
+    """Find the byte range of a logs file to be read
+
+    Args:
+        logs_file (BinaryIO): the JSONL logs file, open in binary mode
+        offset (int): read from this byte, it's moved to the start of the next
+            line if it's in the middle of a line
+        before (int, optional): read up to this byte, moved like the offset
+        tail (int, optional): read only the last N matching lines of the range
+        limit (int, optional): read at most N matching lines
+        logs_filter (LogsFilter, optional): count only the matching lines
+
+    Returns:
+        Tuple[int, int]: the start and end offsets, the end offset can be used as
+            offset for the next request to get the new logs
+    """
+
+    logs_filter = logs_filter or LogsFilter()
+
+    end = _get_end_offset(logs_file)
+    if before is not None:
+        end = _get_line_start(logs_file, before, end)
+    start = _get_line_start(logs_file, offset, end)
+
+    if tail:
+        matches = 0
+        for line, line_start in _iter_lines_reversed(logs_file, end):
+            if line_start < start:
+                break
+
+            if logs_filter.match(line):
+                matches += 1
+                if matches == tail:
+                    start = line_start
+                    break
+
+    if limit:
+        matches = 0
+        for line, line_end in _iter_lines(logs_file, start, end):
+            if logs_filter.match(line):
+                matches += 1
+                if matches == limit:
+                    end = line_end
+                    break
+
+    return start, end
+
+
+def iter_logs(
+    logs_file: BinaryIO,
+    start: int,
+    end: int,
+    logs_filter: Optional[LogsFilter] = None,
+) -> Iterator[bytes]:
+    """Read the logs between 2 offsets in chunks of lines, so the whole file is
+    never loaded in memory. The file is closed once read"""
+
+    logs_filter = logs_filter or LogsFilter()
+
+    with logs_file as f:
+        if start >= end:
+            return
+
+        if logs_filter.is_empty:
+            f.seek(start)
+            while start < end:
+                chunk = f.read(min(_CHUNK_SIZE, end - start))
+                if not chunk:
+                    break
+
+                start += len(chunk)
+                yield chunk
+            return
+
+        chunk = []
+        chunk_size = 0
+
+        for line, _ in _iter_lines(f, start, end):
+            if not logs_filter.match(line):
+                continue
+
+            chunk.append(line)
+            chunk_size += len(line)
+
+            if chunk_size >= _CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+                chunk_size = 0
+
+        if chunk:
+            yield b"".join(chunk)
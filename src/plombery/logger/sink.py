@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Set
+
+
+class RunLogSink(logging.Handler):
+    """
+    Write the logs of a run to its JSONL file, it's shared by all
+    the loggers of the run, so the file is opened only once.
+
+    The lines are buffered and written when the buffer is full or, at the latest,
+    every `flush_interval` seconds, see `flush_periodically`. When the run ends
+    the sink is closed and the file is synced to disk.
+    """
+
+    def __init__(self, path: Path, buffer_size: int, flush_interval: float):
+        super().__init__()
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.loggers: Set[logging.Logger] = set()
+        """Loggers using the sink, detached when the run ends"""
+
+        # Unbuffered, as the lines are already buffered here, so each
+        # flush is a single write of complete lines
+        self._file: Optional[BinaryIO] = path.open(mode="ab", buffering=0)
+        self._buffer: List[bytes] = []
+        self._buffer_size = 0
+
+    def emit(self, record: logging.LogRecord):
+        # Called with the lock acquired by `handle`
+        if not self._file:
+            return
+
+        try:
+            line = (self.format(record) + "\n").encode("utf-8")
+        except Exception:
+            self.handleError(record)
+            return
+
+        self._buffer.append(line)
+        self._buffer_size += len(line)
+
+        if self._buffer_size >= self.buffer_size:
+            self._write()
+
+    def _write(self):
+        if not self._buffer:
+            return
+
+        self._file.write(b"".join(self._buffer))
+        self._buffer = []
+        self._buffer_size = 0
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._file:
+                self._write()
+        finally:
+            self.release()
+
+    async def flush_periodically(self):
+        """Flush the buffer until the task is cancelled,
+        so the logs of a quiet run are readable while it runs"""
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._file:
+                self._write()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        finally:
+            self.release()
+
+        super().close()
@@ -1,28 +1,145 @@
 import asyncio
 import logging
-import queue
-from logging.handlers import QueueHandler, QueueListener
+import threading
+from typing import Dict, List, Optional
 
 from plombery.logger.log_record import ExtendedLogRecord
-from plombery.websocket import sio
+from plombery.schemas import WebSocketStats
+from plombery.websocket import get_run_room, has_subscribers, sio
 
 
 class WebSocketHandler(logging.Handler):
+    """
+    Send the logs to the clients watching the runs.
+
+    Records can be emitted by any thread, so they're buffered and sent by
+    the event loop of the socket.io server, in batches of JSONL lines,
+    one message per run. When the clients are slow, the records pile up
+    in the buffer and, once it's full, the new ones are dropped: the clients
+    can still read them via the logs API.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        batch_interval: float = 0.1,
+        max_pending: int = 10_000,
+    ):
+        super().__init__()
+        self.batch_size = batch_size
+        """Max number of records in a message"""
+        self.batch_interval = batch_interval
+        """Seconds to wait for more records before sending a message,
+        unless a run has a full batch"""
+        self.max_pending = max_pending
+        """Max number of records waiting to be sent"""
+
+        self.sent_messages = 0
+        self.sent_records = 0
+        self.dropped_records = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pending: Dict[int, List[str]] = {}
+        self._pending_count = 0
+        self._flush_requested = False
+        self._batch_full: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Send the logs with the running event loop"""
+
+        with self._pending_lock:
+            self._loop = asyncio.get_running_loop()
+            self._reset()
+
+    def stop(self):
+        with self._pending_lock:
+            self._loop = None
+            self._reset()
+
+    def get_stats(self) -> WebSocketStats:
+        return WebSocketStats(
+            sent_messages=self.sent_messages,
+            sent_records=self.sent_records,
+            dropped_records=self.dropped_records,
+            pending_records=self._pending_count,
+        )
+
     def emit(self, record: ExtendedLogRecord):
-        asyncio.run(self._async_emit(record))
+        loop = self._loop
+
+        # Don't even format the record if nobody is watching the run
+        if not loop or not has_subscribers(get_run_room(record.run_id)):
+            return
+
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._pending_lock:
+            if self._pending_count >= self.max_pending:
+                self.dropped_records += 1
+                return
+
+            run_messages = self._pending.setdefault(record.run_id, [])
+            run_messages.append(message)
+            self._pending_count += 1
+
+            start_flush = not self._flush_requested
+            self._flush_requested = True
+            batch_full = len(run_messages) == self.batch_size
+
+        if start_flush or batch_full:
+            try:
+                loop.call_soon_threadsafe(self._on_pending, start_flush, batch_full)
+            except RuntimeError:
+                # The loop has been closed in the meanwhile
+                pass
+
+    def _on_pending(self, start_flush: bool, batch_full: bool):
+        if start_flush:
+            self._batch_full = asyncio.Event()
+            asyncio.create_task(self._flush(self._batch_full))
+
+        if batch_full and self._batch_full:
+            self._batch_full.set()
+
+    async def _flush(self, batch_full: asyncio.Event):
+        try:
+            await asyncio.wait_for(batch_full.wait(), self.batch_interval)
+        except asyncio.TimeoutError:
+            pass
+
+        # The records emitted while sending are sent in the next round
+        while True:
+            with self._pending_lock:
+                pending = self._pending
+                self._pending = {}
+                self._pending_count = 0
+
+                if not pending:
+                    self._flush_requested = False
+                    return
+
+            for run_id, messages in pending.items():
+                for i in range(0, len(messages), self.batch_size):
+                    batch = messages[i : i + self.batch_size]
 
-    async def _async_emit(self, record: ExtendedLogRecord):
-        await sio.emit(f"logs.{record.run_id}", record.message)
+                    try:
+                        await sio.emit(
+                            f"logs.{run_id}", "\n".join(batch), to=get_run_room(run_id)
+                        )
+                    except Exception as exc:
+                        print("Failed to send logs via websocket", exc)
+                        continue
 
+                    self.sent_messages += 1
+                    self.sent_records += len(batch)
 
-# Logs to be sent over the websocket are first added to a queue
-# and from there are actually sent to the websocket
-#
-# From Dealing with handlers that block:
-# https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
-_logs_queue = queue.Queue(-1)
-queue_handler = QueueHandler(_logs_queue)
 
-handler = WebSocketHandler()
-_listener = QueueListener(_logs_queue, handler)
-_listener.start()
+websocket_handler = WebSocketHandler()
@@ -20,6 +20,7 @@ PIPELINE_STATUS_TO_VERB = {
     "completed": "has successfully completed 👌",
     "failed": "failed ❌",
     "cancelled": "was cancelled",
+    "skipped": "was skipped",
 }
 
 
@@ -8,6 +8,7 @@ _PIPELINE_STATUS_TO_VERB: Dict[PipelineRunStatus, str] = {
     PipelineRunStatus.COMPLETED: "has successfully completed",
     PipelineRunStatus.FAILED: "failed",
     PipelineRunStatus.CANCELLED: "was cancelled",
+    PipelineRunStatus.SKIPPED: "was skipped",
 }
 
 
@@ -1,18 +1,43 @@
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
+import asyncio
+import logging
 
-from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.job import Job
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
 
+from plombery.config import settings
 from plombery.constants import MANUAL_TRIGGER_ID
 from plombery.database.models import PipelineRun
-from plombery.database.repository import create_pipeline_run
+from plombery.database.repository import (
+    list_pending_pipeline_runs,
+    update_pipeline_run,
+)
+from plombery.database.async_repository import (
+    cancel_pipeline_run,
+    create_pipeline_run,
+    get_trigger_state,
+    list_active_pipeline_runs,
+    release_expired_pipeline_runs,
+    renew_pipeline_run_leases,
+    save_trigger_state,
+)
 from plombery.database.schemas import PipelineRunCreate
-from plombery.orchestrator.executor import Pipeline, run, Trigger, utcnow
+from plombery.orchestrator.dispatcher import QueuedRun, dispatcher
+from plombery.orchestrator.leader_election import LeaderElection
+from plombery.orchestrator.retention import GarbageCollector
+from plombery.orchestrator.executor import (
+    Pipeline,
+    Trigger,
+    _send_pipeline_event,
+    utcnow,
+)
 from plombery.pipeline._utils import get_job_id
+from plombery.pipeline.trigger import MisfirePolicy, OverlapPolicy
 from plombery.schemas import PipelineRunStatus
+from plombery.utils import run_all_coroutines
+
+_logger = logging.getLogger(__name__)
 
 
 class _Orchestrator:
@@ -21,10 +46,20 @@ class _Orchestrator:
 
     def __init__(self) -> None:
         self.scheduler = AsyncIOScheduler()
+        # When the app has many replicas, only one of them fires the triggers
+        self.leader_election = LeaderElection(
+            "scheduler",
+            on_elected=self._on_scheduler_leader_elected,
+            on_deposed=self._on_scheduler_leader_deposed,
+        )
+        self.garbage_collector = GarbageCollector(
+            self.get_pipeline, lambda: self.leader_election.is_leader
+        )
+        self._leases_task: Optional[asyncio.Task] = None
 
     def register_pipeline(self, pipeline: Pipeline):
         if pipeline.id in self._all_pipelines:
-            print(f"Pipeline {pipeline.id} already registered")
+            _logger.warning("Pipeline %s already registered", pipeline.id)
             return
 
         self._all_pipelines[pipeline.id] = pipeline
@@ -37,13 +72,15 @@ class _Orchestrator:
             self._all_triggers[job_id] = (pipeline, trigger)
 
             if self.scheduler.get_job(job_id):
-                print(f"Job {job_id} already added")
+                _logger.warning("Job %s already added", job_id)
                 continue
 
             self.scheduler.add_job(
                 id=job_id,
                 name=job_id,
-                func=run,
+                # The job only queues the run, so it's quick and
+                # it can't pile up
+                func=_run_trigger,
                 trigger=trigger.schedule,
                 kwargs=dict(pipeline=pipeline, trigger=trigger),
                 # run once instead of many times if the scheduler determines that the
@@ -51,7 +88,6 @@ class _Orchestrator:
                 coalesce=True,
                 # Jobs will be run even if they arrive 1 min late
                 misfire_grace_time=timedelta(minutes=1).seconds,
-                max_instances=10_000,
             )
 
     def get_pipeline(self, pipeline_id: str):
@@ -73,52 +109,269 @@ class _Orchestrator:
         return self.scheduler.get_job(get_job_id(pipeline_id, trigger_id))
 
     def start(self):
-        self.scheduler.start()
+        # The scheduler is resumed once this replica is elected as leader
+        self.scheduler.start(paused=True)
+        self.leader_election.start()
+        self.garbage_collector.start()
+
+        # With workers, the pending runs are claimed by the workers
+        if settings.execution_mode == "local":
+            self._restore_pending_runs()
+            self._leases_task = asyncio.create_task(self._renew_leases_periodically())
 
     def stop(self):
+        if self._leases_task:
+            self._leases_task.cancel()
+            self._leases_task = None
+
+        self.garbage_collector.stop()
+        self.leader_election.stop()
         self.scheduler.shutdown(wait=False)
 
+    async def _renew_leases_periodically(self):
+        """
+        Renew the leases of the runs executed by this replica, like the workers
+        do, while the leader cancels the runs of the replicas that stopped
+        renewing theirs, i.e. because they crashed or restarted.
+        """
+
+        lease_duration = timedelta(seconds=settings.worker_lease_duration)
+        # The runs that just started may not be stored as owned by this replica yet
+        previous_run_ids: Set[int] = set()
+
+        while True:
+            await asyncio.sleep(lease_duration.total_seconds() / 3)
+            now = utcnow()
+
+            try:
+                running_run_ids = set(dispatcher.running_run_ids)
+                renewed: Set[int] = set()
+
+                if running_run_ids:
+                    renewed = await renew_pipeline_run_leases(
+                        dispatcher.instance_id, running_run_ids, now + lease_duration
+                    )
+
+                for pipeline_run_id in (running_run_ids & previous_run_ids) - renewed:
+                    # The run was cancelled, i.e. via the API of another replica,
+                    # or the lease expired and it's been cancelled
+                    dispatcher.cancel(pipeline_run_id)
+
+                previous_run_ids = running_run_ids
+
+                if self.leader_election.is_leader:
+                    await release_expired_pipeline_runs(now)
+            except Exception as error:
+                _logger.error("Couldn't renew the leases of the runs", exc_info=error)
+
+    async def _on_scheduler_leader_elected(self):
+        now = utcnow()
+
+        for job in self.scheduler.get_jobs():
+            pipeline, trigger = self._all_triggers[job.id]
+
+            # The firings were persisted by the previous leader, so only the ones
+            # missed while no replica was running are caught up
+            await self._catch_up_misfires(pipeline, trigger, now)
+
+            next_fire_time = job.trigger.get_next_fire_time(None, now)
+            if next_fire_time and next_fire_time < now:
+                # i.e. a date trigger in the past
+                next_fire_time = None
+
+            job.modify(next_run_time=next_fire_time)
+            await save_trigger_state(pipeline.id, trigger.id, next_fire_time)
+
+        self.scheduler.resume()
+
+    async def _catch_up_misfires(
+        self, pipeline: Pipeline, trigger: Trigger, now: datetime
+    ):
+        if trigger.misfire_policy == MisfirePolicy.SKIP:
+            return
+
+        if not (trigger_state := await get_trigger_state(pipeline.id, trigger.id)):
+            # The trigger never ran before
+            return
+
+        missed_fire_times = _get_missed_fire_times(
+            trigger,
+            trigger_state.next_fire_time,
+            now,
+            limit=(
+                trigger.max_misfired_runs
+                if trigger.misfire_policy == MisfirePolicy.RUN_ALL
+                else 1
+            ),
+        )
+
+        if missed_fire_times:
+            _logger.info(
+                "Catching up %s missed firings of %s/%s",
+                len(missed_fire_times),
+                pipeline.id,
+                trigger.id,
+            )
+
+        run_all_coroutines(
+            [
+                run_pipeline_now(pipeline, trigger, reason="catch-up")
+                for _ in missed_fire_times
+            ]
+        )
+
+    def _on_scheduler_leader_deposed(self):
+        self.scheduler.pause()
+
+    def _restore_pending_runs(self):
+        """Queue again the runs that were pending when the service stopped"""
+
+        for pipeline_run in list_pending_pipeline_runs():
+            if not (queued_run := self._make_queued_run(pipeline_run)):
+                update_pipeline_run(
+                    pipeline_run, pipeline_run.start_time, PipelineRunStatus.CANCELLED
+                )
+                continue
+
+            dispatcher.enqueue(queued_run)
+
+    def _make_queued_run(self, pipeline_run: PipelineRun) -> Optional[QueuedRun]:
+        """Build the queue item of a pending run stored in the DB,
+        it returns None if its pipeline is not registered"""
+
+        if not (pipeline := self.get_pipeline(pipeline_run.pipeline_id)):
+            return None
+
+        trigger = next(
+            (
+                trigger
+                for trigger in pipeline.triggers
+                if trigger.id == pipeline_run.trigger_id
+            ),
+            None,
+        )
+
+        return QueuedRun(
+            pipeline=pipeline,
+            pipeline_run=pipeline_run,
+            trigger=trigger,
+            params=pipeline_run.input_params,
+        )
+
 
 orchestrator = _Orchestrator()
 
 
+def _get_missed_fire_times(
+    trigger: Trigger, next_fire_time: Optional[datetime], now: datetime, limit: int
+) -> List[datetime]:
+    """The fire times of a trigger from its persisted next fire time up to now"""
+
+    missed_fire_times: List[datetime] = []
+
+    while next_fire_time and next_fire_time <= now and len(missed_fire_times) < limit:
+        missed_fire_times.append(next_fire_time)
+        next_fire_time = trigger.schedule.get_next_fire_time(
+            next_fire_time, next_fire_time + timedelta(microseconds=1)
+        )
+
+    return missed_fire_times
+
+
+async def _run_trigger(pipeline: Pipeline, trigger: Trigger):
+    """The scheduler job of a trigger, persists its firing and runs the pipeline"""
+
+    if job := orchestrator.get_job(pipeline.id, trigger.id):
+        await save_trigger_state(
+            pipeline.id, trigger.id, job.next_run_time, last_fire_time=utcnow()
+        )
+
+    await run_pipeline_now(pipeline, trigger, reason="scheduled")
+
+
+async def cancel_run(pipeline_run: PipelineRun) -> bool:
+    """Cancel a pending or running run, if it's run by a worker,
+    the worker stops it at its next heartbeat.
+
+    Returns:
+        bool: False if the run is not pending nor running
+    """
+
+    if dispatcher.cancel(pipeline_run.id):
+        return True
+
+    if not await cancel_pipeline_run(pipeline_run.id):
+        return False
+
+    pipeline_run.status = PipelineRunStatus.CANCELLED
+
+    if pipeline := orchestrator.get_pipeline(pipeline_run.pipeline_id):
+        _send_pipeline_event(pipeline, pipeline_run)
+
+    return True
+
+
 async def run_pipeline_now(
     pipeline: Pipeline,
     trigger: Optional[Trigger] = None,
     params: Any = None,
     reason: str = "api",
 ) -> PipelineRun:
+    """Queue a run of the pipeline, the run is started as soon
+    as the concurrency limits allow it.
+
+    If the trigger has still some pending or running runs, its overlap
+    policy is applied, so the returned run may be a skipped one.
+    """
+
     trigger_id = trigger.id if trigger else MANUAL_TRIGGER_ID
 
-    pipeline_run = create_pipeline_run(
+    if trigger and trigger.params and not params:
+        params = trigger.params.model_dump()
+
+    status = PipelineRunStatus.PENDING
+
+    if trigger and trigger.overlap_policy != OverlapPolicy.ALLOW:
+        active_runs = (
+            dispatcher.get_active_runs(pipeline.id, trigger.id)
+            if settings.execution_mode == "local"
+            else await list_active_pipeline_runs(pipeline.id, trigger.id)
+        )
+
+        if active_runs and trigger.overlap_policy == OverlapPolicy.SKIP:
+            status = PipelineRunStatus.SKIPPED
+        elif trigger.overlap_policy == OverlapPolicy.REPLACE:
+            for active_run in active_runs:
+                await cancel_run(active_run)
+
+    pipeline_run = await create_pipeline_run(
         PipelineRunCreate(
             start_time=utcnow(),
             pipeline_id=pipeline.id,
             trigger_id=trigger_id,
-            status=PipelineRunStatus.PENDING,
+            status=status,
             input_params=params,
             reason=reason,
         )
     )
 
-    executor: AsyncIOExecutor = orchestrator.scheduler._lookup_executor("default")
-    executor.submit_job(
-        Job(
-            orchestrator.scheduler,
-            id=get_job_id(pipeline.id, trigger_id),
-            func=run,
-            args=[],
-            kwargs={
-                "pipeline": pipeline,
-                "trigger": trigger,
-                "params": params,
-                "pipeline_run": pipeline_run,
-            },
-            max_instances=10_000,
-            misfire_grace_time=None,
-            trigger=DateTrigger(),
-        ),
-        [datetime.now()],
+    if status == PipelineRunStatus.SKIPPED:
+        # Record the firing, so it's not silently lost
+        _send_pipeline_event(pipeline, pipeline_run)
+        return pipeline_run
+
+    if settings.execution_mode == "workers":
+        # The run will be claimed by a worker
+        _send_pipeline_event(pipeline, pipeline_run)
+        return pipeline_run
+
+    dispatcher.enqueue(
+        QueuedRun(
+            pipeline=pipeline,
+            pipeline_run=pipeline_run,
+            trigger=trigger,
+            params=params,
+        )
     )
 
     return pipeline_run
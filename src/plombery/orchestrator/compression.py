@@ -0,0 +1,353 @@
+"""
+Compression of the run files, the names of the compressions are the
+same as the HTTP `Content-Encoding` ones, so compressed files can be
+sent as they are to the clients supporting them.
+"""
+
+import bisect
+import gzip
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from plombery.config import settings
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+_CHUNK_SIZE = 64 * 1024
+# Uncompressed size of the blocks of the files compressed by `compress_file`,
+# the blocks are decompressed one at a time to read the file with random access
+_BLOCK_SIZE = 1024 * 1024
+
+
+class Compression:
+    encoding: str
+    """Name of the compression, i.e. used in `settings.data_compression`"""
+    extension: str
+
+    def is_available(self) -> bool:
+        return True
+
+    def open(self, path: Union[Path, BinaryIO], mode: str) -> BinaryIO:
+        """Open a compressed file in binary mode"""
+        raise NotImplementedError()
+
+    def get_uncompressed_size(self, path: Path) -> Optional[int]:
+        """Size of the file once decompressed, if stored in the file
+        or in its index"""
+
+        if blocks := _read_blocks_index(path):
+            return blocks[-1][0]
+
+        return None
+
+    def compress_file(self, source: Path, target: Path):
+        """Compress a file and sync it to disk, the target is written
+        with a temporary name so it's never seen half written.
+
+        The file is compressed by independent blocks, still forming a single
+        standard stream, and their offsets are stored in an index file,
+        written before the target, so the file can be read with random access,
+        see `open_seekable`.
+        """
+
+        temp_target = target.with_name(target.name + ".tmp")
+
+        with source.open(mode="rb") as src, temp_target.open(mode="wb") as dst:
+            blocks = self._compress_blocks(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        index_file = _get_index_file(target)
+        temp_index_file = index_file.with_name(index_file.name + ".tmp")
+        temp_index_file.write_text(json.dumps(blocks))
+        temp_index_file.replace(index_file)
+
+        temp_target.replace(target)
+
+    def _compress_blocks(self, src: BinaryIO, dst: BinaryIO) -> List[Tuple[int, int]]:
+        """Compress a file by blocks of `_BLOCK_SIZE` bytes
+
+        Returns:
+            List[Tuple[int, int]]: the uncompressed and compressed offsets where
+                each block starts, followed by the offsets where the last one ends
+        """
+
+        raise NotImplementedError()
+
+    def _decompress_block(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def open_seekable(self, path: Path) -> Optional[BinaryIO]:
+        """Open a file compressed by `compress_file` for random access,
+        decompressing only the blocks that are read
+
+        Returns:
+            Optional[BinaryIO]: None if the file has no index,
+                i.e. it was compressed by another tool
+        """
+
+        if not (blocks := _read_blocks_index(path)):
+            return None
+
+        return io.BufferedReader(
+            _BlocksReader(path.open(mode="rb"), self, blocks), _CHUNK_SIZE
+        )
+
+    def decompress_to_temp_file(self, source: Path) -> Path:
+        """Decompress a file to a temporary file, that must be deleted
+        by the caller, i.e. to read a file without index with random access"""
+
+        with (
+            tempfile.NamedTemporaryFile(prefix="plombery-", delete=False) as dst,
+            self.open(source, "rb") as src,
+        ):
+            shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+
+        return Path(dst.name)
+
+    def iter_decompressed(self, source: Path) -> Iterator[bytes]:
+        """Read a compressed file in chunks"""
+
+        with self.open(source, "rb") as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                yield chunk
+
+
+class GzipCompression(Compression):
+    encoding = "gzip"
+    extension = ".gz"
+
+    def open(self, path: Union[Path, BinaryIO], mode: str) -> BinaryIO:
+        return gzip.open(path, mode)
+
+    def get_uncompressed_size(self, path: Path) -> Optional[int]:
+        if (size := super().get_uncompressed_size(path)) is not None:
+            return size
+
+        # Stored in the last 4 bytes, modulo 4 GiB
+        with path.open(mode="rb") as f:
+            f.seek(-4, 2)
+            return struct.unpack("<I", f.read(4))[0]
+
+    def _compress_blocks(self, src: BinaryIO, dst: BinaryIO) -> List[Tuple[int, int]]:
+        # A raw deflate stream in a minimal gzip header and trailer, a full flush
+        # after each block resets the compression state, so the decompression
+        # can start at any block
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        crc = 0
+        size = 0
+        blocks = []
+
+        dst.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff")
+
+        while block := src.read(_BLOCK_SIZE):
+            blocks.append((size, dst.tell()))
+            dst.write(compressor.compress(block))
+            dst.write(compressor.flush(zlib.Z_FULL_FLUSH))
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+
+        blocks.append((size, dst.tell()))
+        dst.write(compressor.flush())
+        dst.write(struct.pack("<II", crc, size & 0xFFFFFFFF))
+
+        return blocks
+
+    def _decompress_block(self, data: bytes) -> bytes:
+        return zlib.decompressobj(wbits=-zlib.MAX_WBITS).decompress(data)
+
+
+class ZstdCompression(Compression):
+    """Faster and smaller than gzip, requires the `zstandard` package"""
+
+    encoding = "zstd"
+    extension = ".zst"
+
+    def is_available(self) -> bool:
+        return zstandard is not None
+
+    def open(self, path: Union[Path, BinaryIO], mode: str) -> BinaryIO:
+        if isinstance(path, Path):
+            return zstandard.open(path, mode)
+
+        # Like gzip, don't close the file object when done
+        if "w" in mode:
+            return zstandard.ZstdCompressor().stream_writer(path, closefd=False)
+
+        return zstandard.ZstdDecompressor().stream_reader(path, closefd=False)
+
+    def get_uncompressed_size(self, path: Path) -> Optional[int]:
+        if (size := super().get_uncompressed_size(path)) is not None:
+            return size
+
+        with path.open(mode="rb") as f:
+            header = f.read(zstandard.FRAME_HEADER_SIZE_MAX)
+
+        size = zstandard.get_frame_parameters(header).content_size
+
+        return None if size == zstandard.CONTENTSIZE_UNKNOWN else size
+
+    def _compress_blocks(self, src: BinaryIO, dst: BinaryIO) -> List[Tuple[int, int]]:
+        # A frame per block, the frames of a file are decompressed
+        # as a single stream
+        compressor = zstandard.ZstdCompressor()
+        size = 0
+        blocks = []
+
+        while block := src.read(_BLOCK_SIZE):
+            blocks.append((size, dst.tell()))
+            frame = compressor.compressobj(size=len(block))
+            dst.write(frame.compress(block))
+            dst.write(frame.flush())
+            size += len(block)
+
+        blocks.append((size, dst.tell()))
+
+        return blocks
+
+    def _decompress_block(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def _get_index_file(path: Path) -> Path:
+    return path.with_name(path.name + ".index")
+
+
+def _read_blocks_index(path: Path) -> Optional[List[Tuple[int, int]]]:
+    try:
+        return [
+            tuple(offsets) for offsets in json.loads(_get_index_file(path).read_text())
+        ]
+    except FileNotFoundError:
+        return None
+
+
+class _BlocksReader(io.RawIOBase):
+    """Read a file compressed by blocks, keeping only the current block
+    in memory, the file is closed together with the reader"""
+
+    def __init__(
+        self, file: BinaryIO, compression: Compression, blocks: List[Tuple[int, int]]
+    ) -> None:
+        self._file = file
+        self._compression = compression
+        self._blocks = blocks
+        self._starts = [start for start, _ in blocks]
+        self._size = blocks[-1][0]
+        self._position = 0
+        self._block_start = 0
+        self._block = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self._size:
+            return 0
+
+        position_in_block = self._position - self._block_start
+
+        if not 0 <= position_in_block < len(self._block):
+            self._load_block(bisect.bisect_right(self._starts, self._position) - 1)
+            position_in_block = self._position - self._block_start
+
+        data = self._block[position_in_block : position_in_block + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+
+        return len(data)
+
+    def _load_block(self, block: int):
+        (start, compressed_start), (_, compressed_end) = self._blocks[block : block + 2]
+
+        self._file.seek(compressed_start)
+        compressed = self._file.read(compressed_end - compressed_start)
+
+        self._block_start = start
+        self._block = self._compression._decompress_block(compressed)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+_compressions: Dict[str, Compression] = {
+    compression.encoding: compression
+    for compression in (GzipCompression(), ZstdCompression())
+}
+
+
+def get_compression(encoding: str) -> Optional[Compression]:
+    compression = _compressions.get(encoding)
+
+    return compression if compression and compression.is_available() else None
+
+
+def get_data_compression() -> Optional[Compression]:
+    """The compression of the new run files, if enabled. gzip is used when
+    zstd is configured but `zstandard` isn't installed"""
+
+    if not settings.data_compression:
+        return None
+
+    return get_compression(settings.data_compression) or _compressions["gzip"]
+
+
+def find_compressed_file(path: Path) -> Optional[Tuple[Path, Compression]]:
+    """Find the compressed version of a file
+
+    Returns:
+        Optional[Tuple[Path, Compression]]: the compressed file and its compression
+    """
+
+    for compression in _compressions.values():
+        compressed_path = path.with_name(path.name + compression.extension)
+
+        if compressed_path.exists() and compression.is_available():
+            return compressed_path, compression
+
+    return None
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """Check if an HTTP `Accept-Encoding` header includes an encoding"""
+
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+
+        if name.strip().lower() not in (encoding, "*"):
+            continue
+
+        # i.e. `gzip;q=0` means not accepted
+        key, _, value = params.partition("=")
+        try:
+            return key.strip() != "q" or float(value) > 0
+        except ValueError:
+            return False
+
+    return False
@@ -1,11 +1,37 @@
+from datetime import timedelta
+from io import BytesIO
 import json
+import logging
+import os
+import shutil
+import time
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple
+from uuid import uuid4
 
 from plombery.constants import PIPELINE_RUN_LOGS_FILE
 from plombery.exceptions import InvalidDataPath
 from plombery.config import settings
-
+from plombery.orchestrator.compression import (
+    Compression,
+    find_compressed_file,
+    get_compression,
+    get_data_compression,
+)
+from plombery.orchestrator.output_serializers import (
+    OutputSerializer,
+    UnsupportedOutput,
+    _is_arrow_table,
+    _is_dataframe,
+    choose_output_serializer,
+    describe_output,
+    get_output_serializer,
+    select_columns,
+    to_jsonable,
+)
+from plombery.schemas import TaskOutput, TaskOutputPreview
+
+_logger = logging.getLogger(__name__)
 
 _base_data_path = (settings.data_path / ".data").absolute()
 
@@ -27,8 +53,12 @@ def _check_is_valid_path(path: Path) -> None:
         raise InvalidDataPath(path)
 
 
+def _get_run_folder(pipeline_run_id: int) -> Path:
+    return _base_data_path / "runs" / f"run_{pipeline_run_id}"
+
+
 def _get_data_path(pipeline_run_id: int, filename: str) -> Path:
-    data_path = _base_data_path / "runs" / f"run_{pipeline_run_id}" / filename
+    data_path = _get_run_folder(pipeline_run_id) / filename
 
     _check_is_valid_path(data_path)
 
@@ -39,12 +69,15 @@ def _get_data_path(pipeline_run_id: int, filename: str) -> Path:
     return data_path
 
 
-def get_task_run_data_file(pipeline_run_id: int, task_id: str) -> Path:
+def get_task_run_data_file(
+    pipeline_run_id: int, task_id: str, extension: str = "json"
+) -> Path:
     """Get the file path of a task run output
 
     Args:
         pipeline_run_id (int): the run ID
         task_id (str): the task ID
+        extension (str): the extension of the output format
 
     Returns:
         Path: the file path
@@ -52,12 +85,36 @@ def get_task_run_data_file(pipeline_run_id: int, task_id: str) -> Path:
     Raises:
         InvalidDataPath: In case the path is invalid.
     """
-    return _get_data_path(pipeline_run_id, f"{task_id}.json")
+    return _get_data_path(pipeline_run_id, f"{task_id}.{extension}")
+
+
+def _get_task_output_metadata_file(pipeline_run_id: int, task_id: str) -> Path:
+    return _get_data_path(pipeline_run_id, f"{task_id}.meta.json")
+
+
+def _sync(file: BinaryIO):
+    """Write the file to disk, so the run is finalized once its outputs are durable"""
+
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def _is_empty(data: Any) -> bool:
+    if data is None:
+        return True
+
+    # Empty DataFrames or tables
+    return getattr(data, "empty", False) is True or (
+        hasattr(data, "num_rows") and data.num_rows == 0
+    )
 
 
 def store_task_output(pipeline_run_id: int, task_id: str, data: Any) -> bool:
     """
-    Store a task output as a JSON file
+    Store a task output in the first format of `settings.output_formats`
+    supporting it, i.e. Parquet for DataFrames, and its metadata in a
+    `{task_id}.meta.json` sidecar file, with the schema and the first rows
+    of the output when it's a table or a list
 
     Args:
         pipeline_run_id (int): the pipeline run ID used to name the folder
@@ -73,32 +130,243 @@ def store_task_output(pipeline_run_id: int, task_id: str, data: Any) -> bool:
         InvalidDataPath: In case the path is invalid.
     """
 
-    output_file_path = get_task_run_data_file(pipeline_run_id, task_id)
+    if _is_empty(data):
+        return False
 
-    try:
-        import pandas
+    serializer = choose_output_serializer(data)
 
-        if type(data) is pandas.DataFrame:
-            if not data.empty:
-                data.to_json(output_file_path, orient="records")
-                return True
-            else:
-                return False
-    except ModuleNotFoundError:
-        pass
+    try:
+        output = _write_task_output(pipeline_run_id, task_id, data, serializer)
+    except UnsupportedOutput:
+        # i.e. a DataFrame with mixed types can't be stored as Parquet
+        output = _write_task_output(
+            pipeline_run_id, task_id, data, get_output_serializer("json")
+        )
+
+    if not output:
+        return False
 
     try:
-        if data is None:
-            return False
+        output = output.model_copy(
+            update=describe_output(data, settings.output_preview_rows)
+        )
+    except Exception as exc:
+        # The output is stored anyway, but can't be previewed
+        _logger.warning("Failed to describe task %s output", task_id, exc_info=exc)
 
-        with output_file_path.open(mode="w", encoding="utf-8") as output_file:
-            json.dump(data, output_file, default=str)
+    metadata_file = _get_task_output_metadata_file(pipeline_run_id, task_id)
+    with metadata_file.open(mode="wb") as f:
+        f.write(output.model_dump_json().encode("utf-8"))
+        _sync(f)
 
-        return True
+    return True
+
+
+def _write_task_output(
+    pipeline_run_id: int, task_id: str, data: Any, serializer: OutputSerializer
+) -> Optional[TaskOutput]:
+    # Tables formats are compressed internally, so they can still be read by chunks
+    compression = get_data_compression() if serializer.compress_file else None
+    extension = serializer.extension
+
+    if compression:
+        extension += compression.extension
+
+    output_file_path = get_task_run_data_file(pipeline_run_id, task_id, extension)
+
+    try:
+        with output_file_path.open(mode="wb") as output_file:
+            if compression:
+                with compression.open(output_file, "wb") as compressed_file:
+                    serializer.write(data, compressed_file)
+            else:
+                serializer.write(data, output_file)
+
+            _sync(output_file)
+    except UnsupportedOutput:
+        output_file_path.unlink(missing_ok=True)
+        raise
     except Exception as exc:
         print(f"Failed to save task {task_id} output", exc)
-        output_file_path.unlink()
-        return False
+        output_file_path.unlink(missing_ok=True)
+        return None
+
+    return TaskOutput(
+        format=serializer.format,
+        filename=output_file_path.name,
+        media_type=serializer.media_type,
+        size=output_file_path.stat().st_size,
+        encoding=compression.encoding if compression else None,
+    )
+
+
+def get_task_output(pipeline_run_id: int, task_id: str) -> Optional[TaskOutput]:
+    """Get the metadata of a task output, None if the task has no output
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    metadata_file = _get_task_output_metadata_file(pipeline_run_id, task_id)
+
+    if metadata_file.exists():
+        return TaskOutput.model_validate_json(metadata_file.read_text("utf-8"))
+
+    # Outputs stored before the metadata was introduced are always JSON
+    legacy_file = get_task_run_data_file(pipeline_run_id, task_id)
+    if legacy_file.exists():
+        return TaskOutput(
+            format="json",
+            filename=legacy_file.name,
+            media_type="application/json",
+            size=legacy_file.stat().st_size,
+        )
+
+    return None
+
+
+def get_task_output_file(pipeline_run_id: int, output: TaskOutput) -> Path:
+    """Get the path of the file storing a task output
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+    return _get_data_path(pipeline_run_id, output.filename)
+
+
+def open_task_output(pipeline_run_id: int, output: TaskOutput) -> BinaryIO:
+    """Open a task output file for reading, decompressing it if needed
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+        UnsupportedOutput: If the output compression isn't available.
+    """
+
+    path = get_task_output_file(pipeline_run_id, output)
+
+    if not output.encoding:
+        return path.open(mode="rb")
+
+    if not (compression := get_compression(output.encoding)):
+        raise UnsupportedOutput(f"The compression {output.encoding} isn't available")
+
+    return compression.open(path, "rb")
+
+
+def get_task_output_preview(
+    pipeline_run_id: int,
+    output: TaskOutput,
+    offset: int,
+    limit: int,
+    columns: Optional[List[str]] = None,
+) -> Optional[TaskOutputPreview]:
+    """Read a page of rows of a task output, None if the output isn't
+    a table or a list.
+
+    The first rows are read from the output metadata, the others only
+    from the row groups or batches containing them, for Parquet and Arrow,
+    or by skipping the previous rows, for msgpack and JSON.
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+        UnsupportedOutput: If the output format isn't available.
+        ValueError: If some columns don't exist.
+    """
+
+    if output.num_rows is None:
+        if output.format != "json":
+            return None
+
+        # Outputs stored before the metadata was introduced
+        with open_task_output(pipeline_run_id, output) as f:
+            data = json.load(f)
+
+        if not isinstance(data, list):
+            return None
+
+        output = output.model_copy(update=describe_output(data, offset + limit))
+
+    if columns and output.columns:
+        if unknown := set(columns) - {column.name for column in output.columns}:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+    rows: Optional[List[Any]] = None
+
+    if output.rows is not None:
+        end = min(offset + limit, output.num_rows)
+
+        if end <= len(output.rows):
+            rows = select_columns(output.rows[offset:end], columns)
+
+    if rows is None:
+        if not (serializer := get_output_serializer(output.format)):
+            raise UnsupportedOutput(f"The format {output.format} isn't available")
+
+        with open_task_output(pipeline_run_id, output) as f:
+            rows = serializer.read_rows(f, offset, limit, columns)
+
+        if rows is None:
+            return None
+
+        rows = to_jsonable(rows)
+
+    selected_columns = output.columns
+    if columns and output.columns:
+        selected_columns = [c for c in output.columns if c.name in columns]
+
+    return TaskOutputPreview(
+        columns=selected_columns,
+        num_rows=output.num_rows,
+        offset=offset,
+        rows=rows,
+    )
+
+
+def convert_task_output(
+    pipeline_run_id: int, output: TaskOutput, format: str
+) -> Iterator[bytes]:
+    """Read a task output and write it in another format. Tables and lists
+    are converted by chunks of rows, if the target format supports it,
+    so they're never entirely in memory
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+        UnsupportedOutput: If the format is unknown or the output
+            can't be converted to it.
+    """
+
+    source = get_output_serializer(output.format)
+    target = get_output_serializer(format)
+
+    if not source or not target:
+        raise UnsupportedOutput(f"The format {format} isn't available")
+
+    file = open_task_output(pipeline_run_id, output)
+
+    try:
+        chunks = source.iter_rows(file)
+        content = target.write_rows(chunks) if chunks is not None else None
+    except Exception:
+        file.close()
+        raise
+
+    if content is not None:
+        return _close_when_read(content, file)
+
+    file.close()
+
+    with open_task_output(pipeline_run_id, output) as f:
+        data = source.read(f)
+
+    buffer = BytesIO()
+    target.write(data, buffer)
+
+    return iter([buffer.getvalue()])
+
+
+def _close_when_read(content: Iterator[bytes], file: BinaryIO) -> Iterator[bytes]:
+    with file:
+        yield from content
 
 
 def get_logs_filename(pipeline_run_id: int) -> Path:
@@ -133,8 +401,326 @@ def read_logs_file(pipeline_run_id: int) -> Optional[str]:
 
     logs_file = get_logs_filename(pipeline_run_id)
 
+    try:
+        with logs_file.open(mode="r", encoding="utf-8") as f:
+            return f.read().rstrip()
+    except FileNotFoundError:
+        # i.e. it was compressed when the run ended
+        pass
+
+    if compressed := find_compressed_logs_file(pipeline_run_id):
+        compressed_file, compression = compressed
+
+        with compression.open(compressed_file, "rb") as f:
+            return f.read().decode("utf-8").rstrip()
+
+    return None
+
+
+def find_compressed_logs_file(
+    pipeline_run_id: int,
+) -> Optional[Tuple[Path, Compression]]:
+    """Find the logs file of a run that was compressed when it ended
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    return find_compressed_file(get_logs_filename(pipeline_run_id))
+
+
+def compress_logs_file(pipeline_run_id: int):
+    """Compress the logs file of a run once it ended,
+    if `settings.data_compression` is enabled
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    if not (compression := get_data_compression()):
+        return
+
+    logs_file = get_logs_filename(pipeline_run_id)
+
     if not logs_file.exists():
         return
 
-    with logs_file.open(mode="r", encoding="utf-8") as f:
-        return f.read().rstrip()
+    compression.compress_file(
+        logs_file, logs_file.with_name(logs_file.name + compression.extension)
+    )
+
+    # The compressed file is complete, so readers can switch to it
+    logs_file.unlink()
+
+
+def get_run_data_size(pipeline_run_id: int) -> int:
+    """Size in bytes of the logs and outputs of a run
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    run_folder = _get_run_folder(pipeline_run_id)
+    _check_is_valid_path(run_folder)
+
+    if not run_folder.is_dir():
+        return 0
+
+    return sum(f.stat().st_size for f in run_folder.iterdir() if f.is_file())
+
+
+def _get_reclaimable_size(run_folder: Path) -> int:
+    """Size in bytes of the files of a run that aren't linked elsewhere,
+    i.e. by the tasks cache, so deleting them frees the disk space"""
+
+    if not run_folder.is_dir():
+        return 0
+
+    return sum(
+        stat.st_size
+        for f in run_folder.iterdir()
+        if f.is_file() and (stat := f.stat()).st_nlink == 1
+    )
+
+
+def delete_run_data(pipeline_run_id: int) -> int:
+    """Delete the logs and outputs of a run
+
+    Returns:
+        int: the reclaimed bytes, the files still linked elsewhere
+            aren't counted
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    run_folder = _get_run_folder(pipeline_run_id)
+    _check_is_valid_path(run_folder)
+
+    if not run_folder.exists():
+        return 0
+
+    size = _get_reclaimable_size(run_folder)
+
+    try:
+        shutil.rmtree(run_folder)
+    except OSError as exc:
+        _logger.error(
+            "Failed to delete the data of run %s", pipeline_run_id, exc_info=exc
+        )
+        return size - _get_reclaimable_size(run_folder)
+
+    return size
+
+
+_CACHE_METADATA_FILE = "meta.json"
+
+
+def _get_cache_folder(cache_key: str) -> Path:
+    cache_folder = _base_data_path / "cache" / cache_key
+
+    _check_is_valid_path(cache_folder)
+
+    return cache_folder
+
+
+def _link(source: Path, target: Path):
+    """Hard link a file, or copy it if the file system doesn't support links"""
+
+    target.unlink(missing_ok=True)
+
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _is_plain(data: Any) -> bool:
+    """True if the data is made only of the types kept by JSON and msgpack"""
+
+    if data is None or isinstance(data, (str, int, float)):
+        return True
+
+    if isinstance(data, (list, tuple)):
+        return all(_is_plain(item) for item in data)
+
+    if isinstance(data, dict):
+        return all(
+            isinstance(key, str) and _is_plain(value) for key, value in data.items()
+        )
+
+    return False
+
+
+def _can_restore(data: Any, output: TaskOutput) -> bool:
+    """True if the output is read back from its file with the same type,
+    except for the tuples that are read back as lists"""
+
+    if output.format in ("parquet", "arrow"):
+        return _is_dataframe(data) or _is_arrow_table(data)
+
+    return output.format in ("msgpack", "json") and _is_plain(data)
+
+
+def _read_task_output(pipeline_run_id: int, output: TaskOutput) -> Any:
+    if not (serializer := get_output_serializer(output.format)):
+        raise UnsupportedOutput(f"The format {output.format} isn't available")
+
+    with open_task_output(pipeline_run_id, output) as f:
+        data = serializer.read(f)
+
+    # The tables written from a DataFrame keep its pandas metadata
+    if _is_arrow_table(data) and data.schema.pandas_metadata:
+        return data.to_pandas()
+
+    return data
+
+
+def cache_task_output(
+    pipeline_run_id: int, task_id: str, cache_key: str, data: Any
+) -> bool:
+    """Add a stored task output to the cache.
+
+    The files are hard linked rather than copied, so they're kept
+    when either the run or the cache entry is deleted. The cached outputs
+    are read back from their files, so only the tables and the plain
+    structures are cached.
+
+    Returns:
+        bool: True if the output is in the cache
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    if not (output := get_task_output(pipeline_run_id, task_id)):
+        return False
+
+    if not _can_restore(data, output):
+        _logger.warning(
+            "Task %s output can't be cached as it can't be read back from %s",
+            task_id,
+            output.format,
+        )
+        return False
+
+    cache_folder = _get_cache_folder(cache_key)
+
+    if cache_folder.exists():
+        return True
+
+    # Linked in a temporary folder, so a cache entry is never seen incomplete
+    temp_folder = cache_folder.with_name(f".{cache_key}.{uuid4().hex}")
+    temp_folder.mkdir(parents=True)
+
+    try:
+        _link(
+            get_task_output_file(pipeline_run_id, output),
+            temp_folder / output.filename,
+        )
+        _link(
+            _get_task_output_metadata_file(pipeline_run_id, task_id),
+            temp_folder / _CACHE_METADATA_FILE,
+        )
+
+        temp_folder.rename(cache_folder)
+    except OSError:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        # i.e. another run cached the same output meanwhile
+        return cache_folder.exists()
+
+    return True
+
+
+def restore_cached_task_output(
+    pipeline_run_id: int,
+    task_id: str,
+    cache_key: str,
+    ttl: Optional[timedelta] = None,
+) -> Optional[Tuple[TaskOutput, Any]]:
+    """Link a cached output in the run folder, as if the task stored it,
+    and read its data
+
+    Returns:
+        Optional[Tuple[TaskOutput, Any]]: the output metadata and its data,
+            None if the output isn't cached or it's older than `ttl`
+
+    Raises:
+        InvalidDataPath: In case the path is invalid.
+    """
+
+    cache_folder = _get_cache_folder(cache_key)
+    metadata_file = cache_folder / _CACHE_METADATA_FILE
+
+    try:
+        output = TaskOutput.model_validate_json(metadata_file.read_text("utf-8"))
+
+        # The metadata file is written once, when the task stores its output
+        if ttl and time.time() - metadata_file.stat().st_mtime > ttl.total_seconds():
+            shutil.rmtree(cache_folder, ignore_errors=True)
+            return None
+
+        _link(
+            cache_folder / output.filename,
+            get_task_output_file(pipeline_run_id, output),
+        )
+        _link(metadata_file, _get_task_output_metadata_file(pipeline_run_id, task_id))
+    except (OSError, ValueError):
+        # i.e. evicted meanwhile
+        return None
+
+    # The least recently used entries are evicted first
+    os.utime(cache_folder)
+
+    return output, _read_task_output(pipeline_run_id, output)
+
+
+def evict_cached_task_outputs(
+    ttl: Optional[timedelta] = None, max_bytes: Optional[int] = None
+) -> int:
+    """Delete the cached outputs older than `ttl` and the least recently
+    used ones, until the cache size is below `max_bytes`
+
+    Returns:
+        int: the number of evicted outputs
+    """
+
+    cache_root = _base_data_path / "cache"
+
+    if not cache_root.is_dir():
+        return 0
+
+    now = time.time()
+    evicted = 0
+    entries: List[Tuple[float, int, Path]] = []
+
+    for cache_folder in cache_root.iterdir():
+        # Entries being created
+        if cache_folder.name.startswith("."):
+            continue
+
+        try:
+            created_at = (cache_folder / _CACHE_METADATA_FILE).stat().st_mtime
+            used_at = cache_folder.stat().st_mtime
+            size = sum(f.stat().st_size for f in cache_folder.iterdir())
+        except OSError:
+            continue
+
+        if ttl and now - created_at > ttl.total_seconds():
+            shutil.rmtree(cache_folder, ignore_errors=True)
+            evicted += 1
+        else:
+            entries.append((used_at, size, cache_folder))
+
+    if max_bytes:
+        cache_size = sum(size for _, size, _ in entries)
+
+        for _, size, cache_folder in sorted(entries, key=lambda entry: entry[0]):
+            if cache_size <= max_bytes:
+                break
+
+            shutil.rmtree(cache_folder, ignore_errors=True)
+            cache_size -= size
+            evicted += 1
+
+    return evicted
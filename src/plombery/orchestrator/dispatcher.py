@@ -0,0 +1,231 @@
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from plombery.config import settings
+from plombery.database.models import PipelineRun
+from plombery.orchestrator.executor import (
+    Pipeline,
+    Trigger,
+    _on_pipeline_status_changed,
+    run,
+    utcnow,
+)
+from plombery.pipeline.trigger import OverlapPolicy
+from plombery.schemas import PipelineRunStatus
+from plombery.utils import get_instance_id, run_all_coroutines
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedRun:
+    pipeline: Pipeline
+    pipeline_run: PipelineRun
+    trigger: Optional[Trigger] = None
+    params: Optional[Dict[str, Any]] = None
+
+    @property
+    def trigger_key(self) -> Tuple[str, Optional[str]]:
+        return (self.pipeline.id, self.trigger.id if self.trigger else None)
+
+
+class _Dispatcher:
+    """
+    Queue of the pending runs, the runs are started in order as long as
+    the global `max_concurrent_runs` setting and the pipeline's
+    `max_concurrent_runs` allow it.
+
+    The queue is persisted as the pending runs are stored in the DB,
+    see `_Orchestrator._restore_pending_runs`.
+    """
+
+    def __init__(self) -> None:
+        # Owner of the runs started in local mode, the workers claim their runs
+        self.instance_id = get_instance_id()
+        self._queue: List[QueuedRun] = []
+        self._running: Dict[int, Tuple[QueuedRun, asyncio.Task]] = {}
+        self._running_by_pipeline: Counter[str] = Counter()
+        self._running_by_trigger: Counter[Tuple[str, Optional[str]]] = Counter()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    @property
+    def running_run_ids(self) -> List[int]:
+        return list(self._running)
+
+    @property
+    def active_run_ids(self) -> List[int]:
+        """IDs of the pending and running runs"""
+
+        return [queued_run.pipeline_run.id for queued_run in self._queue] + list(
+            self._running
+        )
+
+    def get_queue_position(self, pipeline_run_id: int) -> Optional[int]:
+        """Get the position of a run in the queue, starting from 1,
+        or None if the run is not queued"""
+
+        for position, queued_run in enumerate(self._queue, start=1):
+            if queued_run.pipeline_run.id == pipeline_run_id:
+                return position
+
+        return None
+
+    def get_active_runs(self, pipeline_id: str, trigger_id: str) -> List[PipelineRun]:
+        """Get the pending and running runs of a trigger"""
+
+        return [
+            queued_run.pipeline_run
+            for queued_run in self._queue
+            + [queued_run for queued_run, _ in self._running.values()]
+            if queued_run.trigger_key == (pipeline_id, trigger_id)
+        ]
+
+    def enqueue(self, queued_run: QueuedRun):
+        self._queue.append(queued_run)
+        self._dispatch()
+
+    def cancel(self, pipeline_run_id: int) -> bool:
+        """Cancel a pending or running run
+
+        Returns:
+            bool: False if the run is not pending nor running
+        """
+
+        for queued_run in self._queue:
+            if queued_run.pipeline_run.id == pipeline_run_id:
+                self._queue.remove(queued_run)
+                run_all_coroutines(
+                    [
+                        _on_pipeline_status_changed(
+                            queued_run.pipeline,
+                            queued_run.pipeline_run,
+                            PipelineRunStatus.CANCELLED,
+                        )
+                    ]
+                )
+                return True
+
+        if pipeline_run_id in self._running:
+            _, task = self._running[pipeline_run_id]
+            # The run itself takes care of updating its status
+            task.cancel()
+
+            # While the run stops, its slot is given to the next queued run
+            self._release(pipeline_run_id)
+            self._dispatch()
+            return True
+
+        return False
+
+    def _release(self, pipeline_run_id: int):
+        """Free the concurrency slot of a running run, if not already done"""
+
+        if not (running := self._running.pop(pipeline_run_id, None)):
+            return
+
+        queued_run, _ = running
+        self._running_by_pipeline[queued_run.pipeline.id] -= 1
+        self._running_by_trigger[queued_run.trigger_key] -= 1
+
+    def _can_start(self, queued_run: QueuedRun) -> bool:
+        pipeline = queued_run.pipeline
+        trigger = queued_run.trigger
+
+        if (
+            pipeline.max_concurrent_runs
+            and self._running_by_pipeline[pipeline.id] >= pipeline.max_concurrent_runs
+        ):
+            return False
+
+        if (
+            trigger
+            and trigger.overlap_policy == OverlapPolicy.QUEUE
+            and self._running_by_trigger[queued_run.trigger_key]
+        ):
+            return False
+
+        return True
+
+    def _dispatch(self):
+        for queued_run in list(self._queue):
+            if (
+                settings.max_concurrent_runs
+                and self.running_count >= settings.max_concurrent_runs
+            ):
+                break
+
+            # A pipeline at its limit doesn't hold back the runs
+            # of the other pipelines
+            if not self._can_start(queued_run):
+                continue
+
+            self._queue.remove(queued_run)
+            self._start(queued_run)
+
+    def _start(self, queued_run: QueuedRun):
+        pipeline_run = queued_run.pipeline_run
+
+        now = utcnow()
+        pipeline_run.wait_duration = (
+            now - pipeline_run.start_time
+        ).total_seconds() * 1000
+        pipeline_run.start_time = now
+
+        # The run is owned by this process as long as it renews the lease,
+        # so other replicas don't take it for an interrupted run
+        if not pipeline_run.worker_id:
+            pipeline_run.worker_id = self.instance_id
+        pipeline_run.lease_expires_at = now + timedelta(
+            seconds=settings.worker_lease_duration
+        )
+
+        task = asyncio.create_task(
+            run(
+                pipeline=queued_run.pipeline,
+                trigger=queued_run.trigger,
+                params=queued_run.params,
+                pipeline_run=pipeline_run,
+            )
+        )
+
+        self._running[pipeline_run.id] = (queued_run, task)
+        self._running_by_pipeline[queued_run.pipeline.id] += 1
+        self._running_by_trigger[queued_run.trigger_key] += 1
+
+        def _on_run_done(future: asyncio.Task):
+            self._release(pipeline_run.id)
+
+            if future.cancelled():
+                # The run was cancelled before it even started
+                if pipeline_run.status == PipelineRunStatus.PENDING:
+                    run_all_coroutines(
+                        [
+                            _on_pipeline_status_changed(
+                                queued_run.pipeline,
+                                pipeline_run,
+                                PipelineRunStatus.CANCELLED,
+                            )
+                        ]
+                    )
+            elif exc := future.exception():
+                _logger.error(
+                    "Run %s failed unexpectedly", pipeline_run.id, exc_info=exc
+                )
+
+            self._dispatch()
+
+        task.add_done_callback(_on_run_done)
+
+
+dispatcher = _Dispatcher()
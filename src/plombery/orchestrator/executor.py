@@ -1,33 +1,49 @@
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timezone
-import inspect
+import asyncio
+import logging
 
 from pydantic import BaseModel
 
 from plombery.constants import MANUAL_TRIGGER_ID
-from plombery.exceptions import InvalidDataPath
-from plombery.logger import close_logger, get_logger
+from plombery.exceptions import TaskTimeout
+from plombery.config import settings
+from plombery.logger import close_run_logs, get_logger, open_run_logs
 from plombery.notifications import notification_manager
 from plombery.utils import run_all_coroutines
-from plombery.websocket import sio
+from plombery.websocket import (
+    ALL_RUNS_ROOM,
+    get_pipeline_room,
+    get_run_room,
+    has_subscribers,
+    sio,
+)
 from plombery.database.models import PipelineRun
-from plombery.database.repository import create_pipeline_run, update_pipeline_run
+from plombery.database.async_repository import (
+    create_pipeline_run,
+    update_pipeline_run,
+)
 from plombery.database.schemas import PipelineRunCreate
-from plombery.orchestrator.data_storage import store_task_output
+from plombery.orchestrator.output_writer import RunOutputsWriter
+from plombery.orchestrator.task_cache import RunTaskCache
+from plombery.pipeline.cancellation import CancellationToken, cancellation_context
+from plombery.pipeline.executors import executors
 from plombery.pipeline.pipeline import Pipeline, Trigger, Task
+from plombery.pipeline.task import check_task_signature
 from plombery.pipeline.context import pipeline_context, run_context
-from plombery.schemas import PipelineRunStatus, TaskRun
+from plombery.schemas import PipelineRunStatus, TaskAttempt, TaskRun
+
+_logger = logging.getLogger(__name__)
 
 
 def utcnow():
     return datetime.now(tz=timezone.utc)
 
 
-def _on_pipeline_start(pipeline: Pipeline, trigger: Optional[Trigger] = None):
+async def _on_pipeline_start(pipeline: Pipeline, trigger: Optional[Trigger] = None):
     input_params = trigger.params.model_dump() if trigger and trigger.params else None
 
-    pipeline_run = create_pipeline_run(
+    pipeline_run = await create_pipeline_run(
         PipelineRunCreate(
             start_time=utcnow(),
             pipeline_id=pipeline.id,
@@ -43,10 +59,10 @@ def _on_pipeline_start(pipeline: Pipeline, trigger: Optional[Trigger] = None):
     return pipeline_run
 
 
-def _on_pipeline_status_changed(
+async def _on_pipeline_status_changed(
     pipeline: Pipeline, pipeline_run: PipelineRun, status: PipelineRunStatus
 ):
-    update_pipeline_run(pipeline_run, utcnow(), status)
+    await update_pipeline_run(pipeline_run, utcnow(), status)
 
     _send_pipeline_event(pipeline, pipeline_run)
 
@@ -63,16 +79,27 @@ def _send_pipeline_event(pipeline: Pipeline, pipeline_run: PipelineRun):
         duration=pipeline_run.duration,
     )
 
-    emit_coro = sio.emit(
-        "run-update",
-        dict(
-            run=run_payload,
-            pipeline=pipeline_run.pipeline_id,
-            trigger=pipeline_run.trigger_id,
-        ),
-    )
+    coros = [notify_coro]
+
+    rooms = [
+        ALL_RUNS_ROOM,
+        get_pipeline_room(pipeline_run.pipeline_id),
+        get_run_room(pipeline_run.id),
+    ]
+    if has_subscribers(*rooms):
+        coros.append(
+            sio.emit(
+                "run-update",
+                dict(
+                    run=run_payload,
+                    pipeline=pipeline_run.pipeline_id,
+                    trigger=pipeline_run.trigger_id,
+                ),
+                to=rooms,
+            )
+        )
 
-    run_all_coroutines([notify_coro, emit_coro])
+    run_all_coroutines(coros)
 
 
 async def run(
@@ -90,121 +117,374 @@ async def run(
     """
 
     if pipeline_run:
-        _on_pipeline_status_changed(pipeline, pipeline_run, PipelineRunStatus.RUNNING)
+        await _on_pipeline_status_changed(
+            pipeline, pipeline_run, PipelineRunStatus.RUNNING
+        )
     else:
-        pipeline_run = _on_pipeline_start(pipeline, trigger)
+        pipeline_run = await _on_pipeline_start(pipeline, trigger)
+
+    tasks_graph = pipeline.get_tasks_graph()
 
-    pipeline_run.tasks_run = []
+    pipeline_run.tasks_run = [
+        TaskRun(task_id=task.id, upstream=tasks_graph[task.id])
+        for task in pipeline.tasks
+    ]
 
     pipeline_token = pipeline_context.set(pipeline)
     run_token = run_context.set(pipeline_run)
 
+    # The logs file is shared by the loggers of the pipeline and its tasks
+    logs_sink = open_run_logs(pipeline_run.id)
+    flush_logs_task = asyncio.create_task(logs_sink.flush_periodically())
+
     logger = get_logger()
+    status: Optional[PipelineRunStatus] = None
 
-    logger.info(
-        "Executing pipeline `%s` #%d via trigger `%s`",
-        pipeline.id,
-        pipeline_run.id,
-        trigger.id if trigger else MANUAL_TRIGGER_ID,
+    outputs_writer = RunOutputsWriter(
+        pipeline_run.id, logger, settings.max_pending_outputs
     )
+    task_cache = RunTaskCache(pipeline.id, pipeline_run.id, logger)
+
+    try:
+        logger.info(
+            "Executing pipeline `%s` #%d via trigger `%s`",
+            pipeline.id,
+            pipeline_run.id,
+            trigger.id if trigger else MANUAL_TRIGGER_ID,
+        )
+
+        pipeline_params: Optional[BaseModel] = None
 
-    pipeline_params: Optional[BaseModel] = None
+        if pipeline.params:
+            pipeline_params = (
+                trigger.params if trigger else pipeline.params(**(params or {}))
+            )
+        elif (trigger and trigger.params) or params:
+            logger.warning("This pipeline doesn't support input params")
 
-    if pipeline.params:
-        pipeline_params = (
-            trigger.params if trigger else pipeline.params(**(params or {}))
+        await _run_tasks_graph(
+            pipeline, pipeline_run, pipeline_params, logger, outputs_writer, task_cache
         )
-    elif (trigger and trigger.params) or params:
-        logger.warning("This pipeline doesn't support input params")
+    except asyncio.CancelledError:
+        logger.warning("The run was cancelled")
+        status = PipelineRunStatus.CANCELLED
+        raise
+    except Exception as error:
+        # i.e. a bug or a DB error, the run must end anyway to free its slot
+        logger.error("The run failed unexpectedly", exc_info=error)
+        status = PipelineRunStatus.FAILED
+    else:
+        if any(
+            task_run.status == PipelineRunStatus.FAILED
+            for task_run in pipeline_run.tasks_run
+        ):
+            # A task failed so the entire pipeline failed
+            status = PipelineRunStatus.FAILED
+        else:
+            # All task succeeded so the entire pipeline succeeded
+            status = PipelineRunStatus.COMPLETED
+    finally:
+        pipeline_context.reset(pipeline_token)
+        run_context.reset(run_token)
+
+        # The run is finalized only once all the outputs are on disk
+        await outputs_writer.wait()
+
+        # The logs are flushed and synced to disk before the run is
+        # finalized, so they're complete once the run is seen as ended
+        flush_logs_task.cancel()
+        try:
+            await asyncio.to_thread(close_run_logs, pipeline_run.id)
+        except OSError as exc:
+            _logger.error(
+                "Failed to close the logs of run %s", pipeline_run.id, exc_info=exc
+            )
 
-    flowing_data = None
+        if status:
+            await _on_pipeline_status_changed(pipeline, pipeline_run, status)
 
-    for task in pipeline.tasks:
-        logger.info("Executing task %s", task.id)
 
-        task_run = TaskRun(task_id=task.id)
+async def _run_tasks_graph(
+    pipeline: Pipeline,
+    pipeline_run: PipelineRun,
+    params: Optional[BaseModel],
+    logger: logging.LoggerAdapter,
+    outputs_writer: RunOutputsWriter,
+    task_cache: RunTaskCache,
+):
+    """
+    Run the tasks as soon as all their upstream tasks completed, so independent
+    branches of the graph run concurrently, up to `pipeline.max_concurrent_tasks`.
+
+    When a task fails, all its downstream tasks are skipped while the
+    other branches keep running.
+    """
+
+    tasks_by_id = {task.id: task for task in pipeline.tasks}
+    task_runs: Dict[str, TaskRun] = {
+        task_run.task_id: task_run for task_run in pipeline_run.tasks_run
+    }
+    outputs: Dict[str, Any] = {}
+
+    waiting: List[str] = list(tasks_by_id)
+    running: Dict[asyncio.Task, str] = {}
+
+    try:
+        while waiting or running:
+            for task_id in list(waiting):
+                upstream = [
+                    task_runs[upstream_id]
+                    for upstream_id in task_runs[task_id].upstream
+                ]
+
+                if any(
+                    upstream_run.status
+                    in (PipelineRunStatus.FAILED, PipelineRunStatus.SKIPPED)
+                    for upstream_run in upstream
+                ):
+                    logger.warning(
+                        "Skipping task %s as some of its upstream tasks didn't complete",
+                        task_id,
+                    )
+                    task_runs[task_id].status = PipelineRunStatus.SKIPPED
+                    waiting.remove(task_id)
+                elif all(
+                    upstream_run.status == PipelineRunStatus.COMPLETED
+                    # The task is completed before its output is handed over
+                    and upstream_run.task_id in outputs
+                    for upstream_run in upstream
+                ):
+                    if (
+                        pipeline.max_concurrent_tasks
+                        and len(running) >= pipeline.max_concurrent_tasks
+                    ):
+                        continue
+
+                    upstream_outputs = {
+                        upstream_run.task_id: outputs.get(upstream_run.task_id)
+                        for upstream_run in upstream
+                    }
+                    coroutine = _run_task(
+                        tasks_by_id[task_id],
+                        task_runs[task_id],
+                        upstream_outputs,
+                        params,
+                        logger,
+                        outputs_writer,
+                        task_cache,
+                    )
+                    running[asyncio.create_task(coroutine)] = task_id
+                    waiting.remove(task_id)
+
+            if not running:
+                # Skipping a task may unlock (i.e. skip) its downstream tasks
+                # so loop again until nothing is waiting
+                continue
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for future in done:
+                outputs[running.pop(future)] = future.result()
+    finally:
+        # Stop the tasks still running if the run has been cancelled
+        for future in running:
+            future.cancel()
+
+        for task_run in task_runs.values():
+            if task_run.status in (
+                PipelineRunStatus.PENDING,
+                PipelineRunStatus.RUNNING,
+            ):
+                task_run.status = PipelineRunStatus.CANCELLED
+
+
+async def _run_task(
+    task: Task,
+    task_run: TaskRun,
+    upstream_outputs: Dict[str, Any],
+    params: Optional[BaseModel],
+    logger: logging.LoggerAdapter,
+    outputs_writer: RunOutputsWriter,
+    task_cache: RunTaskCache,
+) -> Any:
+    task_run.status = PipelineRunStatus.RUNNING
+    task_run.start_time = utcnow()
+
+    cache_key: Optional[str] = None
+
+    if task.cache:
+        cache_key = await task_cache.get_key(task, upstream_outputs, params)
+
+        if cache_key:
+            output = await task_cache.load(task_run, cache_key)
+
+            # Not checking the output itself, as DataFrames can't be used as bool
+            if task_run.cached:
+                logger.info("Using the cached output of task %s", task.id)
+                task_run.status = PipelineRunStatus.COMPLETED
+                task_run.duration = (
+                    utcnow() - task_run.start_time
+                ).total_seconds() * 1000
+                return output
+
+    logger.info("Executing task %s", task.id)
+
+    output = None
+
+    try:
+        output = await _execute_task_attempts(
+            task, task_run, upstream_outputs, params, logger
+        )
+        task_run.status = PipelineRunStatus.COMPLETED
+    except Exception as e:
+        logger.error(str(e), exc_info=e)
+        task_run.status = PipelineRunStatus.FAILED
+    finally:
+        task_run.duration = (utcnow() - task_run.start_time).total_seconds() * 1000
+
+    if output is not None:
+        # Written in background, the downstream tasks receive the output in memory
+        await outputs_writer.store(task_run, output, cache_key)
 
-        task_start_time = utcnow()
+    return output
+
+
+async def _execute_task_attempts(
+    task: Task,
+    task_run: TaskRun,
+    upstream_outputs: Dict[str, Any],
+    params: Optional[BaseModel],
+    logger: logging.LoggerAdapter,
+) -> Any:
+    """
+    Execute a task, running it again up to `task.retries` times if it fails,
+    waiting `task.backoff` seconds before the first retry and doubling
+    the delay at each retry. Every attempt is recorded in the task run.
+
+    A sync function that timed out may keep running in its executor,
+    it's not retried until it stops, waiting for it at most `task.timeout`
+    seconds, so 2 attempts never run at the same time.
+
+    Raises:
+        Exception: the error of the last attempt
+    """
+
+    for attempt in range(1, task.retries + 2):
+        task_attempt = TaskAttempt(attempt=attempt, start_time=utcnow())
+        task_run.attempts.append(task_attempt)
+        cancellation_token = CancellationToken()
 
         try:
-            flowing_data = await _execute_task(task, flowing_data, pipeline_params)
-            task_run.status = PipelineRunStatus.COMPLETED
-        except Exception as e:
-            logger.error(str(e), exc_info=e)
-            flowing_data = None
-            task_run.status = PipelineRunStatus.FAILED
-        finally:
-            task_run.duration = (utcnow() - task_start_time).total_seconds() * 1000
+            return await _execute_task_with_timeout(
+                task, upstream_outputs, params, logger, cancellation_token
+            )
+        except Exception as error:
+            task_attempt.error = f"{type(error).__name__}: {error}"
 
-            try:
-                task_run.has_output = store_task_output(
-                    pipeline_run.id, task.id, flowing_data
-                )
-            except InvalidDataPath as error:
+            if attempt > task.retries:
+                raise
+
+            if not await cancellation_token.wait_calls_stopped(task.timeout):
                 logger.error(
-                    "Can't store the task output as the path is invalid", exc_info=error
+                    "Task %s is not retried as its previous attempt is still running",
+                    task.id,
                 )
+                raise
+
+            delay = task.backoff * 2 ** (attempt - 1)
+            logger.warning(
+                "Task %s failed, retrying in %gs (attempt %d of %d)",
+                task.id,
+                delay,
+                attempt,
+                task.retries + 1,
+                exc_info=error,
+            )
+        finally:
+            task_attempt.duration = (
+                utcnow() - task_attempt.start_time
+            ).total_seconds() * 1000
 
-            pipeline_run.tasks_run.append(task_run)
-
-            if task_run.status == PipelineRunStatus.FAILED:
-                # A task failed so the entire pipeline failed
-                _on_pipeline_status_changed(
-                    pipeline, pipeline_run, PipelineRunStatus.FAILED
-                )
-                break
+        await asyncio.sleep(delay)
 
-    else:
-        # All task succeeded so the entire pipeline succeeded
-        _on_pipeline_status_changed(pipeline, pipeline_run, PipelineRunStatus.COMPLETED)
 
-    pipeline_context.reset(pipeline_token)
-    run_context.reset(run_token)
-    close_logger(logger)
+async def _execute_task_with_timeout(
+    task: Task,
+    upstream_outputs: Dict[str, Any],
+    params: Optional[BaseModel],
+    logger: logging.LoggerAdapter,
+    cancellation_token: CancellationToken,
+) -> Any:
+    """
+    Execute a task with its own cancellation token, cancelled when
+    the task times out or the run is cancelled.
 
+    Raises:
+        TaskTimeout: if the task doesn't end within `task.timeout` seconds
+    """
 
-@dataclass
-class TaskFunctionSignature:
-    has_positional_args: bool = False
-    has_params_arg: bool = False
+    context_token = cancellation_context.set(cancellation_token)
+    # The task gets a copy of the current context, so it sees the token
+    execution = asyncio.ensure_future(_execute_task(task, upstream_outputs, params))
+    cancellation_context.reset(context_token)
 
+    try:
+        # Not `wait_for`, so a TimeoutError raised by the task isn't taken for a timeout
+        done, _ = await asyncio.wait([execution], timeout=task.timeout)
+    finally:
+        if not execution.done():
+            cancellation_token.cancel()
+            execution.cancel()
 
-def check_task_signature(func: Callable) -> TaskFunctionSignature:
-    """
-    Check if a function signature declares positional args.
+    if not done:
+        # Let the executor pool track the function, if it's still running
+        await asyncio.wait([execution])
 
-    This is meant to be used to check if a task function accepts data inputs from another task.
+        if _runs_in_thread(task):
+            logger.warning(
+                "The function of task %s can't be interrupted, it keeps running in "
+                "the %s executor until it returns or checks its cancellation token",
+                task.id,
+                task.executor,
+            )
 
-    The signature of the task run function should be:
-    `def task_fn(previous_task_output: Any, params: Model):`
+        raise TaskTimeout(task.id, task.timeout)
 
-    Where the params argument is the Pipeline input params.
-    """
+    return execution.result()
 
-    result = TaskFunctionSignature()
 
-    for name, parameter in inspect.signature(func).parameters.items():
-        if (
-            parameter.kind == inspect.Parameter.POSITIONAL_ONLY
-            or inspect.Parameter.VAR_POSITIONAL
-        ) and name != "params":
-            result.has_positional_args = True
-        elif parameter.VAR_KEYWORD or (parameter.KEYWORD_ONLY and name == "params"):
-            result.has_params_arg = True
+def _runs_in_thread(task: Task) -> bool:
+    if asyncio.iscoroutinefunction(getattr(task.run, "__wrapped__", task.run)):
+        return False
 
-    return result
+    return executors.get_settings(task.executor).type == "thread"
 
 
 async def _execute_task(
     task: Task,
-    flowing_data,
+    upstream_outputs: Dict[str, Any],
     params: Optional[BaseModel] = None,
 ):
-    result = check_task_signature(task.run)
+    signature = check_task_signature(task.run)
+
+    # Upstream outputs are passed by name when the function declares
+    # an argument with the same name as the upstream task
+    kwargs = {
+        task_id: output
+        for task_id, output in upstream_outputs.items()
+        if task_id in signature.argument_names
+    }
+
+    args = []
 
-    args = [flowing_data] if result.has_positional_args else []
-    kwargs = {"params": params} if params and result.has_params_arg else {}
+    if signature.has_positional_args and not kwargs:
+        # Otherwise the output of the only upstream task, i.e. the previous
+        # task in a sequential pipeline, is passed as positional argument,
+        # the pipeline checks that the tasks with many upstream tasks
+        # receive their outputs by name
+        args.append(next(iter(upstream_outputs.values()), None))
 
-    result = await task.run(*args, **kwargs)
+    if params and signature.has_params_arg:
+        kwargs["params"] = params
 
-    return result
+    return await task.run(*args, **kwargs)
@@ -0,0 +1,91 @@
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+
+from plombery.config import settings
+from plombery.database.async_repository import acquire_lock
+from plombery.database.repository import release_lock
+from plombery.orchestrator.executor import utcnow
+from plombery.utils import get_instance_id
+
+_logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Elects a single leader among the replicas of the app sharing the same DB.
+
+    The leader holds a lock row in the DB with a TTL and renews it periodically,
+    if it dies, the lock expires and another replica takes over within
+    `scheduler_lease_duration` seconds.
+    """
+
+    def __init__(
+        self,
+        lock_name: str,
+        on_elected: Callable[[], Awaitable[None]],
+        on_deposed: Callable[[], None],
+        holder: Optional[str] = None,
+    ) -> None:
+        self.lock_name = lock_name
+        self.holder = holder or get_instance_id()
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lease_duration(self) -> timedelta:
+        return timedelta(seconds=settings.scheduler_lease_duration)
+
+    def start(self):
+        self._task = asyncio.create_task(self._renew_periodically())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        if self.is_leader:
+            # Release the lock so the other replicas don't need to wait its
+            # expiration, it's done once at shutdown so it can block
+            release_lock(self.lock_name, self.holder)
+            self.is_leader = False
+            self.on_deposed()
+
+    async def try_acquire(self) -> bool:
+        now = utcnow()
+
+        try:
+            acquired = await acquire_lock(
+                self.lock_name, self.holder, now + self.lease_duration, now
+            )
+        except Exception as error:
+            # Better to not be a leader for a while than having 2 leaders
+            _logger.error(
+                "Couldn't acquire the lock %s", self.lock_name, exc_info=error
+            )
+            acquired = False
+
+        await self._set_leader(acquired)
+        return acquired
+
+    async def _set_leader(self, is_leader: bool):
+        if is_leader == self.is_leader:
+            return
+
+        self.is_leader = is_leader
+
+        if is_leader:
+            _logger.info("%s acquired the lock %s", self.holder, self.lock_name)
+            await self.on_elected()
+        else:
+            _logger.info("%s lost the lock %s", self.holder, self.lock_name)
+            self.on_deposed()
+
+    async def _renew_periodically(self):
+        while True:
+            # Try immediately so a single replica doesn't wait to be elected
+            await self.try_acquire()
+            await asyncio.sleep(self.lease_duration.total_seconds() / 3)
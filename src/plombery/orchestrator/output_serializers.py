@@ -0,0 +1,556 @@
+"""
+Serializers storing the tasks outputs, the first serializer of
+`settings.output_formats` supporting the output type is used.
+"""
+
+from itertools import islice
+import json
+import sys
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from plombery.config import settings
+from plombery.schemas import OutputColumn
+
+# Rows per parquet row group or arrow record batch, small enough
+# to read a page of rows without reading the whole file
+_ROWS_CHUNK_SIZE = 64 * 1024
+_READ_SIZE = 64 * 1024
+
+
+class UnsupportedOutput(Exception):
+    """The data can't be written in the requested format"""
+
+
+class OutputSerializer:
+    format: str
+    """Name of the format, i.e. used in `settings.output_formats`"""
+    extension: str
+    media_type: str
+    compress_file: bool = True
+    """If the whole file is compressed when `settings.data_compression` is set"""
+
+    def is_available(self) -> bool:
+        """False if the packages required by the format aren't installed"""
+        return True
+
+    def accepts(self, data: Any) -> bool:
+        """True if the data should be stored in this format"""
+        raise NotImplementedError()
+
+    def write(self, data: Any, file: BinaryIO):
+        """
+        Raises:
+            UnsupportedOutput: if the data can't be written in this format
+        """
+        raise NotImplementedError()
+
+    def read(self, file: BinaryIO) -> Any:
+        """Read the data in a format that any other serializer can write,
+        i.e. a pyarrow Table, a list or a dict"""
+        raise NotImplementedError()
+
+    def read_rows(
+        self,
+        file: BinaryIO,
+        offset: int,
+        limit: int,
+        columns: Optional[List[str]] = None,
+    ) -> Optional[List[Any]]:
+        """Read a page of rows, None if the output isn't a table or a list.
+
+        By default the whole file is read, formats supporting random
+        access read only the requested rows."""
+
+        data = self.read(file)
+
+        if _is_arrow_table(data):
+            data = data.to_pylist()
+
+        if not isinstance(data, list):
+            return None
+
+        return select_columns(data[offset : offset + limit], columns)
+
+    def iter_rows(self, file: BinaryIO) -> Optional[Iterator[List[Any]]]:
+        """Read a table or a list by chunks of rows, None if the output isn't
+        a table or a list, or the format can't be read by chunks"""
+
+        return None
+
+    def write_rows(self, chunks: Iterator[List[Any]]) -> Optional[Iterator[bytes]]:
+        """Write chunks of rows while they're read, None if the format
+        can't be written by chunks"""
+
+        return None
+
+
+def _iter_chunks(rows: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _is_dataframe(data: Any) -> bool:
+    # If pandas isn't imported yet, the data can't be a DataFrame,
+    # so it's not imported just for the check, as it's slow.
+    # The module may be still being imported by another thread
+    dataframe_class = getattr(sys.modules.get("pandas"), "DataFrame", None)
+
+    return dataframe_class is not None and isinstance(data, dataframe_class)
+
+
+def _is_arrow_table(data: Any) -> bool:
+    table_class = getattr(sys.modules.get("pyarrow"), "Table", None)
+
+    return table_class is not None and isinstance(data, table_class)
+
+
+def _to_arrow_table(data: Any):
+    import pyarrow
+
+    if isinstance(data, pyarrow.Table):
+        return data
+
+    if _is_dataframe(data):
+        return pyarrow.Table.from_pandas(data, preserve_index=False)
+
+    if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+        try:
+            return pyarrow.Table.from_pylist(data)
+        except (pyarrow.ArrowException, TypeError) as error:
+            raise UnsupportedOutput(str(error))
+
+    raise UnsupportedOutput("Only tables or lists of records can be stored as tables")
+
+
+def select_columns(rows: List[Any], columns: Optional[List[str]]) -> List[Any]:
+    """Keep only some columns of the rows that are dicts"""
+
+    if not columns:
+        return rows
+
+    return [
+        (
+            {column: row.get(column) for column in columns}
+            if isinstance(row, dict)
+            else row
+        )
+        for row in rows
+    ]
+
+
+def to_jsonable(rows: List[Any]) -> List[Any]:
+    # Values like dates or decimals are sent as strings, like the JSON outputs
+    return json.loads(json.dumps(rows, default=str))
+
+
+def describe_output(data: Any, preview_rows: int) -> Dict[str, Any]:
+    """Get the schema, the number of rows and the first rows of an output,
+    empty if it's not a table or a list"""
+
+    if _is_dataframe(data):
+        return dict(
+            columns=[
+                OutputColumn(name=str(name), type=str(dtype))
+                for name, dtype in data.dtypes.items()
+            ],
+            num_rows=len(data),
+            rows=json.loads(data.head(preview_rows).to_json(orient="records")),
+        )
+
+    if _is_arrow_table(data):
+        return dict(
+            columns=[
+                OutputColumn(name=field.name, type=str(field.type))
+                for field in data.schema
+            ],
+            num_rows=data.num_rows,
+            rows=to_jsonable(data.slice(0, preview_rows).to_pylist()),
+        )
+
+    if isinstance(data, (list, tuple)):
+        columns = None
+
+        if data and isinstance(data[0], dict):
+            columns = [
+                OutputColumn(name=str(name), type=type(value).__name__)
+                for name, value in data[0].items()
+            ]
+
+        return dict(
+            columns=columns,
+            num_rows=len(data),
+            rows=to_jsonable(list(data[:preview_rows])),
+        )
+
+    return {}
+
+
+class _TableSerializer(OutputSerializer):
+    # Compressed internally, by column chunks or batches
+    compress_file = False
+
+    def is_available(self) -> bool:
+        try:
+            import pyarrow  # noqa F401
+        except ModuleNotFoundError:
+            return False
+
+        return True
+
+    def accepts(self, data: Any) -> bool:
+        return _is_dataframe(data) or _is_arrow_table(data)
+
+
+class ParquetSerializer(_TableSerializer):
+    format = "parquet"
+    extension = "parquet"
+    media_type = "application/vnd.apache.parquet"
+
+    def write(self, data: Any, file: BinaryIO):
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(
+            _to_arrow_table(data),
+            file,
+            row_group_size=_ROWS_CHUNK_SIZE,
+            compression=settings.data_compression or "snappy",
+        )
+
+    def read(self, file: BinaryIO) -> Any:
+        import pyarrow.parquet
+
+        return pyarrow.parquet.read_table(file)
+
+    def read_rows(
+        self,
+        file: BinaryIO,
+        offset: int,
+        limit: int,
+        columns: Optional[List[str]] = None,
+    ) -> Optional[List[Any]]:
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(file)
+        metadata = parquet_file.metadata
+
+        # Read only the row groups containing the requested rows
+        row_groups: List[int] = []
+        first_row = 0
+        group_start = 0
+
+        for i in range(metadata.num_row_groups):
+            group_end = group_start + metadata.row_group(i).num_rows
+
+            if group_end > offset and group_start < offset + limit:
+                if not row_groups:
+                    first_row = group_start
+                row_groups.append(i)
+
+            group_start = group_end
+
+        if not row_groups:
+            return []
+
+        table = parquet_file.read_row_groups(row_groups, columns=columns)
+
+        return table.slice(offset - first_row, limit).to_pylist()
+
+    def iter_rows(self, file: BinaryIO) -> Optional[Iterator[List[Any]]]:
+        import pyarrow.parquet
+
+        batches = pyarrow.parquet.ParquetFile(file).iter_batches(
+            batch_size=_ROWS_CHUNK_SIZE
+        )
+
+        return (batch.to_pylist() for batch in batches)
+
+
+class ArrowSerializer(_TableSerializer):
+    """Arrow IPC file format, faster to read than parquet but bigger"""
+
+    format = "arrow"
+    extension = "arrow"
+    media_type = "application/vnd.apache.arrow.file"
+
+    def write(self, data: Any, file: BinaryIO):
+        import pyarrow
+
+        table = _to_arrow_table(data)
+        # Arrow supports only zstd and lz4
+        options = pyarrow.ipc.IpcWriteOptions(
+            compression="zstd" if settings.data_compression else None
+        )
+
+        with pyarrow.ipc.new_file(file, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=_ROWS_CHUNK_SIZE)
+
+    def read(self, file: BinaryIO) -> Any:
+        import pyarrow
+
+        return pyarrow.ipc.open_file(file).read_all()
+
+    def read_rows(
+        self,
+        file: BinaryIO,
+        offset: int,
+        limit: int,
+        columns: Optional[List[str]] = None,
+    ) -> Optional[List[Any]]:
+        import pyarrow
+
+        # Only the footer and the batches being read are loaded
+        reader = pyarrow.ipc.open_file(file)
+        batches = []
+        batch_start = 0
+        first_row = 0
+
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            batch_end = batch_start + batch.num_rows
+
+            if batch_end > offset:
+                if not batches:
+                    first_row = batch_start
+                batches.append(batch)
+
+            if batch_end >= offset + limit:
+                break
+
+            batch_start = batch_end
+
+        table = pyarrow.Table.from_batches(batches, schema=reader.schema)
+
+        if columns:
+            table = table.select(columns)
+
+        return table.slice(offset - first_row, limit).to_pylist()
+
+    def iter_rows(self, file: BinaryIO) -> Optional[Iterator[List[Any]]]:
+        import pyarrow
+
+        reader = pyarrow.ipc.open_file(file)
+
+        return (
+            reader.get_batch(i).to_pylist() for i in range(reader.num_record_batches)
+        )
+
+
+class MsgpackSerializer(OutputSerializer):
+    """For plain structures, faster and smaller than JSON"""
+
+    format = "msgpack"
+    extension = "msgpack"
+    media_type = "application/vnd.msgpack"
+
+    def is_available(self) -> bool:
+        try:
+            import msgpack  # noqa F401
+        except ModuleNotFoundError:
+            return False
+
+        return True
+
+    def accepts(self, data: Any) -> bool:
+        return isinstance(data, (dict, list, tuple))
+
+    def write(self, data: Any, file: BinaryIO):
+        import msgpack
+
+        if _is_dataframe(data) or _is_arrow_table(data):
+            data = _to_arrow_table(data).to_pylist()
+
+        # Same as JSON, unknown types are stored as strings
+        msgpack.pack(data, file, default=str)
+
+    def read(self, file: BinaryIO) -> Any:
+        import msgpack
+
+        return msgpack.unpack(file)
+
+    def read_rows(
+        self,
+        file: BinaryIO,
+        offset: int,
+        limit: int,
+        columns: Optional[List[str]] = None,
+    ) -> Optional[List[Any]]:
+        import msgpack
+
+        unpacker = msgpack.Unpacker(file)
+
+        try:
+            num_rows = unpacker.read_array_header()
+        except ValueError:
+            # Not a list
+            return None
+
+        # The rows before the offset are skipped without decoding them
+        for _ in range(min(offset, num_rows)):
+            unpacker.skip()
+
+        rows = [unpacker.unpack() for _ in range(min(limit, num_rows - offset))]
+
+        return select_columns(rows, columns)
+
+    def iter_rows(self, file: BinaryIO) -> Optional[Iterator[List[Any]]]:
+        import msgpack
+
+        unpacker = msgpack.Unpacker(file)
+
+        try:
+            num_rows = unpacker.read_array_header()
+        except ValueError:
+            # Not a list
+            return None
+
+        rows = (unpacker.unpack() for _ in range(num_rows))
+
+        return _iter_chunks(rows, _ROWS_CHUNK_SIZE)
+
+
+def _iter_lines(file: BinaryIO) -> Iterator[bytes]:
+    """Iterate the lines of a file, without the newlines, reading it by chunks
+    as the decompressed files may not support `readline`"""
+
+    parts: List[bytes] = []
+
+    while chunk := file.read(_READ_SIZE):
+        *lines, last = chunk.split(b"\n")
+
+        if lines:
+            lines[0] = b"".join(parts) + lines[0]
+            parts = []
+            yield from lines
+
+        parts.append(last)
+
+    if rest := b"".join(parts):
+        yield rest
+
+
+class JsonSerializer(OutputSerializer):
+    """Stores any output, it's the fallback format.
+
+    Lists are stored with a row per line, still as a JSON array,
+    so a page of rows is read without parsing the previous ones."""
+
+    format = "json"
+    extension = "json"
+    media_type = "application/json"
+
+    def accepts(self, data: Any) -> bool:
+        return True
+
+    def write(self, data: Any, file: BinaryIO):
+        if _is_dataframe(data):
+            rows = data.to_json(orient="records", lines=True).splitlines()
+            file.writelines(self._encode_rows([[row for row in rows if row]]))
+            return
+
+        if _is_arrow_table(data):
+            data = data.to_pylist()
+
+        if isinstance(data, (list, tuple)):
+            rows = [json.dumps(row, default=str) for row in data]
+            file.writelines(self._encode_rows([rows]))
+            return
+
+        file.write(json.dumps(data, default=str).encode("utf-8"))
+
+    def write_rows(self, chunks: Iterator[List[Any]]) -> Optional[Iterator[bytes]]:
+        return self._encode_rows(
+            [json.dumps(row, default=str) for row in chunk] for chunk in chunks
+        )
+
+    def _encode_rows(self, chunks: Iterable[List[str]]) -> Iterator[bytes]:
+        """Encode chunks of JSON rows as an array, with a row per line"""
+
+        separator = b"[\n"
+
+        for chunk in chunks:
+            encoded = []
+
+            for row in chunk:
+                encoded.append(separator + row.encode("utf-8"))
+                separator = b",\n"
+
+            yield b"".join(encoded)
+
+        yield b"[\n]" if separator == b"[\n" else b"\n]"
+
+    def read(self, file: BinaryIO) -> Any:
+        return json.load(file)
+
+    def read_rows(
+        self,
+        file: BinaryIO,
+        offset: int,
+        limit: int,
+        columns: Optional[List[str]] = None,
+    ) -> Optional[List[Any]]:
+        lines = _iter_lines(file)
+        first_line = next(lines, b"")
+
+        if first_line != b"[":
+            # Not a list, or a list stored on a single line by an older version
+            data = json.loads(b"\n".join([first_line, *lines]))
+
+            if not isinstance(data, list):
+                return None
+
+            return select_columns(data[offset : offset + limit], columns)
+
+        rows = []
+
+        # The rows before the offset are skipped without decoding them
+        for i, line in enumerate(lines):
+            if line == b"]" or len(rows) == limit:
+                break
+
+            if i >= offset:
+                rows.append(json.loads(line.rstrip(b",")))
+
+        return select_columns(rows, columns)
+
+
+_serializers: Dict[str, OutputSerializer] = {}
+
+
+def register_output_serializer(serializer: OutputSerializer):
+    """Register a serializer, to use it add its format to `settings.output_formats`"""
+
+    _serializers[serializer.format] = serializer
+
+
+for _serializer in (
+    ParquetSerializer(),
+    ArrowSerializer(),
+    MsgpackSerializer(),
+    JsonSerializer(),
+):
+    register_output_serializer(_serializer)
+
+
+def get_output_serializer(format: str) -> Optional[OutputSerializer]:
+    serializer = _serializers.get(format)
+
+    return serializer if serializer and serializer.is_available() else None
+
+
+def get_output_formats() -> List[str]:
+    """The formats that can be used to store and convert the outputs"""
+
+    return [format for format in _serializers if get_output_serializer(format)]
+
+
+def choose_output_serializer(data: Any) -> OutputSerializer:
+    """Pick the first of the configured formats accepting the data,
+    JSON if none of them does"""
+
+    for format in settings.output_formats:
+        serializer = get_output_serializer(format)
+
+        if serializer and serializer.accepts(data):
+            return serializer
+
+    return _serializers["json"]
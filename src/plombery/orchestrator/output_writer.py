@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Any, Optional, Set
+
+from plombery.config import settings
+from plombery.exceptions import InvalidDataPath
+from plombery.orchestrator.data_storage import (
+    cache_task_output,
+    evict_cached_task_outputs,
+    get_task_output,
+    store_task_output,
+)
+from plombery.pipeline.executors import executors
+from plombery.schemas import TaskOutput, TaskRun
+
+
+def _store_output(
+    pipeline_run_id: int, task_id: str, output: Any, cache_key: Optional[str] = None
+) -> Optional[TaskOutput]:
+    if not store_task_output(pipeline_run_id, task_id, output):
+        return None
+
+    if cache_key and cache_task_output(pipeline_run_id, task_id, cache_key, output):
+        evict_cached_task_outputs(
+            settings.task_cache.ttl, settings.task_cache.max_bytes
+        )
+
+    return get_task_output(pipeline_run_id, task_id)
+
+
+class RunOutputsWriter:
+    """
+    Write the outputs of the tasks of a run in the `outputs` executor pool,
+    so serializing a large output doesn't block the event loop, and the
+    downstream tasks, receiving the outputs in memory, start immediately.
+
+    The outputs aren't copied, as it would double the memory used by the
+    large ones, so the tasks must not change the outputs they receive,
+    otherwise the stored outputs may include their changes.
+
+    At most `max_pending` outputs wait to be written: when the queue is full,
+    `store` waits for a write to end. The run must be finalized only once
+    `wait` returned, i.e. all its outputs are on disk.
+    """
+
+    def __init__(
+        self, pipeline_run_id: int, logger: logging.LoggerAdapter, max_pending: int
+    ):
+        self.pipeline_run_id = pipeline_run_id
+        self.logger = logger
+        self._slots = asyncio.Semaphore(max_pending)
+        self._writes: Set[asyncio.Task] = set()
+
+    async def store(
+        self, task_run: TaskRun, output: Any, cache_key: Optional[str] = None
+    ):
+        """Queue the output of a task, the task run is updated once it's written.
+        If `cache_key` is set, the output is added to the tasks cache."""
+
+        await self._slots.acquire()
+
+        # Not cancelled with the task, so the output is stored anyway
+        write = asyncio.create_task(self._write(task_run, output, cache_key))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, task_run: TaskRun, output: Any, cache_key: Optional[str]):
+        try:
+            task_output = await executors.get("outputs").run(
+                _store_output,
+                self.pipeline_run_id,
+                task_run.task_id,
+                output,
+                cache_key,
+            )
+        except InvalidDataPath as error:
+            self.logger.error(
+                "Can't store the task output as the path is invalid", exc_info=error
+            )
+            return
+        except Exception as error:
+            self.logger.error("Failed to store the task output", exc_info=error)
+            return
+        finally:
+            self._slots.release()
+
+        if task_output:
+            task_run.has_output = True
+            task_run.output_size = task_output.size
+            task_run.output_format = task_output.format
+
+    async def wait(self):
+        """Wait until all the queued outputs are written"""
+
+        if self._writes:
+            await asyncio.wait(list(self._writes))
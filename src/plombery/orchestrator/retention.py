@@ -0,0 +1,154 @@
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+
+from plombery.config import settings
+from plombery.database.async_repository import (
+    delete_pipeline_runs,
+    list_ended_pipeline_run_ids,
+    list_runs_pipeline_ids,
+)
+from plombery.orchestrator.data_storage import delete_run_data, get_run_data_size
+from plombery.orchestrator.executor import utcnow
+from plombery.pipeline.pipeline import Pipeline
+from plombery.schemas import RetentionPolicy, RetentionReport
+
+_logger = logging.getLogger(__name__)
+
+
+class GarbageCollector:
+    """
+    Delete the ended runs exceeding the retention policy of their pipeline,
+    with their tasks, logs and outputs.
+
+    The collection runs every `settings.retention.interval` seconds on the
+    leader replica only. The runs are deleted in batches: the DB queries run in
+    the `db` pool and the files are deleted in a thread, so the event loop,
+    and so the scheduler, is never blocked.
+    """
+
+    def __init__(
+        self,
+        get_pipeline: Callable[[str], Optional[Pipeline]],
+        is_leader: Callable[[], bool],
+    ) -> None:
+        self.get_pipeline = get_pipeline
+        self.is_leader = is_leader
+        self.last_report: Optional[RetentionReport] = None
+        self._task: Optional[asyncio.Task] = None
+        # The data of the ended runs doesn't change, so their size is computed once
+        self._run_sizes: Dict[int, int] = {}
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect_periodically())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_policy(self, pipeline_id: str) -> RetentionPolicy:
+        """The global policy, with the limits set by the pipeline, if any"""
+
+        policy = RetentionPolicy.model_validate(
+            settings.retention.model_dump(include=set(RetentionPolicy.model_fields))
+        )
+        pipeline = self.get_pipeline(pipeline_id)
+
+        if pipeline and pipeline.retention:
+            policy = policy.model_copy(
+                update=pipeline.retention.model_dump(exclude_unset=True)
+            )
+
+        return policy
+
+    async def _collect_periodically(self):
+        while True:
+            await asyncio.sleep(settings.retention.interval)
+
+            if not self.is_leader():
+                continue
+
+            try:
+                await self.collect()
+            except Exception as error:
+                _logger.error(
+                    "The garbage collection of the runs failed", exc_info=error
+                )
+
+    async def collect(self) -> RetentionReport:
+        """Delete the runs exceeding the retention policies"""
+
+        report = RetentionReport(start_time=utcnow())
+
+        for pipeline_id in await list_runs_pipeline_ids():
+            policy = self.get_policy(pipeline_id)
+
+            if policy.is_empty:
+                continue
+
+            while run_ids := await self._find_expired_runs(pipeline_id, policy):
+                await self._delete_runs(run_ids, report)
+
+        report.duration = (utcnow() - report.start_time).total_seconds() * 1000
+        self.last_report = report
+
+        if report.deleted_runs:
+            _logger.info(
+                "Deleted %s runs, reclaimed %s bytes",
+                report.deleted_runs,
+                report.reclaimed_bytes,
+            )
+
+        return report
+
+    async def _find_expired_runs(
+        self, pipeline_id: str, policy: RetentionPolicy
+    ) -> List[int]:
+        """Find the next batch of runs to delete"""
+
+        batch_size = settings.retention.batch_size
+
+        if policy.max_runs:
+            if run_ids := await list_ended_pipeline_run_ids(
+                pipeline_id, skip=policy.max_runs, limit=batch_size
+            ):
+                return run_ids
+
+        if policy.max_age:
+            if run_ids := await list_ended_pipeline_run_ids(
+                pipeline_id, started_before=utcnow() - policy.max_age, limit=batch_size
+            ):
+                return run_ids
+
+        if policy.max_bytes:
+            run_ids = await list_ended_pipeline_run_ids(pipeline_id)
+            total_size = 0
+
+            # Keep the most recent runs fitting the max size
+            for i, run_id in enumerate(run_ids):
+                total_size += await self._get_run_size(run_id)
+
+                if total_size > policy.max_bytes:
+                    return run_ids[i : i + batch_size]
+
+        return []
+
+    async def _get_run_size(self, pipeline_run_id: int) -> int:
+        if pipeline_run_id not in self._run_sizes:
+            self._run_sizes[pipeline_run_id] = await asyncio.to_thread(
+                get_run_data_size, pipeline_run_id
+            )
+
+        return self._run_sizes[pipeline_run_id]
+
+    async def _delete_runs(self, pipeline_run_ids: List[int], report: RetentionReport):
+        # Delete the files first, so if the app stops in the middle,
+        # they're deleted with the runs at the next collection
+        for pipeline_run_id in pipeline_run_ids:
+            report.reclaimed_bytes += await asyncio.to_thread(
+                delete_run_data, pipeline_run_id
+            )
+            self._run_sizes.pop(pipeline_run_id, None)
+
+        report.deleted_runs += await delete_pipeline_runs(pipeline_run_ids)
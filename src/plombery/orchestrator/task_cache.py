@@ -0,0 +1,146 @@
+"""
+Cache of the outputs of the tasks with `cache=True`, so a task isn't run
+again when its code, the pipeline params and the outputs of its upstream
+tasks didn't change.
+"""
+
+import hashlib
+import json
+import logging
+import pickle
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from plombery.config import settings
+from plombery.orchestrator.data_storage import restore_cached_task_output
+from plombery.orchestrator.output_serializers import _is_arrow_table, _is_dataframe
+from plombery.pipeline.executors import executors
+from plombery.pipeline.task import Task
+from plombery.schemas import TaskRun
+
+
+def hash_output(data: Any) -> str:
+    """Hash of the content of an output, the same data has the same hash
+    in every run
+
+    Raises:
+        Exception: if the data can't be hashed, i.e. it isn't picklable
+    """
+
+    digest = hashlib.sha256()
+
+    if _is_dataframe(data):
+        import pandas
+
+        digest.update(repr(data.dtypes.to_dict()).encode("utf-8"))
+        digest.update(pandas.util.hash_pandas_object(data).to_numpy().tobytes())
+    elif _is_arrow_table(data):
+        import pyarrow
+
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, data.schema) as writer:
+            writer.write_table(data)
+        digest.update(sink.getvalue())
+    else:
+        digest.update(pickle.dumps(data, protocol=5))
+
+    return digest.hexdigest()
+
+
+def get_cache_key(
+    pipeline_id: str,
+    task: Task,
+    params: Optional[BaseModel],
+    upstream_hashes: Dict[str, str],
+) -> str:
+    key = json.dumps(
+        dict(
+            pipeline=pipeline_id,
+            task=task.id,
+            version=task.version,
+            params=params.model_dump(mode="json") if params else None,
+            upstream=upstream_hashes,
+        ),
+        sort_keys=True,
+    )
+
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _load_cached_output(pipeline_run_id: int, task_id: str, cache_key: str):
+    return restore_cached_task_output(
+        pipeline_run_id, task_id, cache_key, settings.task_cache.ttl
+    ) or (None, None)
+
+
+class RunTaskCache:
+    """
+    Compute the cache keys of the tasks of a run and restore their cached outputs.
+
+    The outputs are hashed and read in the `outputs` executor pool, as
+    they may be large, and each output is hashed once per run, even if
+    it's the input of many tasks.
+    """
+
+    def __init__(
+        self, pipeline_id: str, pipeline_run_id: int, logger: logging.LoggerAdapter
+    ):
+        self.pipeline_id = pipeline_id
+        self.pipeline_run_id = pipeline_run_id
+        self.logger = logger
+        self._output_hashes: Dict[str, str] = {}
+
+    async def get_key(
+        self,
+        task: Task,
+        upstream_outputs: Dict[str, Any],
+        params: Optional[BaseModel],
+    ) -> Optional[str]:
+        """The cache key of a task, None if it can't be computed"""
+
+        for task_id, output in upstream_outputs.items():
+            if task_id in self._output_hashes:
+                continue
+
+            try:
+                self._output_hashes[task_id] = await executors.get("outputs").run(
+                    hash_output, output
+                )
+            except Exception as error:
+                self.logger.warning(
+                    "Task %s can't be cached as the output of %s can't be hashed",
+                    task.id,
+                    task_id,
+                    exc_info=error,
+                )
+                return None
+
+        upstream_hashes = {
+            task_id: self._output_hashes[task_id] for task_id in upstream_outputs
+        }
+
+        return get_cache_key(self.pipeline_id, task, params, upstream_hashes)
+
+    async def load(self, task_run: TaskRun, cache_key: str) -> Any:
+        """Restore the cached output of a task in the run, None if not cached"""
+
+        try:
+            task_output, output = await executors.get("outputs").run(
+                _load_cached_output, self.pipeline_run_id, task_run.task_id, cache_key
+            )
+        except Exception as error:
+            self.logger.warning(
+                "Failed to read the cached output of task %s",
+                task_run.task_id,
+                exc_info=error,
+            )
+            return None
+
+        if task_output:
+            task_run.cached = True
+            task_run.has_output = True
+            task_run.output_size = task_output.size
+            task_run.output_format = task_output.format
+
+        return output
@@ -0,0 +1,162 @@
+from collections import Counter
+from datetime import timedelta
+from typing import Optional
+import asyncio
+import logging
+import signal
+
+from plombery.config import settings
+from plombery.logger.web_socket_handler import websocket_handler
+from plombery.database.async_repository import (
+    claim_pipeline_run,
+    count_claimed_pipeline_runs,
+    release_expired_pipeline_runs,
+    renew_pipeline_run_leases,
+)
+from plombery.orchestrator import orchestrator
+from plombery.orchestrator.dispatcher import dispatcher
+from plombery.orchestrator.executor import utcnow
+from plombery.pipeline.trigger import OverlapPolicy
+from plombery.utils import get_instance_id
+
+_logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Executes the runs queued by the web server when `execution_mode` is `workers`.
+
+    The worker claims the pending runs from the DB with a lease that
+    it renews at every poll (the heartbeat), if it stops renewing it, i.e.
+    because it crashed, its runs are cancelled by the other workers.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        poll_interval: float = 1,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        self.id = worker_id or get_instance_id()
+        self.concurrency = concurrency or settings.max_concurrent_runs or 10
+        self.poll_interval = poll_interval
+        self._stopping: Optional[asyncio.Event] = None
+
+    @property
+    def lease_duration(self) -> timedelta:
+        return timedelta(seconds=settings.worker_lease_duration)
+
+    async def run(self):
+        """Claim and execute runs until the worker is stopped, then wait
+        for the running runs to complete"""
+
+        self._stopping = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # i.e. on Windows or not in the main thread
+                pass
+
+        websocket_handler.start()
+
+        _logger.info("Worker %s started", self.id)
+
+        while not self._stopping.is_set() or dispatcher.active_run_ids:
+            await self.poll()
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            if self._stopping.is_set() and dispatcher.active_run_ids:
+                # Don't spin while waiting for the runs to complete
+                await asyncio.sleep(self.poll_interval)
+
+        websocket_handler.stop()
+
+        _logger.info("Worker %s stopped", self.id)
+
+    def stop(self):
+        """Stop claiming new runs, the running ones are completed"""
+
+        if self._stopping:
+            self._stopping.set()
+
+    async def poll(self):
+        now = utcnow()
+
+        await release_expired_pipeline_runs(now)
+        await self._renew_leases(now)
+
+        if not (self._stopping and self._stopping.is_set()):
+            await self._claim_runs(now)
+
+    async def _renew_leases(self, now):
+        active_run_ids = dispatcher.active_run_ids
+
+        if not active_run_ids:
+            return
+
+        renewed = await renew_pipeline_run_leases(
+            self.id, active_run_ids, now + self.lease_duration
+        )
+
+        for pipeline_run_id in set(active_run_ids) - renewed:
+            # The run was cancelled or the lease expired and
+            # it's been taken over
+            dispatcher.cancel(pipeline_run_id)
+
+    async def _claim_runs(self, now):
+        claimed_runs = await count_claimed_pipeline_runs()
+        runs_by_pipeline: Counter[str] = Counter()
+        for (pipeline_id, _), count in claimed_runs.items():
+            runs_by_pipeline[pipeline_id] += count
+
+        # The pipeline limits apply to all the workers
+        excluded_pipeline_ids = [
+            pipeline.id
+            for pipeline in orchestrator.pipelines.values()
+            if pipeline.max_concurrent_runs
+            and runs_by_pipeline[pipeline.id] >= pipeline.max_concurrent_runs
+        ]
+
+        excluded_triggers = [
+            (pipeline.id, trigger.id)
+            for pipeline in orchestrator.pipelines.values()
+            for trigger in pipeline.triggers
+            if trigger.overlap_policy == OverlapPolicy.QUEUE
+            and claimed_runs.get((pipeline.id, trigger.id))
+        ]
+
+        while len(dispatcher.active_run_ids) < self.concurrency:
+            pipeline_run = await claim_pipeline_run(
+                self.id,
+                now + self.lease_duration,
+                pipeline_ids=orchestrator.pipelines.keys(),
+                excluded_pipeline_ids=excluded_pipeline_ids,
+                excluded_triggers=excluded_triggers,
+            )
+
+            if not pipeline_run:
+                break
+
+            queued_run = orchestrator._make_queued_run(pipeline_run)
+            dispatcher.enqueue(queued_run)
+
+            runs_by_pipeline[queued_run.pipeline.id] += 1
+            if (
+                queued_run.pipeline.max_concurrent_runs
+                and runs_by_pipeline[queued_run.pipeline.id]
+                >= queued_run.pipeline.max_concurrent_runs
+            ):
+                excluded_pipeline_ids.append(queued_run.pipeline.id)
+
+            if (
+                queued_run.trigger
+                and queued_run.trigger.overlap_policy == OverlapPolicy.QUEUE
+            ):
+                excluded_triggers.append(queued_run.trigger_key)
@@ -1,25 +1,106 @@
 import asyncio
 import functools
-from typing import Callable, Union
+import hashlib
+import inspect
+from typing import Callable, List, Optional, Union
 
 from .task import Task
 from .context import task_context
+from .executors import executors, get_function_reference
 
 
-def task(func: Union[Callable, functools.partial]):
+def task(
+    func: Optional[Union[Callable, functools.partial]] = None,
+    *,
+    upstream: Optional[List[Union[Task, str]]] = None,
+    executor: str = "thread",
+    cache: bool = False,
+    version: Optional[str] = None,
+    retries: int = 0,
+    backoff: float = 1,
+    timeout: Optional[float] = None,
+):
+    """Turn a function into a pipeline task.
+
+    It can be used as a bare decorator (`@task`) or with options:
+
+    ```py
+    @task(upstream=[extract_sales, extract_stores])
+    def merge(extract_sales, extract_stores):
+        ...
+    ```
+
+    Args:
+        upstream: tasks (or task IDs) this task depends on, their outputs
+            are passed to the function via the arguments with the same name.
+            The outputs aren't copied, so the function must not change them
+        executor: name of the executor pool where sync functions run, by default
+            `thread` or `process` or any pool declared in the settings.
+            Process pools are meant for CPU-bound tasks and require the function
+            to be defined at the top level of a module and its arguments and
+            output to be picklable
+        cache: reuse the output of a previous run of the task if its code,
+            the pipeline params and the outputs of its upstream tasks
+            didn't change, rather than running it again
+        version: version of the task code used in the cache key, change it to
+            invalidate the cache, by default a hash of the function source
+        retries: number of times the task is run again if it fails
+        backoff: seconds before the first retry, doubled at each retry
+        timeout: seconds after which an attempt fails. Async tasks are cancelled
+            and tasks running in a process are interrupted, while tasks running
+            in a thread can't be interrupted, so their functions keep running
+            until they check their cancellation token, see
+            `get_cancellation_token`, but their result is discarded.
+            A timed out attempt is retried only once its function stopped,
+            waiting for it at most `timeout` seconds, otherwise the task fails
+    """
+
+    if func is None:
+
+        def decorator(func: Union[Callable, functools.partial]):
+            return task(
+                func,
+                upstream=upstream,
+                executor=executor,
+                cache=cache,
+                version=version,
+                retries=retries,
+                backoff=backoff,
+                timeout=timeout,
+            )
+
+        return decorator
+
+    is_async = asyncio.iscoroutinefunction(func)
+    runs_in_process = executors.get_settings(executor).type == "process"
+
+    if runs_in_process:
+        if is_async:
+            raise ValueError("Async tasks can't run in a process")
+
+        # Fail early if the function can't be sent to a process
+        get_function_reference(func)
+
     @functools.wraps(func)
     async def wrapper_decorator(*args, **kwargs):
         token = task_context.set(task_instance)
 
-        if asyncio.iscoroutinefunction(func):
+        if is_async:
             value = await func(*args, **kwargs)
         else:
-            # Run in thread rather than in event loop to propagate context
+            if runs_in_process:
+                from plombery.logger import get_logger
+
+                # Be sure the task logger is ready to handle
+                # the logs coming from the worker process
+                get_logger()
+
+            # Run in a pool rather than in event loop to propagate context
             # to sync functions as well.
             #
             # This fixes:
             # https://github.com/lucafaggianelli/plombery/issues/153
-            value = await asyncio.to_thread(func, *args, **kwargs)
+            value = await executors.get(executor).run(func, *args, **kwargs)
 
         task_context.reset(token)
 
@@ -32,6 +113,37 @@ def task(func: Union[Callable, functools.partial]):
         id = func.__name__
         description = func.__doc__
 
-    task_instance = Task(id=id, description=description, run=wrapper_decorator)
+    task_instance = Task(
+        id=id,
+        description=description,
+        run=wrapper_decorator,
+        executor=executor,
+        cache=cache,
+        version=version or (_get_code_version(func) if cache else None),
+        retries=retries,
+        backoff=backoff,
+        timeout=timeout,
+        upstream=[
+            dependency.id if isinstance(dependency, Task) else dependency
+            for dependency in upstream or []
+        ],
+    )
 
     return task_instance
+
+
+def _get_code_version(func: Union[Callable, functools.partial]) -> str:
+    """Hash of the function source, or of its bytecode if the source
+    isn't available, i.e. in a REPL"""
+
+    partial_args = ""
+    if isinstance(func, functools.partial):
+        partial_args = repr((func.args, func.keywords))
+        func = func.func
+
+    try:
+        code = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = repr((func.__code__.co_code, func.__code__.co_consts))
+
+    return hashlib.sha256((code + partial_args).encode("utf-8")).hexdigest()[:16]
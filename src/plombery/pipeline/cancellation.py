@@ -0,0 +1,94 @@
+from concurrent.futures import Future
+from contextvars import ContextVar
+import asyncio
+import threading
+from typing import List, Optional
+
+from plombery.exceptions import TaskCancelled
+
+
+class CancellationToken:
+    """
+    Tells a task that it should stop, because its run was cancelled or
+    it timed out. Async tasks are cancelled anyway, while sync tasks running
+    in a thread can't be interrupted, so long tasks should check the token
+    regularly and stop as soon as it's cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        # Calls of the executor pools that may still be running
+        # after the task was cancelled
+        self._running_calls: List[Future] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def raise_if_cancelled(self):
+        """
+        Raises:
+            TaskCancelled: if the token is cancelled
+        """
+
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep until the token is cancelled, for at most `timeout` seconds
+
+        Returns:
+            bool: True if the token is cancelled
+        """
+
+        return self._event.wait(timeout)
+
+    def track_call(self, call: Future):
+        """Called by the executor pools when a call of the task is cancelled
+        while running, as its function may keep running in its worker,
+        see `wait_calls_stopped`"""
+
+        self._running_calls.append(call)
+
+    async def wait_calls_stopped(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the cancelled calls of the task ended, for at most
+        `timeout` seconds, i.e. so the task isn't run again while
+        its previous attempt is still running
+
+        Returns:
+            bool: True if no call is running anymore
+        """
+
+        if not self._running_calls:
+            return True
+
+        _, running = await asyncio.wait(
+            [asyncio.wrap_future(call) for call in self._running_calls],
+            timeout=timeout,
+        )
+
+        return not running
+
+
+cancellation_context: ContextVar[CancellationToken] = ContextVar("cancellation")
+
+
+def get_cancellation_token() -> CancellationToken:
+    """Get the cancellation token of the current task, it must be called
+    within a task function, i.e.:
+
+    ```py
+    @task
+    def process_files(params):
+        token = get_cancellation_token()
+
+        for file in params.files:
+            token.raise_if_cancelled()
+            process_file(file)
+    ```
+    """
+
+    return cancellation_context.get()
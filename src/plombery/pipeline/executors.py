@@ -0,0 +1,453 @@
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+import contextvars
+import ctypes
+from dataclasses import dataclass
+import functools
+import importlib
+from logging.handlers import QueueListener
+import multiprocessing
+from multiprocessing.sharedctypes import SynchronizedString
+import os
+import signal
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+from uuid import uuid4
+
+from plombery.config import settings
+from plombery.config.model import DEFAULT_EXECUTORS, ExecutorSettings
+from plombery.database.models import PipelineRun
+from plombery.exceptions import TaskCancelled
+from plombery.pipeline.cancellation import CancellationToken, cancellation_context
+from plombery.pipeline.context import pipeline_context, run_context, task_context
+from plombery.pipeline.pipeline import Pipeline
+from plombery.pipeline.task import Task
+from plombery.schemas import ExecutorStats
+
+FunctionReference = Union[functools.partial, Tuple[str, str]]
+
+# Max seconds to wait for the logs of a task running in a process
+# once it returned
+_LOGS_TIMEOUT = 5
+
+_CALL_ID_SIZE = 32
+# Signal sent to the worker processes to interrupt a cancelled call,
+# not available on Windows
+_INTERRUPT_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+
+def get_function_reference(
+    func: Union[Callable, functools.partial],
+) -> FunctionReference:
+    """
+    Get a reference to a task function that can be sent to a worker process.
+
+    The `task` decorator replaces the function with a `Task` in its module,
+    so the function itself can't be pickled and it's referenced by its
+    module and qualified name instead.
+
+    Raises:
+        ValueError: if the function is not defined at the top level of a module
+    """
+
+    if isinstance(func, functools.partial):
+        return func
+
+    if "<locals>" in func.__qualname__:
+        raise ValueError(
+            f"The task {func.__qualname__} must be defined at the top level "
+            "of a module to run in a process"
+        )
+
+    return (func.__module__, func.__qualname__)
+
+
+def _resolve_function(reference: FunctionReference) -> Callable:
+    if isinstance(reference, functools.partial):
+        return reference
+
+    module_name, qualname = reference
+    obj: Any = importlib.import_module(module_name)
+
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+
+    # Get back the original function from the decorated task
+    return obj.run.__wrapped__ if isinstance(obj, Task) else obj
+
+
+@dataclass
+class _ProcessTaskCall:
+    function: FunctionReference
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    pipeline: Pipeline
+    pipeline_run: PipelineRun
+    task: Dict[str, Any]
+    call_id: str
+
+
+# State of the worker process
+_cancelled_calls: Optional[SynchronizedString] = None
+_current_call: Optional[Tuple[str, CancellationToken]] = None
+
+
+def _init_worker_process(
+    logs_queue: multiprocessing.Queue, cancelled_calls: SynchronizedString
+):
+    from plombery.logger import forward_logs_to_queue
+
+    global _cancelled_calls
+
+    forward_logs_to_queue(logs_queue)
+
+    _cancelled_calls = cancelled_calls
+    if _INTERRUPT_SIGNAL:
+        signal.signal(_INTERRUPT_SIGNAL, _on_interrupt_signal)
+
+
+def _is_call_cancelled(call_id: str) -> bool:
+    return bool(_cancelled_calls and call_id.encode() in _cancelled_calls.raw)
+
+
+def _on_interrupt_signal(signum, frame):
+    # The signal is sent to all the workers of the pool,
+    # only the one running the cancelled call stops
+    if not _current_call:
+        return
+
+    call_id, cancellation_token = _current_call
+
+    if _is_call_cancelled(call_id):
+        cancellation_token.cancel()
+        # Raised in the main thread of the worker, where the function runs
+        raise TaskCancelled()
+
+
+def _run_in_worker_process(call: _ProcessTaskCall) -> Any:
+    global _current_call
+
+    func = _resolve_function(call.function)
+
+    # Recreate the context of the task, so `get_logger` works
+    # in the worker process as well
+    pipeline_context.set(call.pipeline)
+    run_context.set(call.pipeline_run)
+    task_context.set(Task.model_construct(run=func, **call.task))
+    cancellation_token = CancellationToken()
+    cancellation_context.set(cancellation_token)
+
+    _current_call = (call.call_id, cancellation_token)
+
+    try:
+        # The pool queues some calls in advance, they may be
+        # cancelled before a worker picks them up
+        if _is_call_cancelled(call.call_id):
+            raise TaskCancelled()
+
+        return func(*call.args, **call.kwargs)
+    finally:
+        _current_call = None
+
+        from plombery.logger import send_process_logs_done
+
+        send_process_logs_done(call.call_id)
+
+
+def _track_cancelled_call(future: Future):
+    """Let the task know that its function may be still running,
+    so it's not run again before it ends, see `CancellationToken`"""
+
+    if not future.done() and (token := cancellation_context.get(None)):
+        token.track_call(future)
+
+
+class ExecutorPool(ABC):
+    """A bounded pool of workers running the sync tasks functions"""
+
+    type: str
+
+    def __init__(self, name: str, max_workers: Optional[int] = None) -> None:
+        self.name = name
+        self.max_workers = max_workers or self._get_default_max_workers()
+        self._pending = 0
+
+    @abstractmethod
+    def _get_default_max_workers(self) -> int:
+        """Number of workers when the settings don't set it"""
+
+    @abstractmethod
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a function in the pool, without blocking the event loop"""
+
+    def get_stats(self) -> ExecutorStats:
+        running = min(self._pending, self.max_workers)
+
+        return ExecutorStats(
+            name=self.name,
+            type=self.type,
+            max_workers=self.max_workers,
+            running=running,
+            queued=self._pending - running,
+        )
+
+    def shutdown(self):
+        pass
+
+
+class ThreadExecutorPool(ExecutorPool):
+    type = "thread"
+
+    def __init__(self, name: str, max_workers: Optional[int] = None) -> None:
+        super().__init__(name, max_workers)
+        self._executor = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix=f"plombery-{name}"
+        )
+
+    def _get_default_max_workers(self) -> int:
+        # Same default as the ThreadPoolExecutor
+        return min(32, (os.cpu_count() or 1) + 4)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        # Run in the current context, like `asyncio.to_thread`, so contexts
+        # (and so `get_logger`) are available in the thread
+        context = contextvars.copy_context()
+
+        self._pending += 1
+        future = self._executor.submit(context.run, func, *args, **kwargs)
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A pending call is simply removed from the queue
+            future.cancel()
+            _track_cancelled_call(future)
+            raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProcessExecutorPool(ExecutorPool):
+    type = "process"
+
+    def __init__(self, name: str, max_workers: Optional[int] = None) -> None:
+        super().__init__(name, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._logs_listener: Optional[QueueListener] = None
+        # IDs of the cancelled calls still running, shared with the workers
+        self._cancelled_calls: Optional[SynchronizedString] = None
+
+    def _get_default_max_workers(self) -> int:
+        return os.cpu_count() or 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Processes are expensive, so start them only if needed
+        if not self._executor:
+            from plombery.logger.process_handler import start_logs_listener
+
+            # Spawn fresh processes rather than forking the main one,
+            # that runs the event loop and several threads
+            mp_context = multiprocessing.get_context("spawn")
+            logs_queue = mp_context.Queue()
+            self._cancelled_calls = mp_context.Array(
+                ctypes.c_char, _CALL_ID_SIZE * self.max_workers
+            )
+
+            self._logs_listener = start_logs_listener(logs_queue)
+            self._executor = ProcessPoolExecutor(
+                self.max_workers,
+                mp_context=mp_context,
+                initializer=_init_worker_process,
+                initargs=(logs_queue, self._cancelled_calls),
+            )
+
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        from plombery.logger.process_handler import (
+            forget_call_logs,
+            wait_for_call_logs,
+        )
+
+        call = self._make_task_call(func, args, kwargs)
+        logs_handled = wait_for_call_logs(call.call_id)
+
+        self._pending += 1
+        future = self._get_executor().submit(_run_in_worker_process, call)
+
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The process may be still running, don't wait for it
+            forget_call_logs(call.call_id)
+            self._interrupt(call.call_id, future)
+            _track_cancelled_call(future)
+            raise
+        except Exception:
+            await self._wait_for_logs(call.call_id, logs_handled)
+            raise
+        finally:
+            self._pending -= 1
+
+        await self._wait_for_logs(call.call_id, logs_handled)
+        return result
+
+    def _interrupt(self, call_id: str, future: Future):
+        """Stop a call running in a worker process, the function is interrupted
+        by a `TaskCancelled` exception, while the process keeps serving the pool"""
+
+        # A pending call is simply removed from the queue
+        if future.cancel() or future.done():
+            return
+
+        if not _INTERRUPT_SIGNAL or not self._executor or not self._cancelled_calls:
+            return
+
+        call_id_bytes = call_id.encode()
+        empty_slot = bytes(_CALL_ID_SIZE)
+
+        with self._cancelled_calls.get_lock():
+            cancelled_calls = self._cancelled_calls.raw
+            slots = range(0, len(cancelled_calls), _CALL_ID_SIZE)
+            free_slot = next(
+                (
+                    i
+                    for i in slots
+                    if cancelled_calls[i : i + _CALL_ID_SIZE] == empty_slot
+                ),
+                None,
+            )
+
+            if free_slot is None:
+                return
+
+            self._cancelled_calls[free_slot : free_slot + _CALL_ID_SIZE] = call_id_bytes
+
+        def release_slot(_):
+            with self._cancelled_calls.get_lock():
+                self._cancelled_calls[free_slot : free_slot + _CALL_ID_SIZE] = (
+                    empty_slot
+                )
+
+        future.add_done_callback(release_slot)
+
+        # The pool doesn't tell which process runs a call, so all are signalled
+        for pid in list(self._executor._processes or {}):
+            try:
+                os.kill(pid, _INTERRUPT_SIGNAL)
+            except ProcessLookupError:
+                pass
+
+    async def _wait_for_logs(self, call_id: str, logs_handled: asyncio.Future):
+        from plombery.logger.process_handler import forget_call_logs
+
+        try:
+            await asyncio.wait_for(logs_handled, _LOGS_TIMEOUT)
+        except asyncio.TimeoutError:
+            # i.e. the process crashed
+            forget_call_logs(call_id)
+
+    def _make_task_call(
+        self, func: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]
+    ) -> _ProcessTaskCall:
+        pipeline = pipeline_context.get()
+        pipeline_run = run_context.get()
+        task = task_context.get()
+
+        return _ProcessTaskCall(
+            function=get_function_reference(func),
+            args=args,
+            kwargs=kwargs,
+            # Send only the serializable attributes, not the tasks functions
+            pipeline=Pipeline.model_construct(
+                id=pipeline.id,
+                name=pipeline.name,
+                description=pipeline.description,
+                tasks=[],
+                triggers=[],
+            ),
+            pipeline_run=PipelineRun(
+                id=pipeline_run.id,
+                pipeline_id=pipeline_run.pipeline_id,
+                trigger_id=pipeline_run.trigger_id,
+                status=pipeline_run.status,
+                start_time=pipeline_run.start_time,
+                input_params=pipeline_run.input_params,
+                reason=pipeline_run.reason,
+            ),
+            task=task.model_dump(),
+            call_id=uuid4().hex,
+        )
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+        if self._logs_listener:
+            self._logs_listener.stop()
+            self._logs_listener = None
+
+
+_POOL_CLASSES: Dict[str, Type[ExecutorPool]] = {
+    "thread": ThreadExecutorPool,
+    "process": ProcessExecutorPool,
+}
+
+
+class _Executors:
+    """Registry of the executor pools declared in the settings,
+    the pools are created the first time they're used"""
+
+    def __init__(self) -> None:
+        self._pools: Dict[str, ExecutorPool] = {}
+
+    @property
+    def settings(self) -> Dict[str, ExecutorSettings]:
+        return {**DEFAULT_EXECUTORS, **settings.executors}
+
+    def get_settings(self, name: str) -> ExecutorSettings:
+        """
+        Raises:
+            ValueError: if the executor doesn't exist
+        """
+
+        if not (executor_settings := self.settings.get(name)):
+            raise ValueError(
+                f"The executor {name} doesn't exist, "
+                f"available executors: {', '.join(self.settings)}"
+            )
+
+        return executor_settings
+
+    def get(self, name: str) -> ExecutorPool:
+        """
+        Raises:
+            ValueError: if the executor doesn't exist
+        """
+
+        if name not in self._pools:
+            executor_settings = self.get_settings(name)
+            pool_class = _POOL_CLASSES[executor_settings.type]
+            self._pools[name] = pool_class(name, executor_settings.max_workers)
+
+        return self._pools[name]
+
+    def get_stats(self) -> List[ExecutorStats]:
+        return [self.get(name).get_stats() for name in self.settings]
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown()
+
+        self._pools.clear()
+
+
+executors = _Executors()
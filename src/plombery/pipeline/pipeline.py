@@ -1,8 +1,10 @@
-from typing import Any, List, Optional, Type
+from typing import Any, Dict, List, Optional, Type
 
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, PositiveInt, model_validator
 
-from .task import Task
+from plombery.schemas import RetentionPolicy
+
+from .task import Task, check_task_signature
 from .trigger import Trigger
 from ._utils import prettify_name
 
@@ -14,6 +16,14 @@ class Pipeline(BaseModel):
     description: Optional[str] = None
     params: Optional[Type[BaseModel]] = Field(exclude=True, default=None)
     triggers: List[Trigger] = Field(default_factory=list)
+    max_concurrent_runs: Optional[PositiveInt] = Field(exclude=True, default=None)
+    """Max number of runs of this pipeline executed at the same time,
+    None means no limit"""
+    max_concurrent_tasks: Optional[PositiveInt] = Field(exclude=True, default=None)
+    """Max number of tasks of the same run executed at the same time,
+    None means no limit"""
+    retention: Optional[RetentionPolicy] = Field(exclude=True, default=None)
+    """Overrides the limits of `settings.retention` for this pipeline"""
 
     class Config:
         validate_assignment = True
@@ -29,3 +39,62 @@ class Pipeline(BaseModel):
                 data["description"] = cls.__doc__
 
         return data
+
+    @model_validator(mode="after")
+    def check_tasks_graph(self) -> "Pipeline":
+        graph = self.get_tasks_graph()
+
+        for task_id, upstream in graph.items():
+            for upstream_id in upstream:
+                if upstream_id not in graph:
+                    raise ValueError(
+                        f"Task {task_id} depends on {upstream_id} which is not a task of the pipeline"
+                    )
+
+        for task in self.tasks:
+            upstream = graph[task.id]
+            signature = check_task_signature(task.run)
+
+            # A single positional argument can't receive many outputs
+            if (
+                len(upstream) > 1
+                and signature.has_positional_args
+                and not signature.argument_names.intersection(upstream)
+            ):
+                raise ValueError(
+                    f"Task {task.id} has many upstream tasks, so its arguments "
+                    f"must be named after them: {', '.join(upstream)}"
+                )
+
+        # Kahn's algorithm: if some task is never freed from its
+        # dependencies then the graph contains a cycle
+        remaining = {task_id: set(upstream) for task_id, upstream in graph.items()}
+
+        while ready := [task_id for task_id, deps in remaining.items() if not deps]:
+            for task_id in ready:
+                del remaining[task_id]
+
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+        if remaining:
+            raise ValueError(
+                f"The tasks {', '.join(remaining)} have circular dependencies"
+            )
+
+        return self
+
+    def get_tasks_graph(self) -> Dict[str, List[str]]:
+        """Get the upstream task IDs of each task.
+
+        If no task declares its dependencies, the tasks are chained in the
+        order they're declared, so each task depends on the previous one.
+        """
+
+        if any(task.upstream for task in self.tasks):
+            return {task.id: list(task.upstream) for task in self.tasks}
+
+        return {
+            task.id: [self.tasks[i - 1].id] if i > 0 else []
+            for i, task in enumerate(self.tasks)
+        }
@@ -1,6 +1,15 @@
-from typing import Any, Callable, Optional
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Set
+import inspect
 
-from pydantic import BaseModel, model_validator, Field
+from pydantic import (
+    BaseModel,
+    Field,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    model_validator,
+)
 
 from ._utils import prettify_name
 
@@ -12,6 +21,20 @@ class Task(BaseModel):
     )
     name: Optional[str]
     description: Optional[str] = None
+    upstream: List[str] = Field(default_factory=list)
+    """IDs of the tasks whose output is needed to run this task"""
+    executor: str = Field(exclude=True, default="thread")
+    """Name of the executor pool where the task runs if it's a sync function"""
+    cache: bool = Field(exclude=True, default=False)
+    """Reuse the output of a previous run with the same code, params and inputs"""
+    version: Optional[str] = Field(exclude=True, default=None)
+    """Version of the task code, part of the cache key"""
+    retries: NonNegativeInt = Field(exclude=True, default=0)
+    """Number of times the task is run again if it fails"""
+    backoff: NonNegativeFloat = Field(exclude=True, default=1)
+    """Seconds before the first retry, doubled at each retry"""
+    timeout: Optional[PositiveFloat] = Field(exclude=True, default=None)
+    """Seconds after which an attempt fails, None means no limit"""
 
     @model_validator(mode="before")
     @classmethod
@@ -21,3 +44,41 @@ class Task(BaseModel):
                 data["name"] = prettify_name(data["id"]).title()
 
         return data
+
+
+@dataclass
+class TaskFunctionSignature:
+    has_positional_args: bool = False
+    has_params_arg: bool = False
+    argument_names: Set[str] = field(default_factory=set)
+
+
+def check_task_signature(func: Callable) -> TaskFunctionSignature:
+    """
+    Check which arguments a task function declares.
+
+    This is meant to be used to check if a task function accepts data inputs from other tasks.
+
+    The signature of the task run function should be:
+    `def task_fn(previous_task_output: Any, params: Model):`
+
+    or, if the task declares its upstream tasks, their outputs are received by name:
+    `def task_fn(upstream_task_1: Any, upstream_task_2: Any, params: Model):`
+
+    Where the params argument is the Pipeline input params.
+    """
+
+    result = TaskFunctionSignature()
+
+    for name, parameter in inspect.signature(func).parameters.items():
+        if parameter.kind == inspect.Parameter.VAR_KEYWORD or name == "params":
+            result.has_params_arg = True
+            continue
+
+        if parameter.kind != inspect.Parameter.KEYWORD_ONLY:
+            result.has_positional_args = True
+
+        if parameter.kind != inspect.Parameter.VAR_POSITIONAL:
+            result.argument_names.add(name)
+
+    return result
@@ -1,8 +1,34 @@
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 from apscheduler.triggers.base import BaseTrigger
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt
+
+
+class OverlapPolicy(str, Enum):
+    """What to do when a trigger fires while a previous run
+    of the same trigger is still pending or running"""
+
+    ALLOW = "allow"
+    """Run the pipeline anyway"""
+    SKIP = "skip"
+    """Don't run the pipeline, the firing is recorded as a skipped run"""
+    QUEUE = "queue"
+    """Run the pipeline once the previous runs completed"""
+    REPLACE = "replace"
+    """Cancel the previous runs and run the pipeline"""
+
+
+class MisfirePolicy(str, Enum):
+    """What to do with the firings missed while the app was down"""
+
+    RUN_ONCE = "run_once"
+    """Run the pipeline once, however many firings were missed"""
+    RUN_ALL = "run_all"
+    """Run the pipeline for each missed firing, up to `max_misfired_runs`"""
+    SKIP = "skip"
+    """Don't run the pipeline, wait for the next firing"""
 
 
 class Trigger(BaseModel):
@@ -13,6 +39,9 @@ class Trigger(BaseModel):
     params: Optional[BaseModel] = None
     paused: bool = False
     next_fire_time: Optional[datetime] = None
+    overlap_policy: OverlapPolicy = OverlapPolicy.ALLOW
+    misfire_policy: MisfirePolicy = MisfirePolicy.RUN_ONCE
+    max_misfired_runs: PositiveInt = 10
 
     class Config:
         arbitrary_types_allowed = True
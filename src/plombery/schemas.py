@@ -1,7 +1,8 @@
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
 from enum import Enum
 
-from pydantic import BaseModel, Field, NonNegativeFloat
+from pydantic import BaseModel, Field, NonNegativeFloat, PositiveInt
 
 
 class PipelineRunStatus(str, Enum):
@@ -10,6 +11,17 @@ class PipelineRunStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELLED = "cancelled"
+    SKIPPED = "skipped"
+
+
+class TaskAttempt(BaseModel):
+    attempt: int
+    """Number of the attempt, starting from 1"""
+    start_time: datetime
+    duration: NonNegativeFloat = 0
+    """Attempt duration in milliseconds"""
+    error: Optional[str] = None
+    """The exception that failed the attempt, if any"""
 
 
 class TaskRun(BaseModel):
@@ -17,13 +29,118 @@ class TaskRun(BaseModel):
     """Task duration in milliseconds"""
     has_output: bool = False
     """True if the task generated an output"""
+    output_size: Optional[int] = None
+    """Size of the stored output in bytes"""
+    output_format: Optional[str] = None
+    """Format of the stored output, i.e. json or parquet"""
+    cached: bool = False
+    """True if the output was reused from a previous run rather than computed"""
     status: Optional[PipelineRunStatus] = PipelineRunStatus.PENDING
     task_id: str
+    start_time: Optional[datetime] = None
+    upstream: List[str] = Field(default_factory=list)
+    """IDs of the tasks this task depended on in the run"""
+    attempts: List[TaskAttempt] = Field(default_factory=list)
+    """Executions of the task, more than one if it was retried"""
 
     class Config:
         from_attributes = True
 
 
+class OutputColumn(BaseModel):
+    name: str
+    type: str
+
+
+class TaskOutput(BaseModel):
+    """Metadata of a stored task output"""
+
+    format: str
+    filename: str
+    media_type: str
+    size: int
+    """Size of the file in bytes"""
+    encoding: Optional[str] = None
+    """Compression of the file, as HTTP `Content-Encoding`, i.e. gzip"""
+    columns: Optional[List[OutputColumn]] = None
+    """Schema of the output, if it's a table or a list of records"""
+    num_rows: Optional[int] = None
+    """Number of rows, if the output is a table or a list"""
+    rows: Optional[List[Any]] = None
+    """First rows of the output, to preview it without reading the file"""
+
+
+class TaskOutputPreview(BaseModel):
+    columns: Optional[List[OutputColumn]] = None
+    num_rows: int
+    offset: int
+    rows: List[Any]
+
+
+class ExecutorStats(BaseModel):
+    name: str
+    type: str
+    max_workers: int
+    running: int
+    """Number of functions being executed"""
+    queued: int
+    """Number of functions waiting for a free worker"""
+
+
+class WebSocketStats(BaseModel):
+    sent_messages: int
+    sent_records: int
+    """Number of log records sent to the clients watching the runs"""
+    dropped_records: int
+    """Number of log records dropped because the clients were too slow"""
+    pending_records: int
+    """Number of log records waiting to be sent"""
+
+
+class RunStats(BaseModel):
+    bucket_start: Optional[datetime] = None
+    """Start of the hour or day of the stats, None for the whole period"""
+    count: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    skipped: int = 0
+    success_rate: Optional[float] = None
+    """Ratio of completed runs, from 0 to 1"""
+    avg_duration: Optional[float] = None
+    """Durations in milliseconds, percentiles are estimated"""
+    min_duration: Optional[float] = None
+    max_duration: Optional[float] = None
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
+    p99_duration: Optional[float] = None
+
+
+class RetentionPolicy(BaseModel):
+    """Limits of the ended runs kept for each pipeline, the older
+    runs are deleted with their logs and outputs"""
+
+    max_runs: Optional[PositiveInt] = None
+    """Number of most recent runs to keep"""
+    max_age: Optional[timedelta] = None
+    """Delete the runs started before this time ago, i.e. `P30D` or seconds"""
+    max_bytes: Optional[PositiveInt] = None
+    """Max size of the logs and outputs of all the runs, the oldest runs
+    are deleted first"""
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.max_runs and not self.max_age and not self.max_bytes
+
+
+class RetentionReport(BaseModel):
+    start_time: datetime
+    duration: float = 0
+    """Duration of the garbage collection in milliseconds"""
+    deleted_runs: int = 0
+    reclaimed_bytes: int = 0
+
+
 class NotificationRule(BaseModel):
     channels: List[str]
     pipeline_status: List[PipelineRunStatus] = Field(
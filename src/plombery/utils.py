@@ -1,5 +1,8 @@
 import asyncio
+import os
+import socket
 from typing import Coroutine, List
+from uuid import uuid4
 
 
 def run_all_coroutines(coroutines: List[Coroutine]):
@@ -19,3 +22,12 @@ def run_all_coroutines(coroutines: List[Coroutine]):
 
         tasks.add(task)
         task.add_done_callback(_on_task_done)
+
+
+def get_instance_id() -> str:
+    """
+    Unique ID of this process, used to identify it among the
+    other replicas or workers sharing the same DB
+    """
+
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
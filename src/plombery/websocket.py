@@ -1,4 +1,72 @@
+import re
+
 import socketio
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+from plombery.config import settings
+
+
+def _get_client_manager():
+    """Use a message queue when the runs are executed by workers,
+    so their messages reach the clients connected to the web server"""
+
+    if not settings.websocket_message_queue:
+        return None
+
+    return socketio.AsyncRedisManager(settings.websocket_message_queue)
+
+
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins="*",
+    client_manager=_get_client_manager(),
+)
 asgi = socketio.ASGIApp(socketio_server=sio, socketio_path="/ws")
+
+
+ALL_RUNS_ROOM = "runs"
+"""Room receiving the updates of all the runs"""
+
+_ROOM_PATTERN = re.compile(r"^(runs|run:\d+|pipeline:[^:]+)$")
+
+
+def get_run_room(run_id: int) -> str:
+    """Room receiving the updates and the logs of a run"""
+    return f"run:{run_id}"
+
+
+def get_pipeline_room(pipeline_id: str) -> str:
+    """Room receiving the updates of the runs of a pipeline"""
+    return f"pipeline:{pipeline_id}"
+
+
+def has_subscribers(*rooms: str) -> bool:
+    """Check if any client is in the rooms, so emitting a message
+    nobody would receive can be skipped altogether"""
+
+    # The clients of the other servers are unknown, so assume there are some
+    if settings.websocket_message_queue:
+        return True
+
+    # Rooms are deleted when the last client leaves
+    namespace_rooms = sio.manager.rooms.get("/", {})
+    return any(room in namespace_rooms for room in rooms)
+
+
+@sio.on("subscribe")
+async def subscribe(sid: str, room: str) -> bool:
+    # Every client has its own private room so only the known
+    # rooms can be joined
+    if not isinstance(room, str) or not _ROOM_PATTERN.match(room):
+        return False
+
+    await sio.enter_room(sid, room)
+    return True
+
+
+@sio.on("unsubscribe")
+async def unsubscribe(sid: str, room: str) -> bool:
+    if not isinstance(room, str) or not _ROOM_PATTERN.match(room):
+        return False
+
+    await sio.leave_room(sid, room)
+    return True
@@ -1,5 +1,6 @@
-from typing import Generator
+from typing import Generator, List, Optional
 import asyncio
+import logging
 import os
 from pathlib import Path
 
@@ -10,6 +11,13 @@ from plombery.config import settings
 from plombery.config.model import AuthSettings
 from plombery.api import app as fastapi_app
 from plombery.api.authentication import _needs_auth
+from plombery.database.base import Base, engine
+from plombery.database.models import PipelineRun
+from plombery.database.repository import create_pipeline_run
+from plombery.database.schemas import PipelineRunCreate
+from plombery.orchestrator import data_storage
+from plombery.orchestrator.executor import utcnow
+from plombery.schemas import PipelineRunStatus
 
 
 def _bypass_auth():
@@ -51,8 +59,68 @@ def set_cwd(tmp_path: Path):
     yield tmp_path
 
 
+@pytest.fixture(autouse=True)
+def data_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # The data path is computed at import time, so point it to the
+    # test temp folder to avoid sharing run files among tests
+    monkeypatch.setattr(data_storage, "_base_data_path", tmp_path / ".data")
+    yield tmp_path / ".data"
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    # Drop the tables after each test so runs IDs restart from 1
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
 @pytest.fixture(autouse=True)
 def event_loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
     loop = asyncio.get_event_loop_policy().new_event_loop()
     yield loop
     loop.close()
+
+
+@pytest.fixture
+def create_run():
+    """Store a run, by default a pending manual run started now"""
+
+    def create(
+        pipeline_id: str = "pipeline",
+        status: PipelineRunStatus = PipelineRunStatus.PENDING,
+        **fields,
+    ) -> PipelineRun:
+        fields.setdefault("start_time", utcnow())
+        fields.setdefault("trigger_id", "_manual")
+
+        return create_pipeline_run(
+            PipelineRunCreate(pipeline_id=pipeline_id, status=status, **fields)
+        )
+
+    return create
+
+
+@pytest.fixture
+def run_ids():
+    def get_ids(pipeline_runs: List[PipelineRun]) -> List[int]:
+        return [pipeline_run.id for pipeline_run in pipeline_runs]
+
+    return get_ids
+
+
+@pytest.fixture
+def make_log_record():
+    """Build the log record of a run, as emitted by its loggers"""
+
+    def make(
+        message: str, run_id: int = 1, task: Optional[str] = "task"
+    ) -> logging.LogRecord:
+        record = logging.LogRecord(
+            f"plombery.{run_id}", logging.INFO, "", 0, message, None, None
+        )
+        record.run_id = run_id
+        record.pipeline = "pipeline"
+        record.task = task
+        return record
+
+    return make
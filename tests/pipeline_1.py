@@ -23,6 +23,7 @@ pipeline1_serialized = {
             "id": "pipe_1_task_1",
             "name": "Pipe 1 Task 1",
             "description": None,
+            "upstream": [],
         }
     ],
     "triggers": [],
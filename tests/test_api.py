@@ -1,8 +1,14 @@
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 import pytest
 
 from plombery import _Plombery as Plombery
 from plombery.api import app
+from plombery.api.routers.runs import cancel_pipeline_run
+from plombery.database.operations import setup_database
+from plombery.database.repository import get_pipeline_run
+from plombery.logger.web_socket_handler import websocket_handler
+from plombery.schemas import PipelineRunStatus
 from .pipeline_1 import pipeline1, pipeline1_serialized
 
 
@@ -73,3 +79,53 @@ async def test_api_with_auth_when_not_authenticated(with_auth, app: Plombery):
     response = client.get("/api/pipelines/pipeid")
     assert response.status_code == 401
     assert response.json() == NOT_AUTH_MSG
+
+
+@pytest.mark.asyncio
+async def test_api_list_executors(app: Plombery):
+    response = client.get("/api/executors/")
+
+    assert response.status_code == 200
+    assert [(executor["name"], executor["type"]) for executor in response.json()] == [
+        ("thread", "thread"),
+        ("process", "process"),
+        ("db", "thread"),
+        ("outputs", "thread"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_api_websocket_stats(app: Plombery, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(websocket_handler, "sent_messages", 2)
+    monkeypatch.setattr(websocket_handler, "sent_records", 4)
+    monkeypatch.setattr(websocket_handler, "dropped_records", 1)
+
+    response = client.get("/api/stats/websocket")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "sent_messages": 2,
+        "sent_records": 4,
+        "dropped_records": 1,
+        "pending_records": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_api_cancel_run(create_run):
+    # The in-memory DB can't be shared with the test client thread,
+    # so the endpoint is called directly
+    setup_database()
+    pending_run = create_run()
+    ended_run = create_run(status=PipelineRunStatus.COMPLETED)
+
+    await cancel_pipeline_run(pending_run.id)
+    assert get_pipeline_run(pending_run.id).status == PipelineRunStatus.CANCELLED
+
+    with pytest.raises(HTTPException) as error:
+        await cancel_pipeline_run(ended_run.id)
+    assert error.value.status_code == 409
+
+    with pytest.raises(HTTPException) as error:
+        await cancel_pipeline_run(1000)
+    assert error.value.status_code == 404
@@ -0,0 +1,241 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+import pytest
+
+from plombery.api import app
+from plombery.config import settings
+from plombery.orchestrator import output_serializers
+from plombery.orchestrator.data_storage import (
+    convert_task_output,
+    get_task_output,
+    get_task_output_file,
+    get_task_run_data_file,
+    store_task_output,
+)
+
+client = TestClient(app)
+
+
+def test_dataframes_are_stored_as_parquet(data_path):
+    pandas = pytest.importorskip("pandas")
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+
+    df = pandas.DataFrame({"name": ["a", "b"], "value": [1, 2]})
+
+    assert store_task_output(1, "extract", df)
+
+    output = get_task_output(1, "extract")
+    assert output.format == "parquet"
+    assert output.filename == "extract.parquet"
+
+    table = pyarrow_parquet.read_table(get_task_output_file(1, output))
+    assert table.to_pylist() == [{"name": "a", "value": 1}, {"name": "b", "value": 2}]
+
+
+def test_structures_are_stored_as_msgpack(data_path):
+    msgpack = pytest.importorskip("msgpack")
+
+    assert store_task_output(1, "extract", {"rows": [1, 2, 3]})
+
+    output = get_task_output(1, "extract")
+    assert output.format == "msgpack"
+
+    with get_task_output_file(1, output).open("rb") as f:
+        assert msgpack.unpack(f) == {"rows": [1, 2, 3]}
+
+
+def test_other_outputs_are_stored_as_json(data_path):
+    assert store_task_output(1, "extract", "hello")
+    assert not store_task_output(1, "empty", None)
+
+    output = get_task_output(1, "extract")
+    assert output.format == "json"
+    assert output.size == len('"hello"')
+    assert get_task_output(1, "empty") is None
+
+
+def test_legacy_json_outputs_are_read(data_path):
+    get_task_run_data_file(1, "extract").write_text("[1, 2]")
+
+    output = get_task_output(1, "extract")
+    assert output.format == "json"
+    assert output.size == 6
+
+
+def test_get_run_data_converts_the_output(data_path):
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+
+    store_task_output(1, "extract", pandas.DataFrame({"value": [1, 2]}))
+
+    response = client.get("/api/runs/1/data/extract")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    assert "run-1-extract-data.parquet" in response.headers["content-disposition"]
+
+    response = client.get("/api/runs/1/data/extract", params={"format": "json"})
+    assert response.status_code == 200
+    assert json.loads(response.content) == [{"value": 1}, {"value": 2}]
+
+    response = client.get("/api/runs/1/data/extract", params={"format": "xml"})
+    assert response.status_code == 400
+
+    response = client.get("/api/runs/1/data/missing")
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow", "msgpack"])
+def test_outputs_are_converted_by_chunks(data_path, monkeypatch, format):
+    monkeypatch.setattr(output_serializers, "_ROWS_CHUNK_SIZE", 10)
+    monkeypatch.setattr(settings, "output_formats", [format])
+
+    rows = [{"value": i} for i in range(25)]
+
+    if format == "msgpack":
+        pytest.importorskip("msgpack")
+        store_task_output(1, "extract", rows)
+    else:
+        pyarrow = pytest.importorskip("pyarrow")
+        store_task_output(1, "extract", pyarrow.Table.from_pylist(rows))
+
+    output = get_task_output(1, "extract")
+    assert output.format == format
+
+    chunks = list(convert_task_output(1, output, "json"))
+    # The brackets and a chunk every 10 rows
+    assert len(chunks) == 4
+    assert json.loads(b"".join(chunks)) == rows
+
+
+@pytest.fixture
+def small_chunks(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(output_serializers, "_ROWS_CHUNK_SIZE", 10)
+    monkeypatch.setattr(settings, "output_preview_rows", 5)
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_table_outputs_preview(data_path, small_chunks, monkeypatch, format):
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(settings, "output_formats", [format])
+
+    df = pandas.DataFrame(
+        {"name": [f"row {i}" for i in range(100)], "value": range(100)}
+    )
+    store_task_output(1, "extract", df)
+
+    output = get_task_output(1, "extract")
+    assert output.format == format
+    assert output.num_rows == 100
+    assert [column.name for column in output.columns] == ["name", "value"]
+    assert output.rows == [{"name": f"row {i}", "value": i} for i in range(5)]
+
+    response = client.get(
+        "/api/runs/1/data/extract/preview",
+        params={"offset": 42, "limit": 15, "columns": ["value"]},
+    )
+    assert response.status_code == 200
+
+    preview = response.json()
+    assert preview["num_rows"] == 100
+    assert preview["offset"] == 42
+    assert preview["columns"] == [{"name": "value", "type": "int64"}]
+    assert preview["rows"] == [{"value": i} for i in range(42, 57)]
+
+    response = client.get(
+        "/api/runs/1/data/extract/preview", params={"columns": ["missing"]}
+    )
+    assert response.status_code == 400
+
+
+def test_list_outputs_preview(data_path, small_chunks):
+    pytest.importorskip("msgpack")
+
+    store_task_output(1, "extract", [{"value": i} for i in range(20)])
+
+    # From the metadata
+    preview = client.get("/api/runs/1/data/extract/preview", params={"limit": 3})
+    assert preview.json()["rows"] == [{"value": 0}, {"value": 1}, {"value": 2}]
+
+    # From the file
+    preview = client.get("/api/runs/1/data/extract/preview", params={"offset": 18})
+    assert preview.json()["num_rows"] == 20
+    assert preview.json()["rows"] == [{"value": 18}, {"value": 19}]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_json_list_outputs_preview(data_path, small_chunks, monkeypatch, compression):
+    monkeypatch.setattr(settings, "output_formats", ["json"])
+    monkeypatch.setattr(settings, "data_compression", compression)
+    monkeypatch.setattr(output_serializers, "_READ_SIZE", 16)
+
+    rows = [{"value": i, "text": "a\nb"} for i in range(20)]
+    store_task_output(1, "extract", rows)
+
+    output = get_task_output(1, "extract")
+    assert output.format == "json"
+
+    # Still a JSON array, with a row per line
+    response = client.get("/api/runs/1/data/extract")
+    assert response.json() == rows
+    assert len(response.text.splitlines()) == 22
+
+    preview = client.get(
+        "/api/runs/1/data/extract/preview",
+        params={"offset": 17, "limit": 2, "columns": ["value"]},
+    )
+    assert preview.json()["num_rows"] == 20
+    assert preview.json()["rows"] == [{"value": 17}, {"value": 18}]
+
+    preview = client.get("/api/runs/1/data/extract/preview", params={"offset": 19})
+    assert preview.json()["rows"] == [{"value": 19, "text": "a\nb"}]
+
+
+def test_legacy_json_outputs_preview(data_path):
+    get_task_run_data_file(1, "extract").write_text("[1, 2, 3]")
+
+    preview = client.get("/api/runs/1/data/extract/preview", params={"offset": 1})
+    assert preview.json()["num_rows"] == 3
+    assert preview.json()["rows"] == [2, 3]
+
+
+def test_preview_of_outputs_that_are_not_tables(data_path):
+    store_task_output(1, "extract", {"value": 1})
+
+    response = client.get("/api/runs/1/data/extract/preview")
+    assert response.status_code == 400
+
+
+def test_compressed_outputs(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "data_compression", "gzip")
+
+    assert store_task_output(1, "extract", "hello")
+
+    output = get_task_output(1, "extract")
+    assert output.filename == "extract.json.gz"
+    assert output.encoding == "gzip"
+    assert gzip.decompress(get_task_output_file(1, output).read_bytes()) == b'"hello"'
+
+    response = client.get("/api/runs/1/data/extract")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "run-1-extract-data.json" in response.headers["content-disposition"]
+    assert response.json() == "hello"
+
+    response = client.get(
+        "/api/runs/1/data/extract", headers={"Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+    assert response.content == b'"hello"'
+
+
+def test_compressed_outputs_preview(small_chunks, monkeypatch: pytest.MonkeyPatch):
+    pytest.importorskip("msgpack")
+    monkeypatch.setattr(settings, "data_compression", "gzip")
+
+    store_task_output(1, "extract", [{"value": i} for i in range(20)])
+    assert get_task_output(1, "extract").filename == "extract.msgpack.gz"
+
+    preview = client.get("/api/runs/1/data/extract/preview", params={"offset": 18})
+    assert preview.json()["rows"] == [{"value": 18}, {"value": 19}]
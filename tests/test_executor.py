@@ -0,0 +1,531 @@
+from asyncio import gather, sleep
+import asyncio
+from concurrent.futures import Future
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from plombery import task, Pipeline, get_cancellation_token, get_logger
+from plombery.database.operations import setup_database
+from plombery.orchestrator.data_storage import (
+    get_task_output,
+    get_task_run_data_file,
+    read_logs_file,
+)
+from plombery.orchestrator import executor, output_writer
+from plombery.orchestrator.executor import run
+from plombery.pipeline.cancellation import CancellationToken
+from plombery.pipeline.executors import (
+    ExecutorPool,
+    ProcessExecutorPool,
+    ThreadExecutorPool,
+    executors,
+)
+from plombery.database.repository import get_latest_pipeline_run, list_task_runs
+from plombery.schemas import PipelineRunStatus
+
+
+@task
+async def extract_a():
+    await sleep(0.3)
+    return 1
+
+
+@task
+async def extract_b():
+    await sleep(0.3)
+    return 2
+
+
+@task(upstream=[extract_a, extract_b])
+async def merge(extract_a, extract_b):
+    return extract_a + extract_b
+
+
+@task
+async def failing():
+    raise ValueError("Something went wrong")
+
+
+@task(upstream=["failing"])
+async def after_failing(failing):
+    return "unreachable"
+
+
+flaky_calls = []
+
+
+@task(retries=2, backoff=0.1)
+async def flaky():
+    flaky_calls.append(time.monotonic())
+
+    if len(flaky_calls) < 3:
+        raise ConnectionError("Connection reset")
+
+    return "ok"
+
+
+@task(timeout=0.2)
+async def hanging():
+    await sleep(10)
+
+
+@task(timeout=0.2, retries=1, backoff=0)
+def hanging_sync():
+    time.sleep(0.3)
+
+
+@task(timeout=0.1, retries=1, backoff=0)
+def stuck_sync():
+    time.sleep(0.5)
+
+
+@task(executor="process")
+def cpu_bound():
+    get_logger().info("Running in process %d", os.getpid())
+    return os.getpid()
+
+
+# Set before the worker process is spawned, so it's inherited
+_STARTED_FILE_ENV = "PLOMBERY_TEST_STARTED_FILE"
+
+
+@task(executor="process")
+def sleeping_in_process():
+    Path(os.environ[_STARTED_FILE_ENV]).write_text(str(os.getpid()))
+    time.sleep(10)
+
+
+polling_threads = []
+polling_started = threading.Event()
+polling_stopped = threading.Event()
+
+
+@task
+def polling_in_thread():
+    token = get_cancellation_token()
+    polling_threads.append(threading.get_ident())
+    polling_started.set()
+
+    while not token.wait(0.01):
+        pass
+
+    polling_stopped.set()
+    token.raise_if_cancelled()
+
+
+@task
+def thread_id():
+    get_cancellation_token().raise_if_cancelled()
+    return threading.get_ident()
+
+
+def _get_statuses(pipeline_run):
+    return {task_run.task_id: task_run.status for task_run in pipeline_run.tasks_run}
+
+
+@pytest.mark.asyncio
+async def test_independent_tasks_run_concurrently():
+    setup_database()
+
+    pipeline = Pipeline(id="dag", tasks=[extract_a, extract_b, merge])
+
+    start = time.perf_counter()
+    await run(pipeline)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+
+    pipeline_run = get_latest_pipeline_run("dag", "_manual")
+
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+    assert {t.task_id: t.upstream for t in pipeline_run.tasks_run}["merge"] == [
+        "extract_a",
+        "extract_b",
+    ]
+
+    data_file = get_task_run_data_file(pipeline_run.id, "merge")
+    assert data_file.read_text() == "3"
+
+    [merge_run] = list_task_runs("dag", "merge")
+    assert merge_run.pipeline_run_id == pipeline_run.id
+    assert merge_run.output_size == 1
+    assert merge_run.output_format == "json"
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_tasks():
+    setup_database()
+
+    pipeline = Pipeline(
+        id="dag_serial", tasks=[extract_a, extract_b, merge], max_concurrent_tasks=1
+    )
+
+    start = time.perf_counter()
+    await run(pipeline)
+
+    assert time.perf_counter() - start >= 0.6
+
+
+@pytest.mark.asyncio
+async def test_failure_skips_only_downstream_tasks():
+    setup_database()
+
+    pipeline = Pipeline(
+        id="dag_failing", tasks=[extract_a, failing, after_failing, merge, extract_b]
+    )
+
+    await run(pipeline)
+
+    pipeline_run = get_latest_pipeline_run("dag_failing", "_manual")
+
+    assert pipeline_run.status == PipelineRunStatus.FAILED
+    assert _get_statuses(pipeline_run) == {
+        "extract_a": PipelineRunStatus.COMPLETED,
+        "failing": PipelineRunStatus.FAILED,
+        "after_failing": PipelineRunStatus.SKIPPED,
+        "merge": PipelineRunStatus.COMPLETED,
+        "extract_b": PipelineRunStatus.COMPLETED,
+    }
+
+
+@pytest.mark.asyncio
+async def test_outputs_are_written_in_background(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+
+    store_output = output_writer._store_output
+
+    def slow_store_output(*args):
+        time.sleep(0.5)
+        return store_output(*args)
+
+    monkeypatch.setattr(output_writer, "_store_output", slow_store_output)
+
+    pipeline = Pipeline(id="dag_slow_outputs", tasks=[extract_a, extract_b, merge])
+
+    await run(pipeline)
+
+    pipeline_run = get_latest_pipeline_run("dag_slow_outputs", "_manual")
+    task_runs = {task_run.task_id: task_run for task_run in pipeline_run.tasks_run}
+
+    # Merge doesn't wait for the upstream outputs to be written
+    merge_delay = task_runs["merge"].start_time - task_runs["extract_a"].start_time
+    assert merge_delay.total_seconds() < 0.5
+
+    # While the run ends once all the outputs are written
+    assert pipeline_run.duration >= 1300
+
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+    assert all(task_run.has_output for task_run in pipeline_run.tasks_run)
+    assert get_task_run_data_file(pipeline_run.id, "merge").read_text() == "3"
+
+
+@pytest.mark.asyncio
+async def test_unexpected_error_fails_the_run(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+
+    async def broken_tasks_graph(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(executor, "_run_tasks_graph", broken_tasks_graph)
+
+    await run(Pipeline(id="broken", tasks=[extract_a]))
+
+    pipeline_run = get_latest_pipeline_run("broken", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.FAILED
+    assert "database is locked" in read_logs_file(pipeline_run.id)
+
+
+produced_rows = [{"value": i} for i in range(3)]
+
+
+@task
+def produce_rows():
+    return produced_rows
+
+
+@task(upstream=[produce_rows])
+def consume_rows(produce_rows):
+    return produce_rows is produced_rows
+
+
+@pytest.mark.asyncio
+async def test_outputs_are_passed_without_copying():
+    setup_database()
+
+    await run(Pipeline(id="by_reference", tasks=[produce_rows, consume_rows]))
+
+    pipeline_run = get_latest_pipeline_run("by_reference", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+    assert get_task_output(pipeline_run.id, "produce_rows").num_rows == 3
+    assert get_task_run_data_file(pipeline_run.id, "consume_rows").read_text() == "true"
+
+
+def test_pipeline_with_circular_dependencies():
+    @task(upstream=["task_2"])
+    def task_1():
+        pass
+
+    @task(upstream=[task_1])
+    def task_2():
+        pass
+
+    with pytest.raises(ValueError, match="circular dependencies"):
+        Pipeline(id="circular", tasks=[task_1, task_2])
+
+
+def test_pipeline_with_unknown_dependency():
+    with pytest.raises(ValueError, match="not a task of the pipeline"):
+        Pipeline(id="unknown", tasks=[merge])
+
+
+def test_pipeline_with_unnamed_upstream_outputs():
+    @task(upstream=[extract_a, extract_b])
+    def merge_unnamed(data):
+        return data
+
+    with pytest.raises(ValueError, match="named after them: extract_a, extract_b"):
+        Pipeline(id="unnamed", tasks=[extract_a, extract_b, merge_unnamed])
+
+
+@pytest.mark.asyncio
+async def test_task_running_in_process():
+    setup_database()
+
+    pipeline = Pipeline(id="process", tasks=[cpu_bound])
+
+    await run(pipeline)
+
+    pipeline_run = get_latest_pipeline_run("process", "_manual")
+
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+
+    worker_pid = int(get_task_run_data_file(pipeline_run.id, "cpu_bound").read_text())
+    assert worker_pid != os.getpid()
+
+    # Logs are forwarded asynchronously by the worker process
+    await sleep(0.5)
+
+    logs = [json.loads(line) for line in read_logs_file(pipeline_run.id).splitlines()]
+    assert {
+        "level": "INFO",
+        "message": f"Running in process {worker_pid}",
+        "task": "cpu_bound",
+    }.items() <= logs[-1].items()
+
+
+def test_async_task_cant_run_in_process():
+    with pytest.raises(ValueError, match="Async tasks can't run in a process"):
+
+        @task(executor="process")
+        async def async_task():
+            pass
+
+
+def test_task_with_unknown_executor():
+    with pytest.raises(ValueError, match="The executor gpu doesn't exist"):
+
+        @task(executor="gpu")
+        def gpu_task():
+            pass
+
+
+@pytest.mark.asyncio
+async def test_executor_pool_stats():
+    pool = ThreadExecutorPool("test", max_workers=1)
+    event = threading.Event()
+
+    calls = [asyncio.create_task(pool.run(event.wait)) for _ in range(3)]
+    await sleep(0.1)
+
+    stats = pool.get_stats()
+    assert (stats.running, stats.queued) == (1, 2)
+
+    event.set()
+    await gather(*calls)
+
+    stats = pool.get_stats()
+    assert (stats.running, stats.queued) == (0, 0)
+
+    pool.shutdown()
+
+
+def test_executor_pool_must_implement_run():
+    class IncompletePool(ExecutorPool):
+        type = "incomplete"
+
+        def _get_default_max_workers(self) -> int:
+            return 1
+
+    with pytest.raises(TypeError):
+        IncompletePool("incomplete")
+
+
+@pytest.mark.asyncio
+async def test_cancellation_token_waits_for_its_calls():
+    token = CancellationToken()
+    assert await token.wait_calls_stopped()
+
+    call = Future()
+    token.track_call(call)
+    assert not await token.wait_calls_stopped(0.05)
+
+    call.set_result(None)
+    assert await token.wait_calls_stopped(0.05)
+
+
+@pytest.mark.asyncio
+async def test_task_retries_with_backoff():
+    setup_database()
+    flaky_calls.clear()
+
+    await run(Pipeline(id="retries", tasks=[flaky]))
+
+    pipeline_run = get_latest_pipeline_run("retries", "_manual")
+    [task_run] = pipeline_run.tasks_run
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+
+    assert [a.attempt for a in task_run.attempts] == [1, 2, 3]
+    assert [a.error for a in task_run.attempts] == [
+        "ConnectionError: Connection reset",
+        "ConnectionError: Connection reset",
+        None,
+    ]
+
+    # The delay doubles at each retry
+    assert flaky_calls[1] - flaky_calls[0] >= 0.1
+    assert flaky_calls[2] - flaky_calls[1] >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_task_timeout():
+    setup_database()
+
+    await run(Pipeline(id="timeout", tasks=[hanging]))
+
+    pipeline_run = get_latest_pipeline_run("timeout", "_manual")
+    [task_run] = pipeline_run.tasks_run
+    assert pipeline_run.status == PipelineRunStatus.FAILED
+    assert pipeline_run.duration < 1000
+
+    [attempt] = task_run.attempts
+    assert attempt.error == "TaskTimeout: The task hanging timed out after 0.2s"
+
+
+@pytest.mark.asyncio
+async def test_sync_task_timeout_is_retried():
+    setup_database()
+
+    await run(Pipeline(id="sync_timeout", tasks=[hanging_sync]))
+
+    pipeline_run = get_latest_pipeline_run("sync_timeout", "_manual")
+    [task_run] = pipeline_run.tasks_run
+    assert task_run.status == PipelineRunStatus.FAILED
+    assert len(task_run.attempts) == 2
+    assert all("timed out" in attempt.error for attempt in task_run.attempts)
+    assert "can't be interrupted" in read_logs_file(pipeline_run.id)
+
+    # The retry starts once the function of the first attempt returned
+    first, second = task_run.attempts
+    assert (second.start_time - first.start_time).total_seconds() >= 0.3
+
+
+@pytest.mark.asyncio
+async def test_sync_task_still_running_is_not_retried():
+    setup_database()
+
+    await run(Pipeline(id="stuck_sync", tasks=[stuck_sync]))
+
+    pipeline_run = get_latest_pipeline_run("stuck_sync", "_manual")
+    [task_run] = pipeline_run.tasks_run
+    assert task_run.status == PipelineRunStatus.FAILED
+    assert len(task_run.attempts) == 1
+    assert "previous attempt is still running" in read_logs_file(pipeline_run.id)
+
+
+async def _wait_until(condition, timeout: float = 10):
+    start = time.perf_counter()
+
+    while not condition():
+        assert time.perf_counter() - start < timeout
+        await sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_cancel_task_running_in_process(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    setup_database()
+    started_file = tmp_path / "started"
+    monkeypatch.setenv(_STARTED_FILE_ENV, str(started_file))
+    pool = ProcessExecutorPool("process", max_workers=1)
+    monkeypatch.setitem(executors._pools, "process", pool)
+
+    cancelled = asyncio.create_task(
+        run(Pipeline(id="cancelled_process", tasks=[sleeping_in_process]))
+    )
+    await _wait_until(started_file.exists)
+    worker_pid = int(started_file.read_text())
+
+    # Queued in the pool behind the running call
+    queued = asyncio.create_task(run(Pipeline(id="queued_process", tasks=[cpu_bound])))
+    await _wait_until(lambda: pool.get_stats().queued == 1)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    pipeline_run = get_latest_pipeline_run("cancelled_process", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.CANCELLED
+    assert pipeline_run.tasks_run[0].status == PipelineRunStatus.CANCELLED
+
+    await asyncio.wait_for(queued, 10)
+
+    # The queued call isn't interrupted and runs in the same worker process
+    pipeline_run = get_latest_pipeline_run("queued_process", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+    output = get_task_run_data_file(pipeline_run.id, "cpu_bound").read_text()
+    assert int(output) == worker_pid
+
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancel_task_polling_its_token(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+    polling_threads.clear()
+    polling_started.clear()
+    polling_stopped.clear()
+    pool = ThreadExecutorPool("thread", max_workers=1)
+    monkeypatch.setitem(executors._pools, "thread", pool)
+
+    cancelled = asyncio.create_task(
+        run(Pipeline(id="cancelled_thread", tasks=[polling_in_thread]))
+    )
+    await _wait_until(polling_started.is_set)
+
+    queued = asyncio.create_task(run(Pipeline(id="queued_thread", tasks=[thread_id])))
+    await _wait_until(lambda: pool.get_stats().queued == 1)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    pipeline_run = get_latest_pipeline_run("cancelled_thread", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.CANCELLED
+    assert pipeline_run.tasks_run[0].status == PipelineRunStatus.CANCELLED
+
+    await asyncio.wait_for(queued, 5)
+    assert polling_stopped.is_set()
+
+    # The queued call gets its own token and reuses the worker thread
+    pipeline_run = get_latest_pipeline_run("queued_thread", "_manual")
+    assert pipeline_run.status == PipelineRunStatus.COMPLETED
+    output = get_task_run_data_file(pipeline_run.id, "thread_id").read_text()
+    assert [int(output)] == polling_threads
+
+    pool.shutdown()
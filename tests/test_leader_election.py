@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+import pytest
+
+from plombery.database.operations import setup_database
+from plombery.database.repository import acquire_lock, release_lock
+from plombery.orchestrator.executor import utcnow
+from plombery.orchestrator.leader_election import LeaderElection
+
+
+def test_lock_is_held_by_one_holder():
+    setup_database()
+
+    now = utcnow()
+    expires_at = now + timedelta(seconds=15)
+
+    assert acquire_lock("test", "replica-1", expires_at, now)
+    assert not acquire_lock("test", "replica-2", expires_at, now)
+    # The holder can renew it
+    assert acquire_lock("test", "replica-1", expires_at, now)
+
+    # Another holder can take it over once it's expired
+    assert acquire_lock("test", "replica-2", expires_at, expires_at + timedelta(1))
+
+    release_lock("test", "replica-2")
+    assert acquire_lock("test", "replica-1", expires_at, now)
+
+
+@pytest.mark.asyncio
+async def test_leader_failover():
+    setup_database()
+
+    events = []
+
+    def make_election(holder: str):
+        async def on_elected():
+            events.append(f"{holder} elected")
+
+        return LeaderElection(
+            "scheduler",
+            on_elected=on_elected,
+            on_deposed=lambda: events.append(f"{holder} deposed"),
+            holder=holder,
+        )
+
+    leader = make_election("replica-1")
+    follower = make_election("replica-2")
+
+    assert await leader.try_acquire()
+    assert not await follower.try_acquire()
+
+    leader.stop()
+    assert await follower.try_acquire()
+
+    assert not await leader.try_acquire()
+    assert events == ["replica-1 elected", "replica-1 deposed", "replica-2 elected"]
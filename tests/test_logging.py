@@ -1,12 +1,27 @@
 from asyncio import sleep
 import json
+import logging
+from fastapi.testclient import TestClient
 import pytest
 
 from plombery import _Plombery as Plombery
+from plombery.api import app
+from plombery.api.routers.runs import get_run_logs
+from plombery.config import settings
+from plombery.logger import close_run_logs, open_run_logs
+from plombery.logger.formatter import JsonFormatter
+from plombery.logger.sink import RunLogSink
 from plombery.orchestrator import run_pipeline_now
-from plombery.orchestrator.data_storage import read_logs_file
+from plombery.orchestrator import compression
+from plombery.orchestrator.data_storage import (
+    compress_logs_file,
+    get_logs_filename,
+    read_logs_file,
+)
 from .pipeline_1 import pipeline1
 
+client = TestClient(app)
+
 
 def _clean_log_message(log):
     del log["timestamp"]
@@ -82,3 +97,206 @@ async def test_pipeline_logs_are_correclty_captured(app: Plombery):
             "task": "pipe_1_task_1",
         },
     ]
+
+
+def _write_logs(run_id: int, count: int):
+    levels = ["DEBUG", "INFO", "WARNING", "ERROR"]
+    logs = [
+        json.dumps(
+            {
+                "level": levels[i % len(levels)],
+                "message": f"log {i}",
+                "timestamp": f"2024-01-01T10:00:{i:02d}.000Z",
+            }
+        )
+        for i in range(count)
+    ]
+
+    # The last line is still being written so it's never returned
+    get_logs_filename(run_id).write_text("\n".join(logs) + '\n{"level": "INF')
+
+
+def _get_messages(response):
+    return [json.loads(line)["message"] for line in response.text.splitlines()]
+
+
+def test_logs_endpoint_pages():
+    _write_logs(1, 20)
+
+    response = client.get("/api/runs/1/logs")
+    assert _get_messages(response) == [f"log {i}" for i in range(20)]
+    assert response.headers["X-Logs-Start"] == "0"
+
+    last_page = client.get("/api/runs/1/logs", params={"tail": 5})
+    assert _get_messages(last_page) == [f"log {i}" for i in range(15, 20)]
+    assert last_page.headers["X-Logs-End"] == response.headers["X-Logs-End"]
+
+    previous_page = client.get(
+        "/api/runs/1/logs",
+        params={"tail": 5, "before": last_page.headers["X-Logs-Start"]},
+    )
+    assert _get_messages(previous_page) == [f"log {i}" for i in range(10, 15)]
+
+    first_page = client.get("/api/runs/1/logs", params={"limit": 3})
+    assert _get_messages(first_page) == ["log 0", "log 1", "log 2"]
+
+    next_page = client.get(
+        "/api/runs/1/logs",
+        params={"limit": 3, "offset": first_page.headers["X-Logs-End"]},
+    )
+    assert _get_messages(next_page) == ["log 3", "log 4", "log 5"]
+
+    # Nothing new was written after the end
+    response = client.get(
+        "/api/runs/1/logs", params={"offset": response.headers["X-Logs-End"]}
+    )
+    assert response.text == ""
+
+
+def test_logs_endpoint_filters():
+    _write_logs(1, 20)
+
+    response = client.get("/api/runs/1/logs", params={"level": "WARNING"})
+    assert _get_messages(response) == [f"log {i}" for i in range(20) if i % 4 in (2, 3)]
+
+    response = client.get(
+        "/api/runs/1/logs", params={"level": "ERROR", "tail": 2, "limit": 1}
+    )
+    assert _get_messages(response) == ["log 15"]
+
+    response = client.get(
+        "/api/runs/1/logs", params={"since": "2024-01-01T10:00:16.000Z"}
+    )
+    assert _get_messages(response) == ["log 17", "log 18", "log 19"]
+
+
+def test_logs_endpoint_without_logs():
+    response = client.get("/api/runs/1/logs")
+
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+def test_run_logs_are_buffered(make_log_record):
+    sink = RunLogSink(get_logs_filename(1), buffer_size=200, flush_interval=1)
+    sink.setFormatter(JsonFormatter())
+
+    sink.handle(make_log_record("first"))
+    assert read_logs_file(1) == ""
+
+    sink.flush()
+    assert [log["message"] for log in get_parsed_logs(1)] == ["first"]
+
+    # The buffer is written as soon as it's full
+    for i in range(3):
+        sink.handle(make_log_record(f"log {i}"))
+    assert len(get_parsed_logs(1)) == 3
+
+    sink.handle(make_log_record("last"))
+    sink.close()
+    assert [log["message"] for log in get_parsed_logs(1)][-1] == "last"
+    assert get_parsed_logs(1)[0] == {
+        "level": "INFO",
+        "loggerName": "plombery.1",
+        "message": "first",
+        "pipeline": "pipeline",
+        "task": "task",
+    }
+
+    # Late records are ignored
+    sink.handle(make_log_record("closed"))
+    assert len(get_parsed_logs(1)) == 5
+
+
+def test_run_logs_sink_is_shared():
+    sink = open_run_logs(1)
+    assert open_run_logs(1) is sink
+
+    logger = logging.getLogger("plombery.test-sink")
+    logger.addHandler(sink)
+    sink.loggers.add(logger)
+
+    close_run_logs(1)
+
+    assert sink not in logger.handlers
+    assert open_run_logs(1) is not sink
+    close_run_logs(1)
+
+
+def test_run_logs_are_compressed_when_closed(
+    monkeypatch: pytest.MonkeyPatch, make_log_record
+):
+    monkeypatch.setattr(settings, "data_compression", "gzip")
+    monkeypatch.setattr(compression, "_BLOCK_SIZE", 100)
+
+    sink = open_run_logs(1)
+    sink.setFormatter(JsonFormatter())
+    for i in range(10):
+        sink.handle(make_log_record(f"log {i}"))
+    close_run_logs(1)
+
+    assert not get_logs_filename(1).exists()
+    assert [log["message"] for log in get_parsed_logs(1)][-1] == "log 9"
+
+    # Sent as it is
+    response = client.get("/api/runs/1/logs", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["X-Logs-End"] == str(len(response.content))
+    assert _get_messages(response) == [f"log {i}" for i in range(10)]
+
+    response = client.get("/api/runs/1/logs", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert len(_get_messages(response)) == 10
+
+    # Only the blocks of the range are decompressed
+    assert get_logs_filename(1).with_name("logs.jsonl.gz.index").exists()
+    last_page = client.get("/api/runs/1/logs", params={"tail": 3})
+    assert _get_messages(last_page) == ["log 7", "log 8", "log 9"]
+
+    previous_page = client.get(
+        "/api/runs/1/logs",
+        params={"tail": 3, "before": last_page.headers["X-Logs-Start"]},
+    )
+    assert _get_messages(previous_page) == ["log 4", "log 5", "log 6"]
+    assert last_page.headers["X-Logs-End"] == response.headers["X-Logs-End"]
+
+
+@pytest.mark.asyncio
+async def test_logs_are_read_while_compressed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "data_compression", "gzip")
+    _write_logs(1, 20)
+
+    response = get_run_logs(1, tail=5)
+
+    # The run ends while the logs are being sent
+    compress_logs_file(1)
+    assert not get_logs_filename(1).exists()
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    assert [json.loads(line)["message"] for line in body.splitlines()] == [
+        f"log {i}" for i in range(15, 20)
+    ]
+
+
+def test_json_formatter_backends(make_log_record):
+    formatters = [JsonFormatter(json_backend="json"), JsonFormatter()]
+
+    for formatter in formatters:
+        record = make_log_record("hello %s")
+        record.args = ("world",)
+        record.created = 1704103200.5
+        record.msecs = 500.0
+
+        log = json.loads(formatter.format(record))
+        assert log == {
+            "level": "INFO",
+            "loggerName": "plombery.1",
+            "message": "hello world",
+            "pipeline": "pipeline",
+            "task": "task",
+            "timestamp": "2024-01-01T10:00:00.500Z",
+        }
+
+        # The output is cached, as the record is formatted by many handlers
+        record.msg = "changed"
+        assert json.loads(formatter.format(record))["message"] == "hello world"
@@ -0,0 +1,301 @@
+from asyncio import sleep
+import asyncio
+from datetime import timedelta
+
+from apscheduler.triggers.interval import IntervalTrigger
+import pytest
+
+from plombery import task, Pipeline, Trigger
+from plombery.config import settings
+from plombery.database.operations import _mark_cancelled_runs, setup_database
+from plombery.database.repository import (
+    cancel_pipeline_run,
+    create_pipeline_run,
+    get_pipeline_run,
+    list_pipeline_runs,
+    list_run_rollups,
+    save_trigger_state,
+)
+from plombery.database.rollups import merge_rollups
+from plombery.database.schemas import PipelineRunCreate
+from plombery.orchestrator import cancel_run, orchestrator, run_pipeline_now
+from plombery.orchestrator.dispatcher import dispatcher
+from plombery.orchestrator.executor import utcnow
+from plombery.pipeline.trigger import MisfirePolicy, OverlapPolicy
+from plombery.schemas import PipelineRunStatus
+
+
+@task
+async def slow_task():
+    await sleep(0.3)
+
+
+@task
+async def slower_task():
+    await sleep(1)
+
+
+@pytest.mark.asyncio
+async def test_global_max_concurrent_runs(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+    monkeypatch.setattr(settings, "max_concurrent_runs", 1)
+
+    pipeline = Pipeline(id="queued", tasks=[slow_task])
+
+    first_run = await run_pipeline_now(pipeline)
+    second_run = await run_pipeline_now(pipeline)
+    await sleep(0.1)
+
+    assert get_pipeline_run(first_run.id).status == PipelineRunStatus.RUNNING
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.PENDING
+    assert dispatcher.get_queue_position(second_run.id) == 1
+
+    await sleep(0.6)
+
+    second_run = get_pipeline_run(second_run.id)
+    assert second_run.status == PipelineRunStatus.COMPLETED
+    assert second_run.wait_duration >= 200
+
+
+@pytest.mark.asyncio
+async def test_pipeline_max_concurrent_runs():
+    setup_database()
+
+    limited = Pipeline(id="limited", tasks=[slow_task], max_concurrent_runs=1)
+    unlimited = Pipeline(id="unlimited", tasks=[slow_task])
+
+    await run_pipeline_now(limited)
+    limited_run = await run_pipeline_now(limited)
+    unlimited_run = await run_pipeline_now(unlimited)
+    await sleep(0.1)
+
+    assert get_pipeline_run(limited_run.id).status == PipelineRunStatus.PENDING
+    assert get_pipeline_run(unlimited_run.id).status == PipelineRunStatus.RUNNING
+
+    await sleep(0.6)
+
+
+@pytest.mark.asyncio
+async def test_pending_runs_are_restored():
+    setup_database()
+
+    pipeline = Pipeline(id="restored", tasks=[slow_task])
+    orchestrator.register_pipeline(pipeline)
+
+    pending_run = create_pipeline_run(
+        PipelineRunCreate(
+            start_time=utcnow(),
+            pipeline_id="restored",
+            trigger_id="_manual",
+            status=PipelineRunStatus.PENDING,
+        )
+    )
+    orphan_run = create_pipeline_run(
+        PipelineRunCreate(
+            start_time=utcnow(),
+            pipeline_id="not-registered",
+            trigger_id="_manual",
+            status=PipelineRunStatus.PENDING,
+        )
+    )
+
+    orchestrator._restore_pending_runs()
+    await sleep(0.5)
+
+    assert get_pipeline_run(pending_run.id).status == PipelineRunStatus.COMPLETED
+    assert get_pipeline_run(orphan_run.id).status == PipelineRunStatus.CANCELLED
+
+
+def _pipeline_with_overlap_policy(overlap_policy: OverlapPolicy) -> Pipeline:
+    return Pipeline(
+        id=f"overlap_{overlap_policy.value}",
+        tasks=[slow_task],
+        triggers=[
+            Trigger(
+                id="hourly",
+                name="Hourly",
+                schedule=IntervalTrigger(hours=1),
+                overlap_policy=overlap_policy,
+            )
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_overlap_policy_skip():
+    setup_database()
+    pipeline = _pipeline_with_overlap_policy(OverlapPolicy.SKIP)
+
+    first_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+    second_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+
+    assert second_run.status == PipelineRunStatus.SKIPPED
+
+    await sleep(0.5)
+
+    assert get_pipeline_run(first_run.id).status == PipelineRunStatus.COMPLETED
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.SKIPPED
+
+    # The skipped firing is in the stats too
+    stats = merge_rollups(list_run_rollups("day", pipeline_id=pipeline.id))
+    assert (stats.completed, stats.skipped) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_overlap_policy_queue():
+    setup_database()
+    pipeline = _pipeline_with_overlap_policy(OverlapPolicy.QUEUE)
+
+    first_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+    second_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+    await sleep(0.1)
+
+    assert get_pipeline_run(first_run.id).status == PipelineRunStatus.RUNNING
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.PENDING
+
+    await sleep(0.6)
+
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_overlap_policy_replace():
+    setup_database()
+    pipeline = _pipeline_with_overlap_policy(OverlapPolicy.REPLACE)
+
+    first_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+    await sleep(0.1)
+    second_run = await run_pipeline_now(pipeline, pipeline.triggers[0])
+    await sleep(0.5)
+
+    first_run = get_pipeline_run(first_run.id)
+    assert first_run.status == PipelineRunStatus.CANCELLED
+    assert first_run.tasks_run[0].status == PipelineRunStatus.CANCELLED
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_cancel_run_frees_its_slot(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+    monkeypatch.setattr(settings, "max_concurrent_runs", 1)
+
+    pipeline = Pipeline(id="cancelled", tasks=[slow_task])
+
+    first_run = await run_pipeline_now(pipeline)
+    second_run = await run_pipeline_now(pipeline)
+    await sleep(0.1)
+
+    assert await cancel_run(first_run)
+    # The queued run starts without waiting for the cancelled one to stop
+    assert dispatcher.get_queue_position(second_run.id) is None
+    await sleep(0.1)
+
+    first_run = get_pipeline_run(first_run.id)
+    assert first_run.status == PipelineRunStatus.CANCELLED
+    assert first_run.tasks_run[0].status == PipelineRunStatus.CANCELLED
+    assert get_pipeline_run(second_run.id).status == PipelineRunStatus.RUNNING
+
+    assert not await cancel_run(first_run)
+
+    await sleep(0.4)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "misfire_policy,expected_runs",
+    [
+        (MisfirePolicy.RUN_ONCE, 1),
+        (MisfirePolicy.RUN_ALL, 2),
+        (MisfirePolicy.SKIP, 0),
+    ],
+)
+async def test_misfire_policy(misfire_policy: MisfirePolicy, expected_runs: int):
+    setup_database()
+
+    trigger = Trigger(
+        id="hourly",
+        name="Hourly",
+        schedule=IntervalTrigger(hours=1),
+        misfire_policy=misfire_policy,
+        max_misfired_runs=2,
+    )
+    pipeline = Pipeline(id="misfired", tasks=[slow_task], triggers=[trigger])
+
+    # The app was down for 3 hours
+    now = utcnow()
+    save_trigger_state(pipeline.id, trigger.id, now - timedelta(hours=3))
+
+    await orchestrator._catch_up_misfires(pipeline, trigger, now)
+    await sleep(0.1)
+
+    runs = list_pipeline_runs(pipeline_id=pipeline.id)
+    assert len(runs) == expected_runs
+    assert all(run.reason == "catch-up" for run in runs)
+
+    await sleep(0.4)
+
+
+@pytest.mark.asyncio
+async def test_no_misfires_after_failover():
+    setup_database()
+
+    trigger = Trigger(id="hourly", name="Hourly", schedule=IntervalTrigger(hours=1))
+    pipeline = Pipeline(id="failover", tasks=[slow_task], triggers=[trigger])
+
+    # The previous leader fired the trigger and persisted its next firing
+    now = utcnow()
+    save_trigger_state(pipeline.id, trigger.id, now + timedelta(minutes=30))
+
+    await orchestrator._catch_up_misfires(pipeline, trigger, now)
+    await sleep(0.1)
+
+    assert list_pipeline_runs(pipeline_id=pipeline.id) == []
+
+
+@pytest.mark.asyncio
+async def test_running_runs_survive_another_replica_starting():
+    setup_database()
+    pipeline = Pipeline(id="owned", tasks=[slow_task])
+
+    pipeline_run = await run_pipeline_now(pipeline)
+    await sleep(0.1)
+
+    stored_run = get_pipeline_run(pipeline_run.id)
+    assert stored_run.status == PipelineRunStatus.RUNNING
+    assert stored_run.worker_id == dispatcher.instance_id
+    assert stored_run.lease_expires_at > utcnow()
+
+    # The startup cleanup of another replica
+    _mark_cancelled_runs()
+    assert get_pipeline_run(pipeline_run.id).status == PipelineRunStatus.RUNNING
+
+    await sleep(0.4)
+
+    assert get_pipeline_run(pipeline_run.id).status == PipelineRunStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_runs_cancelled_by_another_replica_are_stopped(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    setup_database()
+    monkeypatch.setattr(settings, "worker_lease_duration", 0.3)
+    pipeline = Pipeline(id="cancelled_elsewhere", tasks=[slower_task])
+
+    leases_task = asyncio.create_task(orchestrator._renew_leases_periodically())
+    pipeline_run = await run_pipeline_now(pipeline)
+    await sleep(0.05)
+
+    # i.e. via the API of another replica
+    assert cancel_pipeline_run(pipeline_run.id)
+    await sleep(0.4)
+
+    assert pipeline_run.id not in dispatcher.running_run_ids
+    stored_run = get_pipeline_run(pipeline_run.id)
+    assert stored_run.status == PipelineRunStatus.CANCELLED
+    assert stored_run.tasks_run[0].status == PipelineRunStatus.CANCELLED
+
+    leases_task.cancel()
+
+    stats = merge_rollups(list_run_rollups("day", pipeline_id="cancelled_elsewhere"))
+    assert (stats.count, stats.cancelled) == (1, 1)
@@ -0,0 +1,242 @@
+from datetime import timedelta
+
+import pytest
+
+from plombery.database.operations import _mark_cancelled_runs, setup_database
+from plombery.database.repository import (
+    cancel_pipeline_run,
+    claim_pipeline_run,
+    create_pipeline_run,
+    list_pipeline_runs,
+    list_run_rollups,
+    list_task_runs,
+    release_expired_pipeline_runs,
+    update_pipeline_run,
+)
+from plombery.database.rollups import merge_rollups
+from plombery.database.schemas import PipelineRunCreate
+from plombery.orchestrator.executor import utcnow
+from plombery.schemas import PipelineRunStatus, TaskRun
+
+
+@pytest.fixture
+def create_paginated_runs(create_run):
+    def create_runs(count: int):
+        start_time = utcnow() - timedelta(hours=count)
+
+        return [
+            create_run(
+                "paginated",
+                PipelineRunStatus.FAILED if i % 2 else PipelineRunStatus.COMPLETED,
+                start_time=start_time + timedelta(hours=i),
+                reason="scheduled" if i % 3 else "api",
+            )
+            for i in range(count)
+        ]
+
+    return create_runs
+
+
+def test_list_pipeline_runs_pages(create_paginated_runs, run_ids):
+    setup_database()
+    create_paginated_runs(10)
+
+    first_page = list_pipeline_runs(page_size=4)
+    assert run_ids(first_page) == [10, 9, 8, 7]
+
+    second_page = list_pipeline_runs(page_size=4, before_id=first_page[-1].id)
+    assert run_ids(second_page) == [6, 5, 4, 3]
+
+    # Going back returns the page adjacent to the cursor, newest first
+    previous_page = list_pipeline_runs(page_size=4, after_id=second_page[0].id)
+    assert run_ids(previous_page) == [10, 9, 8, 7]
+
+    previous_page = list_pipeline_runs(page_size=2, after_id=second_page[0].id)
+    assert run_ids(previous_page) == [8, 7]
+
+
+def test_list_pipeline_runs_filters(create_paginated_runs, run_ids):
+    setup_database()
+    runs = create_paginated_runs(10)
+
+    failed = list_pipeline_runs(status=[PipelineRunStatus.FAILED])
+    assert run_ids(failed) == [10, 8, 6, 4, 2]
+
+    from_api = list_pipeline_runs(reason="api")
+    assert run_ids(from_api) == [10, 7, 4, 1]
+
+    in_range = list_pipeline_runs(
+        started_after=runs[2].start_time, started_before=runs[5].start_time
+    )
+    assert run_ids(in_range) == [5, 4, 3]
+
+    assert list_pipeline_runs(pipeline_id="other") == []
+
+
+def test_task_runs_are_stored_when_the_run_ends():
+    setup_database()
+
+    pipeline_run = create_pipeline_run(
+        PipelineRunCreate(
+            start_time=utcnow(),
+            pipeline_id="pipeline",
+            trigger_id="_manual",
+            status=PipelineRunStatus.RUNNING,
+            tasks_run=[
+                TaskRun(task_id="extract", status=PipelineRunStatus.COMPLETED),
+                TaskRun(task_id="load", status=PipelineRunStatus.RUNNING),
+            ],
+        )
+    )
+
+    update_pipeline_run(pipeline_run, utcnow(), PipelineRunStatus.RUNNING)
+    assert list_task_runs("pipeline", "extract") == []
+
+    pipeline_run.tasks_run[1] = TaskRun(
+        task_id="load",
+        status=PipelineRunStatus.FAILED,
+        duration=12,
+        has_output=True,
+        output_size=128,
+    )
+    update_pipeline_run(pipeline_run, utcnow(), PipelineRunStatus.FAILED)
+
+    [task_run] = list_task_runs("pipeline", "load")
+    assert task_run.pipeline_run_id == pipeline_run.id
+    assert task_run.status == PipelineRunStatus.FAILED
+    assert task_run.duration == 12
+    assert task_run.output_size == 128
+
+    assert (
+        list_task_runs("pipeline", "load", status=[PipelineRunStatus.COMPLETED]) == []
+    )
+
+
+def _finish_run(pipeline_id: str, status: PipelineRunStatus, duration: float):
+    start_time = utcnow().replace(minute=30)
+    pipeline_run = create_pipeline_run(
+        PipelineRunCreate(
+            start_time=start_time,
+            pipeline_id=pipeline_id,
+            trigger_id="_manual",
+            status=PipelineRunStatus.RUNNING,
+            tasks_run=[
+                TaskRun(task_id="extract", status=status, duration=duration / 2)
+            ],
+        )
+    )
+    update_pipeline_run(
+        pipeline_run, start_time + timedelta(milliseconds=duration), status
+    )
+
+    return pipeline_run
+
+
+def test_run_rollups_are_updated_when_the_run_ends():
+    setup_database()
+
+    for duration in range(100, 1100, 100):
+        _finish_run("stats", PipelineRunStatus.COMPLETED, duration)
+    pipeline_run = _finish_run("stats", PipelineRunStatus.FAILED, 5000)
+
+    # Updating a finished run again doesn't count it twice
+    update_pipeline_run(
+        pipeline_run,
+        pipeline_run.start_time + timedelta(seconds=5),
+        PipelineRunStatus.FAILED,
+    )
+
+    for granularity in ("hour", "day"):
+        [rollup] = list_run_rollups(granularity, pipeline_id="stats")
+        assert rollup.count == 11
+
+    stats = merge_rollups(list_run_rollups("hour", pipeline_id="stats"))
+    assert stats.completed == 10
+    assert stats.failed == 1
+    assert stats.success_rate == 10 / 11
+    assert stats.min_duration == 100
+    assert stats.max_duration == 5000
+    assert 200 <= stats.p50_duration <= 1000
+    assert 1000 <= stats.p95_duration <= 5000
+
+    task_stats = merge_rollups(
+        list_run_rollups("day", pipeline_id="stats", task_id="extract")
+    )
+    assert task_stats.count == 11
+    assert task_stats.max_duration == 2500
+
+    assert list_run_rollups("day", pipeline_id="other") == []
+
+
+def _get_stats(pipeline_id: str):
+    return merge_rollups(list_run_rollups("day", pipeline_id=pipeline_id))
+
+
+def test_skipped_runs_are_counted(create_run):
+    setup_database()
+
+    create_run("skipped", PipelineRunStatus.SKIPPED)
+    create_run("skipped", PipelineRunStatus.PENDING)
+
+    stats = _get_stats("skipped")
+    assert (stats.count, stats.skipped) == (1, 1)
+    assert stats.success_rate is None
+    assert stats.min_duration is None
+
+
+def test_skipped_runs_are_left_out_of_the_durations(create_run):
+    setup_database()
+
+    create_run("partly_skipped", PipelineRunStatus.SKIPPED)
+    _finish_run("partly_skipped", PipelineRunStatus.COMPLETED, 400)
+
+    stats = _get_stats("partly_skipped")
+    assert (stats.count, stats.skipped) == (2, 1)
+    assert stats.success_rate == 1
+    assert stats.min_duration == stats.avg_duration == stats.p50_duration == 400
+
+
+def test_cancelled_runs_are_counted_once(create_run):
+    setup_database()
+
+    pending_run = create_run("cancelled", PipelineRunStatus.PENDING)
+    running_run = create_run("cancelled", PipelineRunStatus.RUNNING)
+
+    assert cancel_pipeline_run(pending_run.id)
+    assert cancel_pipeline_run(running_run.id)
+    assert not cancel_pipeline_run(running_run.id)
+
+    # The run is finalized once it stops, keeping its status
+    update_pipeline_run(running_run, utcnow(), PipelineRunStatus.COMPLETED)
+    assert running_run.status == PipelineRunStatus.CANCELLED
+    assert list_pipeline_runs(pipeline_id="cancelled")[0].status == (
+        PipelineRunStatus.CANCELLED
+    )
+
+    stats = _get_stats("cancelled")
+    assert (stats.count, stats.cancelled) == (2, 2)
+
+
+def test_runs_of_dead_workers_are_counted(create_run):
+    setup_database()
+
+    create_run("expired", PipelineRunStatus.PENDING)
+    claimed = claim_pipeline_run("worker", utcnow(), pipeline_ids=["expired"])
+    update_pipeline_run(claimed, utcnow(), PipelineRunStatus.RUNNING)
+
+    release_expired_pipeline_runs(utcnow() + timedelta(seconds=1))
+
+    stats = _get_stats("expired")
+    assert (stats.count, stats.cancelled) == (1, 1)
+
+
+def test_runs_interrupted_by_a_restart_are_counted(create_run):
+    setup_database()
+
+    create_run("restarted", PipelineRunStatus.RUNNING)
+    create_run("restarted", PipelineRunStatus.PENDING)
+
+    _mark_cancelled_runs()
+
+    stats = _get_stats("restarted")
+    assert (stats.count, stats.cancelled) == (1, 1)
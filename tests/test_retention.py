@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+import pytest
+
+from plombery import Pipeline, task
+from plombery.config import settings
+from plombery.config.model import RetentionSettings
+from plombery.database.operations import setup_database
+from plombery.database.repository import (
+    list_pipeline_runs,
+    list_run_rollups,
+    list_task_runs,
+    update_pipeline_run,
+)
+from plombery.orchestrator.data_storage import get_logs_filename
+from plombery.orchestrator.executor import utcnow
+from plombery.orchestrator.retention import GarbageCollector
+from plombery.schemas import PipelineRunStatus, RetentionPolicy, TaskRun
+
+
+@task
+def extract():
+    pass
+
+
+@pytest.fixture
+def create_ended_runs(create_run):
+    def create_runs(pipeline_id: str, count: int, logs_size: int = 100):
+        """Create ended runs, 1 day apart, the last one is the most recent"""
+
+        start_time = utcnow() - timedelta(days=count)
+        pipeline_runs = []
+
+        for i in range(count):
+            pipeline_run = create_run(
+                pipeline_id,
+                PipelineRunStatus.RUNNING,
+                start_time=start_time + timedelta(days=i),
+                tasks_run=[
+                    TaskRun(task_id="extract", status=PipelineRunStatus.COMPLETED)
+                ],
+            )
+            update_pipeline_run(
+                pipeline_run, pipeline_run.start_time, PipelineRunStatus.COMPLETED
+            )
+            get_logs_filename(pipeline_run.id).write_bytes(b"x" * logs_size)
+            pipeline_runs.append(pipeline_run)
+
+        return pipeline_runs
+
+    return create_runs
+
+
+@pytest.fixture
+def retention(monkeypatch: pytest.MonkeyPatch):
+    def set_retention(**limits):
+        monkeypatch.setattr(settings, "retention", RetentionSettings(**limits))
+
+    return set_retention
+
+
+def _garbage_collector(*pipelines: Pipeline):
+    registered = {pipeline.id: pipeline for pipeline in pipelines}
+
+    return GarbageCollector(registered.get, is_leader=lambda: True)
+
+
+@pytest.mark.asyncio
+async def test_keeps_the_most_recent_runs(
+    retention, data_path, create_ended_runs, run_ids
+):
+    setup_database()
+    retention(max_runs=2, batch_size=2)
+    pipeline_runs = create_ended_runs("pipeline", 5)
+
+    report = await _garbage_collector().collect()
+
+    assert report.deleted_runs == 3
+    assert report.reclaimed_bytes == 300
+    assert run_ids(list_pipeline_runs()) == [5, 4]
+    # The tasks are deleted too, even if SQLite doesn't cascade the deletes
+    assert [t.pipeline_run_id for t in list_task_runs("pipeline", "extract")] == [5, 4]
+
+    for pipeline_run in pipeline_runs[:3]:
+        assert not (data_path / "runs" / f"run_{pipeline_run.id}").exists()
+
+    # The stats still count the deleted runs
+    assert sum(r.count for r in list_run_rollups("day") if not r.task_id) == 5
+
+
+@pytest.mark.asyncio
+async def test_deletes_the_old_runs(retention, create_ended_runs, run_ids):
+    setup_database()
+    retention(max_age=timedelta(days=2, hours=12))
+    create_ended_runs("pipeline", 5)
+
+    report = await _garbage_collector().collect()
+
+    assert report.deleted_runs == 3
+    assert run_ids(list_pipeline_runs()) == [5, 4]
+
+
+@pytest.mark.asyncio
+async def test_deletes_the_runs_exceeding_the_max_size(
+    retention, create_ended_runs, run_ids
+):
+    setup_database()
+    retention(max_bytes=250)
+    create_ended_runs("pipeline", 5)
+
+    report = await _garbage_collector().collect()
+
+    assert report.deleted_runs == 3
+    assert report.reclaimed_bytes == 300
+    assert run_ids(list_pipeline_runs()) == [5, 4]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_policy_overrides_the_global_one(retention, create_ended_runs):
+    setup_database()
+    retention(max_runs=3)
+    create_ended_runs("short", 5)
+    create_ended_runs("long", 5)
+    create_ended_runs("unregistered", 5)
+
+    pipeline = Pipeline(
+        id="short", tasks=[extract], retention=RetentionPolicy(max_runs=1)
+    )
+    await _garbage_collector(pipeline).collect()
+
+    assert len(list_pipeline_runs(pipeline_id="short")) == 1
+    assert len(list_pipeline_runs(pipeline_id="long")) == 3
+    assert len(list_pipeline_runs(pipeline_id="unregistered")) == 3
+
+
+@pytest.mark.asyncio
+async def test_active_runs_are_never_deleted(
+    retention, create_ended_runs, create_run, run_ids
+):
+    setup_database()
+    retention(max_runs=1)
+    create_ended_runs("pipeline", 2)
+    create_run(
+        status=PipelineRunStatus.RUNNING, start_time=utcnow() - timedelta(days=10)
+    )
+
+    report = await _garbage_collector().collect()
+
+    assert report.deleted_runs == 1
+    assert run_ids(list_pipeline_runs()) == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_nothing_is_deleted_without_policy(create_ended_runs):
+    setup_database()
+    create_ended_runs("pipeline", 3)
+
+    report = await _garbage_collector().collect()
+
+    assert report.deleted_runs == 0
+    assert len(list_pipeline_runs()) == 3
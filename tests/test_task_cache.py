@@ -0,0 +1,214 @@
+from datetime import timedelta
+import os
+import time
+
+import pytest
+from pydantic import BaseModel
+
+from plombery import task, Pipeline
+from plombery.database.operations import setup_database
+from plombery.database.repository import get_latest_pipeline_run, list_task_runs
+from plombery.orchestrator.data_storage import (
+    _get_cache_folder,
+    cache_task_output,
+    delete_run_data,
+    evict_cached_task_outputs,
+    get_task_output,
+    get_run_data_size,
+    get_task_output_file,
+    get_task_run_data_file,
+    restore_cached_task_output,
+    store_task_output,
+)
+from plombery.orchestrator.executor import run
+from plombery.orchestrator.task_cache import get_cache_key
+from plombery.schemas import PipelineRunStatus
+
+calls = []
+source_data = {"value": 1}
+
+
+@task
+def extract():
+    return [dict(source_data)]
+
+
+@task(upstream=[extract], cache=True)
+def transform(extract):
+    calls.append("transform")
+    return [{"value": row["value"] * 2} for row in extract]
+
+
+@task(upstream=[transform])
+def load(transform):
+    return transform[0]["value"]
+
+
+class InputParams(BaseModel):
+    factor: int = 1
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+    source_data["value"] = 1
+
+
+async def _run(pipeline: Pipeline, params=None):
+    await run(pipeline, params=params)
+
+    pipeline_run = get_latest_pipeline_run(pipeline.id, "_manual")
+    return pipeline_run, {t.task_id: t for t in pipeline_run.tasks_run}
+
+
+@pytest.mark.asyncio
+async def test_cached_output_is_reused():
+    setup_database()
+    pipeline = Pipeline(id="cached", tasks=[extract, transform, load])
+
+    first_run, _ = await _run(pipeline)
+    second_run, task_runs = await _run(pipeline)
+
+    assert calls == ["transform"]
+    assert second_run.status == PipelineRunStatus.COMPLETED
+    assert task_runs["transform"].cached
+    assert task_runs["transform"].has_output
+    assert not task_runs["extract"].cached
+    # The downstream tasks receive the cached output
+    assert task_runs["load"].status == PipelineRunStatus.COMPLETED
+
+    [latest, _] = list_task_runs("cached", "transform")
+    assert latest.cached
+
+    # The output file is linked, not copied
+    output = get_task_output(second_run.id, "transform")
+    cached_file = get_task_output_file(second_run.id, output)
+    assert os.path.samefile(cached_file, get_task_output_file(first_run.id, output))
+
+
+@pytest.mark.asyncio
+async def test_cache_is_invalidated_by_the_inputs():
+    setup_database()
+    pipeline = Pipeline(
+        id="cached", tasks=[extract, transform, load], params=InputParams
+    )
+
+    await _run(pipeline)
+    _, task_runs = await _run(pipeline, params={"factor": 2})
+    assert not task_runs["transform"].cached
+
+    source_data["value"] = 2
+    _, task_runs = await _run(pipeline, params={"factor": 2})
+    assert not task_runs["transform"].cached
+
+    assert calls == ["transform"] * 3
+
+
+@pytest.mark.asyncio
+async def test_cache_is_not_shared_between_pipelines():
+    setup_database()
+
+    await _run(Pipeline(id="cached", tasks=[extract, transform, load]))
+    _, task_runs = await _run(Pipeline(id="other", tasks=[extract, transform, load]))
+
+    assert not task_runs["transform"].cached
+    assert calls == ["transform"] * 2
+
+
+@task(cache=True)
+def to_dataframe():
+    import pandas
+
+    calls.append("to_dataframe")
+    return pandas.DataFrame({"a": [1, 2], "b": [3, 4]})
+
+
+@task(upstream=[to_dataframe])
+def sum_dataframe(to_dataframe):
+    return int(to_dataframe["b"].sum())
+
+
+@task(cache=True)
+def pairs():
+    calls.append("pairs")
+    return [(1, "a"), (2, "b")]
+
+
+@pytest.mark.asyncio
+async def test_cached_output_keeps_its_type():
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    setup_database()
+    pipeline = Pipeline(id="cached_types", tasks=[to_dataframe, sum_dataframe, pairs])
+
+    first_run, _ = await _run(pipeline)
+    second_run, task_runs = await _run(pipeline)
+
+    assert sorted(calls) == ["pairs", "to_dataframe"]
+    assert task_runs["to_dataframe"].cached
+    assert task_runs["to_dataframe"].output_format == "parquet"
+    assert task_runs["sum_dataframe"].status == PipelineRunStatus.COMPLETED
+    assert get_task_run_data_file(second_run.id, "sum_dataframe").read_text() == "7"
+
+    cached = restore_cached_task_output(
+        first_run.id, "pairs", get_cache_key(pipeline.id, pairs, None, {})
+    )
+    # Read back from msgpack
+    assert cached[1] == [[1, "a"], [2, "b"]]
+
+    cached = restore_cached_task_output(
+        first_run.id, "to_dataframe", get_cache_key(pipeline.id, to_dataframe, None, {})
+    )
+    assert isinstance(cached[1], pandas.DataFrame)
+    assert cached[1].to_dict("list") == {"a": [1, 2], "b": [3, 4]}
+
+
+def _cache_output(run_id: int, cache_key: str, data):
+    store_task_output(run_id, "transform", data)
+    assert cache_task_output(run_id, "transform", cache_key, data)
+
+
+def test_outputs_not_read_back_as_they_are_are_not_cached():
+    store_task_output(1, "transform", {1, 2})
+
+    assert not cache_task_output(1, "transform", "set", {1, 2})
+    assert not _get_cache_folder("set").exists()
+
+
+def test_cached_outputs_are_not_reclaimed_with_the_run():
+    _cache_output(1, "shared", list(range(100)))
+    store_task_output(2, "transform", list(range(100)))
+    run_size = get_run_data_size(2)
+
+    # The run files are still linked by the cache
+    assert delete_run_data(1) == 0
+    assert _get_cache_folder("shared").exists()
+
+    assert delete_run_data(2) == run_size > 0
+
+
+def test_evict_expired_outputs():
+    _cache_output(1, "old", [1])
+    _cache_output(2, "new", [2])
+
+    expired = time.time() - timedelta(days=2).total_seconds()
+    os.utime(_get_cache_folder("old") / "meta.json", (expired, expired))
+
+    assert evict_cached_task_outputs(ttl=timedelta(days=1)) == 1
+    assert not _get_cache_folder("old").exists()
+    assert _get_cache_folder("new").exists()
+    # The run still has its output
+    assert get_task_output(1, "transform")
+
+
+def test_evict_least_recently_used_outputs():
+    for i in range(3):
+        _cache_output(i, f"key_{i}", list(range(100)))
+        os.utime(_get_cache_folder(f"key_{i}"), (time.time() - 100 + i,) * 2)
+
+    entry_size = sum(f.stat().st_size for f in _get_cache_folder("key_0").iterdir())
+
+    assert evict_cached_task_outputs(max_bytes=entry_size * 2) == 1
+    assert not _get_cache_folder("key_0").exists()
+    assert _get_cache_folder("key_1").exists()
+    assert _get_cache_folder("key_2").exists()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from plombery.logger.formatter import JsonFormatter
+from plombery.logger.web_socket_handler import WebSocketHandler
+from plombery.websocket import (
+    get_pipeline_room,
+    get_run_room,
+    has_subscribers,
+    sio,
+    subscribe,
+    unsubscribe,
+)
+
+
+@pytest.fixture
+def clients(event_loop):
+    sids = [
+        event_loop.run_until_complete(sio.manager.connect(f"eio-{i}", "/"))
+        for i in range(2)
+    ]
+    yield sids
+
+    for sid in sids:
+        sio.manager.basic_disconnect(sid, "/")
+
+
+@pytest.mark.asyncio
+async def test_subscribe_to_rooms(clients):
+    client_1, client_2 = clients
+
+    assert not has_subscribers(get_run_room(1), get_pipeline_room("pipeline"))
+
+    assert await subscribe(client_1, get_run_room(1))
+    assert await subscribe(client_2, get_run_room(1))
+    assert has_subscribers(get_run_room(1))
+    assert has_subscribers(get_pipeline_room("pipeline"), get_run_room(1))
+    assert not has_subscribers(get_run_room(2))
+
+    assert await unsubscribe(client_1, get_run_room(1))
+    assert has_subscribers(get_run_room(1))
+
+    assert await unsubscribe(client_2, get_run_room(1))
+    assert not has_subscribers(get_run_room(1))
+
+
+@pytest.mark.asyncio
+async def test_subscribe_to_invalid_rooms(clients):
+    client_1, client_2 = clients
+
+    # Clients can't join the private room of another client
+    assert not await subscribe(client_1, client_2)
+    assert not await subscribe(client_1, "run:abc")
+    assert not await subscribe(client_1, None)
+
+    assert not has_subscribers("run:abc")
+
+
+@pytest.fixture
+def sent_messages(monkeypatch: pytest.MonkeyPatch):
+    messages = []
+
+    async def emit(event, data, to=None):
+        messages.append((event, data, to))
+
+    monkeypatch.setattr(sio, "emit", emit)
+    yield messages
+
+
+@pytest.mark.asyncio
+async def test_websocket_handler_sends_batches(clients, sent_messages, make_log_record):
+    handler = WebSocketHandler(batch_size=3, batch_interval=0.05)
+    handler.setFormatter(JsonFormatter())
+    handler.start()
+
+    await subscribe(clients[0], get_run_room(1))
+
+    # Records are emitted by the tasks threads
+    thread = threading.Thread(
+        target=lambda: [
+            handler.emit(make_log_record(f"log {i}", run_id=1)) for i in range(4)
+        ]
+    )
+    thread.start()
+    thread.join()
+
+    # Nobody is watching this run
+    handler.emit(make_log_record("not sent", run_id=2))
+
+    await asyncio.sleep(0.2)
+
+    assert [(event, to) for event, _, to in sent_messages] == [
+        ("logs.1", "run:1"),
+        ("logs.1", "run:1"),
+    ]
+    assert [
+        [json.loads(line)["message"] for line in data.splitlines()]
+        for _, data, _ in sent_messages
+    ] == [["log 0", "log 1", "log 2"], ["log 3"]]
+    assert handler.sent_messages == 2
+    assert handler.sent_records == 4
+    assert handler.dropped_records == 0
+
+    handler.stop()
+
+
+@pytest.mark.asyncio
+async def test_websocket_handler_drops_records_when_full(
+    clients, sent_messages, make_log_record
+):
+    handler = WebSocketHandler(max_pending=2)
+    handler.setFormatter(JsonFormatter())
+    handler.start()
+
+    await subscribe(clients[0], get_run_room(1))
+
+    # The loop is busy so the records can't be sent
+    for i in range(5):
+        handler.emit(make_log_record(f"log {i}", run_id=1))
+
+    assert handler.dropped_records == 3
+
+    await asyncio.sleep(0.2)
+
+    assert handler.sent_records == 2
+
+    handler.stop()
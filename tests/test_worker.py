@@ -0,0 +1,115 @@
+from asyncio import sleep
+from datetime import timedelta
+
+import pytest
+
+from plombery import task, Pipeline
+from plombery.config import settings
+from plombery.database.operations import setup_database
+from plombery.database.repository import (
+    cancel_pipeline_run,
+    claim_pipeline_run,
+    get_pipeline_run,
+    release_expired_pipeline_runs,
+    update_pipeline_run,
+)
+from plombery.orchestrator import orchestrator, run_pipeline_now
+from plombery.orchestrator.dispatcher import dispatcher
+from plombery.orchestrator.executor import utcnow
+from plombery.orchestrator.worker import Worker
+from plombery.schemas import PipelineRunStatus
+
+
+@task
+async def slow_task():
+    await sleep(0.3)
+
+
+def test_runs_are_claimed_once(create_run):
+    setup_database()
+
+    first_run = create_run("claimed")
+    second_run = create_run("claimed")
+    create_run("other")
+
+    lease = utcnow() + timedelta(seconds=30)
+
+    claimed = claim_pipeline_run("worker-1", lease, pipeline_ids=["claimed"])
+    assert claimed.id == first_run.id
+    assert claimed.worker_id == "worker-1"
+
+    claimed = claim_pipeline_run("worker-2", lease, pipeline_ids=["claimed"])
+    assert claimed.id == second_run.id
+
+    assert claim_pipeline_run("worker-1", lease, pipeline_ids=["claimed"]) is None
+
+
+def test_expired_leases_are_released(create_run):
+    setup_database()
+
+    pending_run = create_run("expired")
+    running_run = create_run("expired")
+
+    expired_lease = utcnow() - timedelta(seconds=1)
+    claim_pipeline_run("dead-worker", expired_lease, pipeline_ids=["expired"])
+    claim_pipeline_run("dead-worker", expired_lease, pipeline_ids=["expired"])
+    update_pipeline_run(running_run, utcnow(), PipelineRunStatus.RUNNING)
+
+    release_expired_pipeline_runs(utcnow())
+
+    pending_run = get_pipeline_run(pending_run.id)
+    assert pending_run.status == PipelineRunStatus.PENDING
+    assert pending_run.worker_id is None
+    assert get_pipeline_run(running_run.id).status == PipelineRunStatus.CANCELLED
+
+
+@pytest.mark.asyncio
+async def test_worker_executes_queued_runs(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+    monkeypatch.setattr(settings, "execution_mode", "workers")
+
+    pipeline = Pipeline(id="worker_pipeline", tasks=[slow_task])
+    orchestrator.register_pipeline(pipeline)
+
+    pipeline_run = await run_pipeline_now(pipeline)
+    await sleep(0.1)
+
+    # The web server only queues the run
+    assert get_pipeline_run(pipeline_run.id).status == PipelineRunStatus.PENDING
+
+    worker = Worker(worker_id="test-worker")
+    await worker.poll()
+    await sleep(0.1)
+
+    pipeline_run = get_pipeline_run(pipeline_run.id)
+    assert pipeline_run.status == PipelineRunStatus.RUNNING
+    assert pipeline_run.worker_id == "test-worker"
+
+    await sleep(0.4)
+
+    assert get_pipeline_run(pipeline_run.id).status == PipelineRunStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_worker_stops_cancelled_runs(monkeypatch: pytest.MonkeyPatch):
+    setup_database()
+    monkeypatch.setattr(settings, "execution_mode", "workers")
+
+    pipeline = Pipeline(id="cancelled_pipeline", tasks=[slow_task])
+    orchestrator.register_pipeline(pipeline)
+
+    pipeline_run = await run_pipeline_now(pipeline)
+
+    worker = Worker(worker_id="test-worker")
+    await worker.poll()
+    await sleep(0.1)
+
+    # The web server can only update the DB
+    assert cancel_pipeline_run(pipeline_run.id)
+
+    # The worker notices it at the next heartbeat
+    await worker.poll()
+    await sleep(0.1)
+
+    assert pipeline_run.id not in dispatcher.active_run_ids
+    assert get_pipeline_run(pipeline_run.id).status == PipelineRunStatus.CANCELLED